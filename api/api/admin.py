@@ -1,3 +1,303 @@
-from django.contrib import admin
+"""
+Admin of the api models, usable on tables of tens of millions of rows:
+- changelists are counted with the row estimate of Postgres (EstimatedCountPaginator) and never run the
+  unfiltered count of show_full_result_count
+- foreign keys and many to many fields use raw id widgets instead of selects listing every gene or transcript,
+  the relations shown in the lists are joined (list_select_related)
+- searches only use indexed lookups: "=field" is an UPPER() match of the case insensitive indexes and
+  "field__exact" an exact match of the unique and indexed columns
+- sorting is limited to indexed columns (sortable_by)
+"""
+from django.conf import settings
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import OperationalError, connection, transaction
+from django.utils.functional import cached_property
 
-# Register your models here.
+from api import annovar_scores, models, response_cache, stats, variant_keys
+from api.views import PAYLOAD_BUILDERS
+
+
+def _estimated_rows(model):
+    """Row estimate of the Postgres statistics, None when the table was never analyzed."""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [model._meta.db_table])
+        row = cursor.fetchone()
+    if row is None or row[0] < 0:
+        return None
+    return row[0]
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator of the changelists which does not COUNT(*) large tables.
+
+    Unfiltered querysets of tables above ADMIN_ESTIMATED_COUNT_MIN_ROWS rows are counted with the estimate of
+    pg_class.reltuples. Other querysets are counted under a statement timeout of ADMIN_COUNT_TIMEOUT_MS, and
+    fall back to the estimate of the whole table when the count is cancelled.
+    """
+
+    @cached_property
+    def count(self):
+        if connection.vendor != 'postgresql':
+            return super().count
+        query = self.object_list.query
+        estimate = _estimated_rows(self.object_list.model)
+        if estimate is not None and estimate >= settings.ADMIN_ESTIMATED_COUNT_MIN_ROWS \
+                and not query.where and not query.distinct:
+            return estimate
+        try:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL statement_timeout = %s', [settings.ADMIN_COUNT_TIMEOUT_MS])
+                return self.object_list.count()
+        except OperationalError:
+            # Pages past the actual results are empty.
+            return estimate or 0
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+    sortable_by = ()
+
+
+class ReadOnlyAdmin(LargeTableAdmin):
+    """Admin of the tables maintained by the API itself (stats, import and access bookkeeping)."""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+class StatsDeferredDeleteMixin:
+    """Refreshes the stats of the genes and amino acid changes of deleted objects once per object rather than
+    once per deleted row (see api.stats.deferred)."""
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic(), stats.deferred():
+            super().delete_queryset(request, queryset)
+
+
+def _warm(modeladmin, request, kind, keys):
+    results = {}
+    for key in keys:
+        result = response_cache.warm_payload(kind, key, PAYLOAD_BUILDERS[kind])
+        results[result] = results.get(result, 0) + 1
+    modeladmin.message_user(request, f"Cached payloads: {results}", messages.SUCCESS)
+
+
+@admin.register(models.DiagnosisCategory)
+class DiagnosisCategoryAdmin(admin.ModelAdmin):
+    list_display = ('name', 'description')
+    search_fields = ('name',)
+
+
+@admin.register(models.Diagnosis)
+class DiagnosisAdmin(admin.ModelAdmin):
+    list_display = ('name', 'display_name', 'category')
+    list_select_related = ('category',)
+    list_filter = ('category',)
+    search_fields = ('name', 'display_name')
+
+
+@admin.register(models.Genes)
+class GenesAdmin(LargeTableAdmin):
+    list_display = ('approved_symbol', 'hgnc_gene_id', 'approved_name', 'chromosome', 'locus_type', 'status')
+    search_fields = ('=approved_symbol', '=ensembl_gene_id')
+    sortable_by = ('hgnc_gene_id',)
+    readonly_fields = ('api_key',)
+    actions = ('refresh_stats', 'warm_cache')
+
+    @admin.action(description="Recompute the statistics of the selected genes")
+    def refresh_stats(self, request, queryset):
+        refreshed = stats.refresh_genes(list(queryset.values_list('id', flat=True)))
+        self.message_user(request, f"Refreshed the statistics of {len(refreshed)} genes.", messages.SUCCESS)
+
+    @admin.action(description="Cache the payloads of the selected genes")
+    def warm_cache(self, request, queryset):
+        _warm(self, request, 'gene', queryset.exclude(approved_symbol=None).values_list('approved_symbol', flat=True))
+
+
+@admin.register(models.GeneAnnotation)
+class GeneAnnotationAdmin(StatsDeferredDeleteMixin, LargeTableAdmin):
+    list_display = ('gene', 'annotation', 'priority', 'diagnosis', 'user', 'creation_timestamp')
+    list_select_related = ('gene', 'diagnosis', 'user')
+    list_filter = ('diagnosis',)
+    raw_id_fields = ('gene',)
+    autocomplete_fields = ('user',)
+    search_fields = ('=gene__approved_symbol',)
+
+
+@admin.register(models.Transcript)
+class TranscriptAdmin(LargeTableAdmin):
+    list_display = ('ensembl_transcript_id', 'transcript_support_level', 'transcript_length', 'refseq_match')
+    search_fields = ('=ensembl_transcript_id',)
+    sortable_by = ('ensembl_transcript_id',)
+
+
+class TranscriptChildAdmin(LargeTableAdmin):
+    list_select_related = ('transcript',)
+    raw_id_fields = ('transcript',)
+
+
+@admin.register(models.EnsemblPeptide)
+class EnsemblPeptideAdmin(TranscriptChildAdmin):
+    list_display = ('peptide_id', 'hgvsp_id', 'canonical', 'transcript')
+    search_fields = ('peptide_id__exact',)
+
+
+@admin.register(models.EnsemblHGVSC)
+class EnsemblHGVSCAdmin(TranscriptChildAdmin):
+    list_display = ('hgvsc_id', 'transcript')
+    search_fields = ('hgvsc_id__exact',)
+
+
+@admin.register(models.RefSeqTranscript)
+class RefSeqTranscriptAdmin(TranscriptChildAdmin):
+    list_display = ('refseq_transcript_id', 'transcript_type', 'transcript')
+    search_fields = ('refseq_transcript_id__exact',)
+
+
+@admin.register(models.RefSeqHGVSC)
+class RefSeqHGVSCAdmin(TranscriptChildAdmin):
+    list_display = ('hgvsc_id', 'transcript_type', 'transcript')
+    search_fields = ('hgvsc_id__exact',)
+
+
+@admin.register(models.RefSeqPeptide)
+class RefSeqPeptideAdmin(TranscriptChildAdmin):
+    list_display = ('peptide_id', 'hgvsp_id', 'transcript')
+    search_fields = ('peptide_id__exact',)
+
+
+@admin.register(models.LRGTranscript)
+class LRGTranscriptAdmin(TranscriptChildAdmin):
+    list_display = ('lrg_transcript_id', 'transcript')
+    search_fields = ('lrg_transcript_id__exact',)
+
+
+@admin.register(models.LRGHGVSC)
+class LRGHGVSCAdmin(TranscriptChildAdmin):
+    list_display = ('hgvsc_id', 'transcript')
+    search_fields = ('hgvsc_id__exact',)
+
+
+@admin.register(models.LRGPeptide)
+class LRGPeptideAdmin(TranscriptChildAdmin):
+    list_display = ('peptide_id', 'hgvsp_id', 'transcript')
+    search_fields = ('peptide_id__exact',)
+
+
+@admin.register(models.AminoAcidChange)
+class AminoAcidChangeAdmin(LargeTableAdmin):
+    list_display = ('short_name', 'long_name')
+    raw_id_fields = ('transcripts', 'genes')
+    search_fields = ('=short_name', 'long_name__exact')
+    sortable_by = ('long_name',)
+    actions = ('refresh_stats', 'warm_cache')
+
+    @admin.action(description="Recompute the statistics of the selected amino acid changes")
+    def refresh_stats(self, request, queryset):
+        refreshed = stats.refresh_aa_changes(list(queryset.values_list('id', flat=True)))
+        self.message_user(request, f"Refreshed the statistics of {len(refreshed)} amino acid changes.", messages.SUCCESS)
+
+    @admin.action(description="Cache the payloads of the selected amino acid changes")
+    def warm_cache(self, request, queryset):
+        _warm(self, request, 'aa_change', set(queryset.values_list('short_name', flat=True)))
+
+
+@admin.register(models.AminoAcidAnnotations)
+class AminoAcidAnnotationsAdmin(StatsDeferredDeleteMixin, LargeTableAdmin):
+    list_display = ('amino_acid', 'gene', 'annotation', 'priority', 'diagnosis', 'user', 'creation_timestamp')
+    list_select_related = ('amino_acid', 'gene', 'diagnosis', 'user')
+    list_filter = ('diagnosis',)
+    raw_id_fields = ('amino_acid', 'gene')
+    autocomplete_fields = ('user',)
+    search_fields = ('=amino_acid__short_name',)
+
+
+@admin.register(models.Variants)
+class VariantsAdmin(StatsDeferredDeleteMixin, LargeTableAdmin):
+    list_display = ('chrom_pos_ref_alt', 'alt_chrom_pos_ref_alt', 'gene', 'hgvsg_id', 'creation_timestamp')
+    list_select_related = ('gene',)
+    raw_id_fields = ('gene', 'transcripts')
+    search_fields = ('chrom_pos_ref_alt__exact', 'alt_chrom_pos_ref_alt__exact', 'md5sum__exact', '=hgvsg_id')
+    sortable_by = ('chrom_pos_ref_alt', 'creation_timestamp')
+    actions = ('warm_cache',)
+
+    @admin.action(description="Cache the payloads of the selected variants")
+    def warm_cache(self, request, queryset):
+        cpras = queryset.values_list('chrom_pos_ref_alt', flat=True)
+        _warm(self, request, 'variant', {variant_keys.try_normalize_cpra(cpra) or cpra for cpra in cpras})
+
+
+@admin.register(models.VariantKey)
+class VariantKeyAdmin(LargeTableAdmin):
+    list_display = ('key', 'assembly', 'variant')
+    list_select_related = ('variant',)
+    list_filter = ('assembly',)
+    raw_id_fields = ('variant',)
+    search_fields = ('key__exact',)
+
+
+@admin.register(models.AnnovarData)
+class AnnovarDataAdmin(StatsDeferredDeleteMixin, LargeTableAdmin):
+    list_display = ('variant', 'func_ref_gene', 'gene_ref_gene', 'exonic_func_ref_gene', 'aa_change_ref_gene')
+    list_select_related = ('variant',)
+    raw_id_fields = ('variant',)
+    search_fields = ('variant__chrom_pos_ref_alt__exact',)
+    actions = ('rebuild_scores',)
+
+    @admin.action(description="Rebuild the typed scores of the selected Annovar rows")
+    def rebuild_scores(self, request, queryset):
+        records = list(queryset)
+        annovar_scores.save_scores(records)
+        self.message_user(request, f"Rebuilt the scores of {len(records)} Annovar rows.", messages.SUCCESS)
+
+
+@admin.register(models.AnnovarScores)
+class AnnovarScoresAdmin(ReadOnlyAdmin):
+    list_display = ('annovar', 'cadd_phred', 'revel_score', 'sift_score', 'polyphen_2_hdiv_score',
+                    'gnomad_exome_af_popmax', 'gnomad_genome_af')
+    raw_id_fields = ('annovar',)
+    sortable_by = ('cadd_phred', 'revel_score', 'sift_score', 'polyphen_2_hdiv_score',
+                   'gnomad_exome_af_popmax', 'gnomad_genome_af')
+
+
+@admin.register(models.IdentifierIndex)
+class IdentifierIndexAdmin(ReadOnlyAdmin):
+    list_display = ('identifier', 'source', 'variant', 'transcript', 'aa_change')
+    list_select_related = ('variant', 'transcript', 'aa_change')
+    raw_id_fields = ('variant', 'transcript', 'aa_change')
+    search_fields = ('identifier__exact',)
+
+
+@admin.register(models.ImportedRecord)
+class ImportedRecordAdmin(ReadOnlyAdmin):
+    list_display = ('source', 'key', 'object_id', 'content_hash', 'imported')
+
+
+@admin.register(models.GeneStats)
+class GeneStatsAdmin(ReadOnlyAdmin):
+    list_display = ('gene', 'variant_count', 'annotation_count', 'aa_change_count', 'aa_annotation_count', 'updated')
+    list_select_related = ('gene',)
+    raw_id_fields = ('gene',)
+    search_fields = ('=gene__approved_symbol',)
+
+
+@admin.register(models.AAChangeStats)
+class AAChangeStatsAdmin(ReadOnlyAdmin):
+    list_display = ('aa_change', 'annotation_count', 'gene_count', 'transcript_count', 'updated')
+    list_select_related = ('aa_change',)
+    raw_id_fields = ('aa_change',)
+    search_fields = ('=aa_change__short_name',)
+
+
+@admin.register(models.AccessCount)
+class AccessCountAdmin(ReadOnlyAdmin):
+    list_display = ('kind', 'key', 'count', 'last_access')
+    # Follows access_count_top_idx.
+    ordering = ('kind', '-count')
@@ -0,0 +1,212 @@
+"""
+Bulk creation of gene and amino acid change annotations (the /api/annotations/bulk/ endpoint),
+and the diagnosis and priority filters of the annotations returned by the other endpoints.
+
+Items are validated together: the genes, amino acid changes and diagnosis categories they reference are
+resolved with one query per table, then the valid items are written with bulk_create in one transaction.
+
+Item format:
+    {"type": "gene", "gene": "BRAF", "annotation": "...", "priority": 1, "diagnosis": "<diagnosis category>"}
+    {"type": "aa_change", "gene": "BRAF", "aa_change": "V600E", "annotation": "...", "priority": 1}
+
+aa_change is the short name of a change of the gene, or its long name (e.g. ENSP00000288602.6:p.Val600Glu).
+priority defaults to 0, diagnosis is optional.
+"""
+from django.db import transaction
+
+from api import models, response_cache, stats
+
+ANNOTATION_TYPES = ('gene', 'aa_change')
+MAX_BULK_ANNOTATIONS = 50000
+DEFAULT_BATCH_SIZE = 2000
+
+# Fields identifying an annotation: identical annotations are not created twice.
+GENE_ANNOTATION_KEY = ('gene_id', 'annotation', 'diagnosis_id')
+AA_ANNOTATION_KEY = ('gene_id', 'amino_acid_id', 'annotation', 'diagnosis_id')
+
+
+def _text(item, field, errors, required=True):
+    value = item.get(field)
+    if value is None or value == '':
+        if required:
+            errors.append(f"{field} is required.")
+        return None
+    if not isinstance(value, str):
+        errors.append(f"{field} must be a string.")
+        return None
+    return value.strip()
+
+
+def check_items(items):
+    """Checks the format of the items. Returns the cleaned items, None for the invalid ones, and their errors."""
+    cleaned = []
+    item_errors = []
+    for item in items:
+        errors = []
+        if not isinstance(item, dict):
+            cleaned.append(None)
+            item_errors.append(["Annotations must be objects."])
+            continue
+        annotation_type = item.get('type', 'gene')
+        if annotation_type not in ANNOTATION_TYPES:
+            errors.append("type must be one of %s." % ", ".join(ANNOTATION_TYPES))
+        priority = item.get('priority', 0)
+        if isinstance(priority, bool) or not isinstance(priority, int):
+            errors.append("priority must be an integer.")
+        values = {
+            'type': annotation_type,
+            'gene': _text(item, 'gene', errors),
+            'aa_change': _text(item, 'aa_change', errors, required=annotation_type == 'aa_change'),
+            'annotation': _text(item, 'annotation', errors),
+            'diagnosis': _text(item, 'diagnosis', errors, required=False),
+            'priority': priority,
+        }
+        cleaned.append(None if errors else values)
+        item_errors.append(errors)
+    return cleaned, item_errors
+
+
+def _lookups(items):
+    """Resolves the genes, amino acid changes (by short name within a gene, or by long name) and diagnosis
+    categories of the items, with one query each."""
+    symbols = {item['gene'] for item in items}
+    genes = dict(models.Genes.objects.filter(approved_symbol__in=symbols).values_list('approved_symbol', 'id'))
+    names = {item['aa_change'] for item in items if item['type'] == 'aa_change'}
+    aa_changes = {}
+    long_names = {}
+    if names:
+        aa_changes = {
+            (gene_id, short_name): aa_change_id for gene_id, short_name, aa_change_id in
+            models.AminoAcidChange.objects.filter(genes__id__in=list(genes.values()), short_name__in=names).values_list(
+                'genes__id', 'short_name', 'id'
+            )
+        }
+        # A long name identifies the change whatever the gene.
+        long_names = dict(models.AminoAcidChange.objects.filter(long_name__in=names).values_list('long_name', 'id'))
+    diagnosis_names = {item['diagnosis'] for item in items if item['diagnosis']}
+    diagnoses = dict(models.DiagnosisCategory.objects.filter(name__in=diagnosis_names).values_list('name', 'id'))
+    return genes, aa_changes, long_names, diagnoses
+
+
+def build_annotations(items, item_errors, user=None):
+    """Builds the annotation objects of the checked items, adding the errors of unknown references.
+    Returns a list of (index, annotation) of the valid items."""
+    valid = [item for item in items if item]
+    genes, aa_changes, long_names, diagnoses = _lookups(valid) if valid else ({}, {}, {}, {})
+    # The id rather than request.user, a lazy object each annotation would go through when saved.
+    user_id = user.pk if user is not None else None
+    annotations = []
+    for index, item in enumerate(items):
+        if not item:
+            continue
+        errors = item_errors[index]
+        gene_id = genes.get(item['gene'])
+        if gene_id is None:
+            errors.append(f"Gene {item['gene']} does not exist.")
+        diagnosis_id = None
+        if item['diagnosis']:
+            diagnosis_id = diagnoses.get(item['diagnosis'])
+            if diagnosis_id is None:
+                errors.append(f"Diagnosis category {item['diagnosis']} does not exist.")
+        aa_change_id = None
+        if item['type'] == 'aa_change':
+            aa_change_id = aa_changes.get((gene_id, item['aa_change'])) or long_names.get(item['aa_change'])
+            if aa_change_id is None:
+                errors.append(f"Amino acid change {item['aa_change']} of gene {item['gene']} does not exist.")
+        if errors:
+            continue
+        fields = {'gene_id': gene_id, 'annotation': item['annotation'], 'priority': item['priority'],
+                  'diagnosis_id': diagnosis_id, 'user_id': user_id}
+        if item['type'] == 'gene':
+            annotations.append((index, models.GeneAnnotation(**fields)))
+        else:
+            annotations.append((index, models.AminoAcidAnnotations(amino_acid_id=aa_change_id, **fields)))
+    return annotations
+
+
+def _existing_keys(model, annotations, key_fields):
+    """{key: id} of the annotations which already exist, with one query."""
+    if not annotations:
+        return {}
+    gene_ids = {annotation.gene_id for annotation in annotations}
+    texts = {annotation.annotation for annotation in annotations}
+    rows = model.objects.filter(gene_id__in=gene_ids, annotation__in=texts).values_list('id', *key_fields)
+    return {tuple(row[1:]): row[0] for row in rows}
+
+
+def create_annotations(items, user=None, atomic=False, batch_size=DEFAULT_BATCH_SIZE):
+    """Validates and creates annotations. Returns one result per item:
+    {"index", "status": "created" | "exists" | "invalid" | "skipped", "id", "errors"}.
+
+    Annotations identical to an existing one (same gene, amino acid change, text and diagnosis) are not
+    created again, so that a batch can be retried. When atomic is set, nothing is created if an item is invalid.
+    """
+    checked, item_errors = check_items(items)
+    annotations = build_annotations(checked, item_errors, user)
+    results = [{'index': index, 'status': 'invalid', 'id': None, 'errors': errors}
+               for index, errors in enumerate(item_errors)]
+    if atomic and any(item_errors):
+        for index, annotation in annotations:
+            results[index]['status'] = 'skipped'
+        return results
+
+    gene_annotations = [(index, x) for index, x in annotations if isinstance(x, models.GeneAnnotation)]
+    aa_annotations = [(index, x) for index, x in annotations if isinstance(x, models.AminoAcidAnnotations)]
+    with transaction.atomic(), stats.deferred():
+        for model, model_annotations, key_fields in (
+            (models.GeneAnnotation, gene_annotations, GENE_ANNOTATION_KEY),
+            (models.AminoAcidAnnotations, aa_annotations, AA_ANNOTATION_KEY),
+        ):
+            existing = _existing_keys(model, [x for index, x in model_annotations], key_fields)
+            new = []
+            for index, annotation in model_annotations:
+                key = tuple(getattr(annotation, field) for field in key_fields)
+                if key in existing:
+                    results[index]['status'] = 'exists'
+                    continue
+                # Duplicates within the batch are created once.
+                existing[key] = None
+                new.append((index, annotation))
+            model.objects.bulk_create([annotation for index, annotation in new], batch_size=batch_size)
+            for index, annotation in new:
+                results[index]['status'] = 'created'
+                results[index]['id'] = annotation.pk
+        # bulk_create does not send the signals updating the stats and cached payloads.
+        response_cache.bump_data_version()
+        stats.mark_genes({annotation.gene_id for index, annotation in annotations})
+        stats.mark_aa_changes({annotation.amino_acid_id for index, annotation in aa_annotations})
+    return results
+
+
+def annotation_filters(params):
+    """Lookups on GeneAnnotation and AminoAcidAnnotations of the query parameters:
+        diagnosis: diagnosis category name or id, "none" for the annotations without diagnosis.
+        min_priority, max_priority: bounds of the priority.
+    Returns {} when the request has none of them. Raises ValueError for invalid values.
+    """
+    filters = {}
+    diagnosis = params.get('diagnosis')
+    if diagnosis:
+        if diagnosis.lower() == 'none':
+            filters['diagnosis_id__isnull'] = True
+        elif diagnosis.isdigit():
+            filters['diagnosis_id'] = int(diagnosis)
+        else:
+            # Resolved beforehand, so that the annotation queries only use the (gene or amino_acid, diagnosis,
+            # priority) indexes. An unknown name matches nothing.
+            filters['diagnosis_id__in'] = list(
+                models.DiagnosisCategory.objects.filter(name=diagnosis).values_list('id', flat=True)
+            )
+    for param, lookup in (('min_priority', 'priority__gte'), ('max_priority', 'priority__lte')):
+        value = params.get(param)
+        if value not in (None, ''):
+            try:
+                filters[lookup] = int(value)
+            except ValueError:
+                raise ValueError(f"{param} must be an integer.")
+    return filters
+
+
+def annotation_queryset(model, filters=None):
+    """Annotations matching annotation_filters(), by priority."""
+    return model.objects.filter(**(filters or {})).order_by('priority', 'id')
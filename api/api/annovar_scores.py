@@ -0,0 +1,177 @@
+"""
+Typed copies of the Annovar scores (AnnovarScores), parsed from the text columns of AnnovarData.
+
+AnnovarData keeps the values exactly as imported ("." for missing values, sometimes several ";" separated
+values), which the API returns and exports unchanged. AnnovarScores holds one float per score and a one letter code per prediction, so that variants can
+be filtered by range (?score=cadd_phred>20) with the indexes of the scores table. The rows are written by
+api.signals when an AnnovarData row is saved, and rebuilt in batches by the rebuild_annovar_scores
+management command.
+
+With settings.ANNOVAR_PACKED_SCORES, the scores are also stored as one float32 array (in SCORE_FIELDS order,
+NaN for missing values) for clients reading all the scores of many variants.
+"""
+import math
+import re
+from array import array
+from itertools import islice
+
+from django.conf import settings
+
+SCORE_FIELDS = (
+    'ex_ac_all', 'gnomad_exome_af_popmax', 'gnomad_genome_af',
+    'sift_score', 'sift_converted_rankscore',
+    'polyphen_2_hdiv_score', 'polyphen_2_hdiv_rankscore',
+    'polyphen_2_hvar_score', 'polyphen_2_hvar_rankscore',
+    'lrt_score', 'lrt_converted_rankscore',
+    'mutation_taster_score', 'mutation_taster_converted_rankscore',
+    'mutation_assessor_score', 'mutation_assessor_score_rankscore',
+    'fathmm_score', 'fathmm_converted_rankscore',
+    'provean_score', 'provean_converted_rankscore',
+    'vest_3_score', 'vest_3_rankscore',
+    'meta_svm_score', 'meta_svm_rankscore',
+    'meta_lr_score', 'meta_lr_rankscore',
+    'm_cap_score', 'm_cap_rankscore',
+    'revel_score', 'revel_rankscore',
+    'mut_pred_score', 'mut_pred_rankscore',
+    'cadd_raw', 'cadd_raw_rankscore', 'cadd_phred',
+    'dann_score', 'dann_rankscore',
+    'fathmm_mkl_coding_score', 'fathmm_mkl_coding_rankscore',
+    'eigen_raw', 'eigen_pc_raw',
+    'geno_canyon_score', 'geno_canyon_score_rankscore',
+    'integrated_fit_cons_score', 'integrated_fit_cons_score_rankscore', 'integrated_confidence_value',
+    'gerp_rs', 'gerp_rs_rankscore',
+    'phylo_p_100_way_vertebrate', 'phylo_p_100_way_vertebrate_rankscore',
+    'phylo_p_20_way_mammalian', 'phylo_p_20_way_mammalian_rankscore',
+    'phast_cons_100_way_vertebrate', 'phast_cons_100_way_vertebrate_rankscore',
+    'phast_cons_20_way_mammalian', 'phast_cons_20_way_mammalian_rankscore',
+    'si_phy_29_way_log_odds', 'si_phy_29_way_log_odds_rankscore',
+)
+
+PRED_FIELDS = (
+    'sift_pred', 'polyphen_2_hdiv_pred', 'polyphen_2_hvar_pred', 'lrt_pred', 'mutation_taster_pred',
+    'mutation_assessor_pred', 'fathmm_pred', 'provean_pred', 'meta_svm_pred', 'meta_lr_pred', 'm_cap_pred',
+    'fathmm_mkl_coding_pred',
+)
+
+# dbNSFP prediction codes. Their meaning depends on the predictor, e.g. "P" is "possibly damaging" for
+# PolyPhen-2 and "polymorphism automatic" for MutationTaster.
+PRED_CHOICES = (
+    ('A', 'Disease causing automatic'),
+    ('B', 'Benign'),
+    ('D', 'Damaging'),
+    ('H', 'High'),
+    ('L', 'Low'),
+    ('M', 'Medium'),
+    ('N', 'Neutral'),
+    ('P', 'Possibly damaging or polymorphism automatic'),
+    ('T', 'Tolerated'),
+    ('U', 'Unknown'),
+)
+PRED_CODES = frozenset(code for code, label in PRED_CHOICES)
+
+DEFAULT_BATCH_SIZE = 2000
+
+_SCORE_FILTER_RE = re.compile(r'^\s*(\w+)\s*(<=|>=|<|>|=)\s*(\S+)\s*$')
+_SCORE_LOOKUPS = {'<': 'lt', '<=': 'lte', '>': 'gt', '>=': 'gte', '=': 'exact'}
+
+
+def parse_score(value):
+    """Float of an Annovar value, None when missing. The first number is kept when the value holds several."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return None if math.isnan(value) else float(value)
+    for part in re.split(r'[;,|]', str(value)):
+        try:
+            number = float(part)
+        except ValueError:
+            continue
+        if not math.isnan(number):
+            return number
+    return None
+
+
+def parse_pred(value):
+    """One letter prediction code of an Annovar value, None when missing or unknown."""
+    if not isinstance(value, str):
+        return None
+    for part in re.split(r'[;,|]', value):
+        part = part.strip().upper()
+        if part in PRED_CODES:
+            return part
+    return None
+
+
+def pack_scores(scores):
+    return array('f', [math.nan if scores[field] is None else scores[field] for field in SCORE_FIELDS]).tobytes()
+
+
+def unpack_scores(packed):
+    """{score field: float or None} of a packed array."""
+    values = array('f')
+    values.frombytes(bytes(packed))
+    return {field: None if math.isnan(value) else value for field, value in zip(SCORE_FIELDS, values)}
+
+
+def scores_of(annovar_record):
+    """AnnovarScores field values of an AnnovarData row."""
+    values = {field: parse_score(getattr(annovar_record, field)) for field in SCORE_FIELDS}
+    if getattr(settings, 'ANNOVAR_PACKED_SCORES', False):
+        values['packed'] = pack_scores(values)
+    else:
+        values['packed'] = None
+    values.update({field: parse_pred(getattr(annovar_record, field)) for field in PRED_FIELDS})
+    return values
+
+
+def build_scores(annovar_records):
+    from api.models import AnnovarScores
+    return [AnnovarScores(annovar_id=record.pk, **scores_of(record)) for record in annovar_records]
+
+
+def save_scores(annovar_records):
+    """Writes the AnnovarScores rows of AnnovarData rows."""
+    from api.models import AnnovarScores
+    fields = SCORE_FIELDS + PRED_FIELDS + ('packed',)
+    AnnovarScores.objects.bulk_create(build_scores(annovar_records), update_conflicts=True,
+                                      unique_fields=['annovar'], update_fields=fields)
+
+
+def rebuild(batch_size=DEFAULT_BATCH_SIZE):
+    """Rewrites the scores of all AnnovarData rows in batches. Returns the number of rows."""
+    from api.models import AnnovarData
+    rows = AnnovarData.objects.order_by('id').only('id', *SCORE_FIELDS, *PRED_FIELDS).iterator(chunk_size=batch_size)
+    count = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return count
+        save_scores(batch)
+        count += len(batch)
+
+
+def score_filters(values):
+    """Lookups on AnnovarScores of "<score><op><number>" conditions (op is <, <=, >, >= or =) and of
+    "<pred>=<code>" conditions, e.g. ["cadd_phred>20", "sift_pred=D"]. Raises ValueError for invalid ones.
+    """
+    filters = {}
+    for value in values:
+        match = _SCORE_FILTER_RE.match(value)
+        if not match:
+            raise ValueError(f"Invalid score filter {value!r}, expected e.g. cadd_phred>20.")
+        field, op, operand = match.groups()
+        if field in SCORE_FIELDS:
+            try:
+                number = float(operand)
+            except ValueError:
+                raise ValueError(f"{field} must be compared to a number.")
+            if math.isnan(number):
+                raise ValueError(f"{field} must be compared to a number.")
+            filters[f'{field}__{_SCORE_LOOKUPS[op]}'] = number
+        elif field in PRED_FIELDS:
+            if op != '=' or operand.upper() not in PRED_CODES:
+                raise ValueError(f"{field} only supports = with one of {', '.join(sorted(PRED_CODES))}.")
+            filters[field] = operand.upper()
+        else:
+            raise ValueError(f"Unknown score {field!r}.")
+    return filters
@@ -0,0 +1,296 @@
+"""
+Bulk loading of per-transcript consequences, building the Variants.transcripts, AminoAcidChange.transcripts and
+AminoAcidChange.genes links (see the import_consequences management command).
+
+Two formats are parsed into Consequence records:
+- VEP tab output (--tab), the variant being identified by Uploaded_variation (a CPRA such as 7_140453136_A/T,
+  the VEP default for VCF rows without ID) and the protein change by the HGVSp of the Extra column or a column
+- Annovar tables, the variant being identified by Chr, Start, Ref and Alt and the protein changes by
+  AAChange.refGene, resolved to Ensembl transcripts through RefSeqTranscript
+
+Records are loaded in chunks, with per chunk:
+- one query resolving the variants (VariantKey), the transcripts and the genes of the records
+- amino acid changes deduplicated by long_name: one query loading the existing ones, one bulk insert of the
+  missing ones (ignore_conflicts, so that concurrent loads cannot create duplicates) and one query for their ids
+- one bulk insert (ignore_conflicts) into each of the three through tables
+
+Loads are idempotent. Variants, transcripts and genes missing from the database are counted, not created.
+"""
+import csv
+import re
+from collections import namedtuple
+from itertools import islice
+from urllib.parse import unquote
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from api import identifiers, models, response_cache, stats
+from api.normalize import VERSION_SUFFIX, normalize_cpra, normalize_identifier
+
+DEFAULT_CHUNK_SIZE = 5000
+
+FORMATS = ('vep', 'annovar')
+
+Consequence = namedtuple('Consequence', ['cpra', 'transcript', 'refseq_transcript', 'gene', 'hgnc_id', 'hgvsp'])
+
+THREE_LETTER_CODES = {
+    'Ala': 'A', 'Arg': 'R', 'Asn': 'N', 'Asp': 'D', 'Cys': 'C', 'Gln': 'Q', 'Glu': 'E', 'Gly': 'G', 'His': 'H',
+    'Ile': 'I', 'Leu': 'L', 'Lys': 'K', 'Met': 'M', 'Phe': 'F', 'Pro': 'P', 'Ser': 'S', 'Thr': 'T', 'Trp': 'W',
+    'Tyr': 'Y', 'Val': 'V', 'Sec': 'U', 'Pyl': 'O', 'Ter': '*', 'Xaa': 'X',
+}
+ONE_LETTER_CODES = {one: three for three, one in THREE_LETTER_CODES.items()}
+# Annovar writes stop codons as X.
+ONE_LETTER_CODES['X'] = 'Ter'
+
+THREE_LETTER_PATTERN = re.compile('|'.join(THREE_LETTER_CODES))
+ONE_LETTER_PATTERN = re.compile(r'[A-Z*]')
+
+
+def short_name(protein_change):
+    """One letter form of the protein change of an HGVSp notation, e.g. ENSP00000288602.6:p.Val600Glu -> V600E."""
+    change = protein_change.rpartition(':')[2]
+    if change.startswith('p.'):
+        change = change[2:]
+    change = change.strip('()')
+    return THREE_LETTER_PATTERN.sub(lambda match: THREE_LETTER_CODES[match.group()], change)
+
+
+def three_letter_change(change):
+    """Three letter form of an Annovar protein change, e.g. G12D -> Gly12Asp and E746_A750del -> Glu746_Ala750del."""
+    return ONE_LETTER_PATTERN.sub(lambda match: ONE_LETTER_CODES.get(match.group(), match.group()), change)
+
+
+def _vep_fields(header, line):
+    fields = dict(zip(header, line.rstrip('\n').split('\t')))
+    for item in fields.pop('Extra', '').split(';'):
+        key, separator, value = item.partition('=')
+        if separator:
+            fields.setdefault(key, value)
+    return {key: value for key, value in fields.items() if value not in ('', '-')}
+
+
+def parse_vep(lines):
+    """Consequence records of VEP tab output. Rows without HGVSp (non coding, intergenic...) are skipped."""
+    header = None
+    for line in lines:
+        if line.startswith('##'):
+            continue
+        if line.startswith('#'):
+            header = line[1:].rstrip('\n').split('\t')
+            continue
+        if header is None:
+            raise ValueError("The VEP output has no header line, run VEP with --tab.")
+        fields = _vep_fields(header, line)
+        if fields.get('Feature_type', 'Transcript') != 'Transcript' or 'HGVSp' not in fields:
+            continue
+        yield Consequence(
+            cpra=fields.get('Uploaded_variation'),
+            transcript=fields.get('Feature'),
+            refseq_transcript=None,
+            gene=fields.get('SYMBOL'),
+            hgnc_id=fields.get('HGNC_ID'),
+            # VEP escapes "=" (synonymous changes) as %3D.
+            hgvsp=unquote(fields['HGVSp']),
+        )
+
+
+def parse_annovar(lines, delimiter='\t'):
+    """Consequence records of the AAChange.refGene column of an Annovar table, one per transcript.
+    The HGVSp is completed from the Ensembl peptide of the transcript while loading."""
+    for row in csv.DictReader(lines, delimiter=delimiter):
+        cpra = '-'.join(row.get(column) or '-' for column in ('Chr', 'Start', 'Ref', 'Alt'))
+        for change in (row.get('AAChange.refGene') or '').split(','):
+            # GENE:TRANSCRIPT:EXON:c.CHANGE:p.CHANGE
+            parts = change.split(':')
+            if len(parts) < 5 or not parts[4].startswith('p.'):
+                continue
+            yield Consequence(
+                cpra=cpra,
+                transcript=None,
+                refseq_transcript=parts[1],
+                gene=parts[0],
+                hgnc_id=None,
+                hgvsp='p.' + three_letter_change(parts[4][2:]),
+            )
+
+
+def _normalize_cpra(cpra):
+    try:
+        return normalize_cpra(cpra) if cpra else None
+    except ValueError:
+        return None
+
+
+def _strip_version(accession):
+    return VERSION_SUFFIX.sub('', accession) if accession else None
+
+
+def _hgnc_id(hgnc_id):
+    try:
+        return int(str(hgnc_id).upper().replace('HGNC:', ''))
+    except ValueError:
+        return None
+
+
+def _with_versions(accessions):
+    """Accessions with and without their version, the tables store either."""
+    return {accession for accession in accessions if accession} | {_strip_version(accession) for accession in accessions if accession}
+
+
+def _resolve_variants(records, assembly):
+    keys = {_normalize_cpra(record.cpra) for record in records} - {None}
+    return dict(models.VariantKey.objects.filter(assembly=assembly, key__in=keys).values_list('key', 'variant_id'))
+
+
+def _transcript_ids(model, field, owner_path, source, accessions):
+    """{version-stripped accession: transcript id}. Accessions stored with another version than the one of the
+    records are found through the identifier index (see api.identifiers)."""
+    accessions = {accession for accession in accessions if accession}
+    rows = model.objects.filter(**{field + '__in': _with_versions(accessions)}).values_list(field, owner_path)
+    found = {_strip_version(accession): transcript_id for accession, transcript_id in rows}
+    missing = {
+        normalize_identifier(accession): _strip_version(accession) for accession in accessions
+        if _strip_version(accession) not in found
+    }
+    if missing:
+        rows = models.IdentifierIndex.objects.filter(source=source, identifier__in=list(missing))
+        for identifier, transcript_id in rows.values_list('identifier', 'transcript_id'):
+            found[missing[identifier]] = transcript_id
+    return found
+
+
+def _resolve_transcripts(records):
+    """({version-stripped Ensembl id: transcript id}, {version-stripped RefSeq id: transcript id},
+    {transcript id: Ensembl peptide id})"""
+    ensembl = _transcript_ids(models.Transcript, 'ensembl_transcript_id', 'id', 'transcript.ensembl_transcript_id',
+                              {record.transcript for record in records})
+    refseq = _transcript_ids(models.RefSeqTranscript, 'refseq_transcript_id', 'transcript_id',
+                             'refseq_transcript.refseq_transcript_id', {record.refseq_transcript for record in records})
+    peptides = {}
+    if refseq:
+        # The canonical peptide last, so that it is the one kept.
+        rows = models.EnsemblPeptide.objects.filter(transcript_id__in=set(refseq.values())).order_by('canonical')
+        peptides = dict(rows.values_list('transcript_id', 'peptide_id'))
+    return ensembl, refseq, peptides
+
+
+def _resolve_genes(records):
+    """({HGNC id: gene id}, {approved symbol: gene id})"""
+    hgnc_ids = {_hgnc_id(record.hgnc_id) for record in records if record.hgnc_id} - {None}
+    symbols = {record.gene for record in records if record.gene}
+    by_hgnc_id = {}
+    by_symbol = {}
+    rows = models.Genes.objects.filter(Q(hgnc_gene_id__in=hgnc_ids) | Q(approved_symbol__in=symbols))
+    for gene_id, hgnc_id, symbol in rows.values_list('id', 'hgnc_gene_id', 'approved_symbol'):
+        by_hgnc_id[hgnc_id] = gene_id
+        by_symbol[symbol] = gene_id
+    return by_hgnc_id, by_symbol
+
+
+def _aa_change_ids(names):
+    """{long name: id} of the amino acid changes of {long name: short name}, creating the missing ones.
+    Returns (ids, ids of the created changes)."""
+    ids = dict(models.AminoAcidChange.objects.filter(long_name__in=list(names)).values_list('long_name', 'id'))
+    missing = [name for name in names if name not in ids]
+    if not missing:
+        return ids, []
+    models.AminoAcidChange.objects.bulk_create(
+        [models.AminoAcidChange(long_name=name, short_name=names[name]) for name in missing], ignore_conflicts=True,
+    )
+    # ignore_conflicts does not return the ids.
+    created = dict(models.AminoAcidChange.objects.filter(long_name__in=missing).values_list('long_name', 'id'))
+    ids.update(created)
+    return ids, list(created.values())
+
+
+def _link(model, field_name, pairs):
+    """Inserts (source id, target id) pairs into the through table of a many to many field, skipping the
+    existing links."""
+    field = model._meta.get_field(field_name)
+    through = field.remote_field.through
+    source, target = field.m2m_field_name() + '_id', field.m2m_reverse_field_name() + '_id'
+    through.objects.bulk_create([through(**{source: a, target: b}) for a, b in pairs], ignore_conflicts=True)
+
+
+def load_chunk(records, assembly, counts):
+    """Loads a list of Consequence records, adding to counts."""
+    variants = _resolve_variants(records, assembly)
+    ensembl, refseq, peptides = _resolve_transcripts(records)
+    genes_by_hgnc_id, genes_by_symbol = _resolve_genes(records)
+
+    resolved = []
+    for record in records:
+        variant_id = variants.get(_normalize_cpra(record.cpra))
+        if record.refseq_transcript:
+            transcript_id = refseq.get(_strip_version(record.refseq_transcript))
+            peptide_id = peptides.get(transcript_id)
+            long_name = f'{peptide_id}:{record.hgvsp}' if peptide_id else None
+        else:
+            transcript_id = ensembl.get(_strip_version(record.transcript))
+            long_name = record.hgvsp if ':p.' in record.hgvsp else None
+        gene_id = genes_by_hgnc_id.get(_hgnc_id(record.hgnc_id)) if record.hgnc_id else None
+        gene_id = gene_id or genes_by_symbol.get(record.gene)
+        counts['unresolved_variants'] += variant_id is None
+        counts['unresolved_transcripts'] += transcript_id is None
+        counts['unresolved_genes'] += gene_id is None
+        counts['unresolved_aa_changes'] += long_name is None
+        resolved.append((variant_id, transcript_id, gene_id, long_name))
+
+    # Changes are only created with a link to one of their transcripts or genes.
+    names = {
+        long_name: short_name(long_name) for variant_id, transcript_id, gene_id, long_name in resolved
+        if long_name and (transcript_id or gene_id)
+    }
+    with transaction.atomic():
+        aa_change_ids, created = _aa_change_ids(names)
+        variant_transcripts = set()
+        aa_change_transcripts = set()
+        aa_change_genes = set()
+        for variant_id, transcript_id, gene_id, long_name in resolved:
+            aa_change_id = aa_change_ids.get(long_name)
+            if variant_id and transcript_id:
+                variant_transcripts.add((variant_id, transcript_id))
+            if aa_change_id and transcript_id:
+                aa_change_transcripts.add((aa_change_id, transcript_id))
+            if aa_change_id and gene_id:
+                aa_change_genes.add((aa_change_id, gene_id))
+        _link(models.Variants, 'transcripts', variant_transcripts)
+        _link(models.AminoAcidChange, 'transcripts', aa_change_transcripts)
+        _link(models.AminoAcidChange, 'genes', aa_change_genes)
+        if created:
+            identifiers.bulk_insert(identifiers.iter_entries(
+                [source for source in identifiers.SOURCES if source[1] is models.AminoAcidChange],
+                {models.AminoAcidChange: Q(id__in=created)},
+            ))
+        # The through table inserts send no m2m_changed signals.
+        stats.mark_aa_changes({aa_change_id for aa_change_id, target_id in aa_change_transcripts | aa_change_genes})
+        stats.mark_genes({gene_id for aa_change_id, gene_id in aa_change_genes})
+        response_cache.bump_data_version()
+    counts['records'] += len(records)
+    counts['aa_changes_created'] += len(created)
+    counts['variant_transcript_links'] += len(variant_transcripts)
+    counts['aa_change_transcript_links'] += len(aa_change_transcripts)
+    counts['aa_change_gene_links'] += len(aa_change_genes)
+
+
+def load(records, assembly=None, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """Loads an iterable of Consequence records in chunks. Returns the counts of the load.
+    Links are counted per chunk, including the links which already existed."""
+    assembly = assembly or settings.VARIANT_ASSEMBLY
+    counts = dict.fromkeys((
+        'records', 'unresolved_variants', 'unresolved_transcripts', 'unresolved_genes', 'unresolved_aa_changes',
+        'aa_changes_created', 'variant_transcript_links', 'aa_change_transcript_links', 'aa_change_gene_links',
+    ), 0)
+    records = iter(records)
+    # The stats of the genes and amino acid changes are refreshed once, after the last chunk.
+    with stats.deferred():
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                break
+            load_chunk(chunk, assembly, counts)
+            if progress:
+                progress(counts)
+    return counts
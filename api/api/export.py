@@ -0,0 +1,147 @@
+"""
+Streaming export of the variants knowledge base, with their transcripts, amino acid changes and annotations.
+
+Records are read in chunks and encoded as they go, so memory stays constant whatever the number of variants:
+the variant ids come from a server-side cursor and each chunk of ids is loaded with its relations prefetched.
+"""
+import json
+import zlib
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from api import models, serializers
+
+EXPORT_FORMATS = ('ndjson', 'parquet')
+DEFAULT_CHUNK_SIZE = 2000
+
+# Relations serialized by serializers.VariantExportSerializer
+EXPORT_PREFETCHES = ('gene', 'gene__annotations', 'transcripts', 'transcripts__aa_changes', 'transcripts__aa_changes__annotations')
+
+
+def export_queryset(since=None):
+    """Variants to export, ordered by id.
+
+    When since is given, only the variants created after it, or whose gene or amino acid change
+    annotations were created after it, are exported.
+    """
+    queryset = models.Variants.objects.all()
+    if since is not None:
+        changed_genes = models.GeneAnnotation.objects.filter(creation_timestamp__gt=since).values('gene_id')
+        changed_aa_changes = models.AminoAcidAnnotations.objects.filter(creation_timestamp__gt=since).values('amino_acid_id')
+        changed_variants = models.Variants.transcripts.through.objects.filter(
+            transcript__aa_changes__in=changed_aa_changes
+        ).values('variants_id')
+        queryset = queryset.filter(
+            Q(creation_timestamp__gt=since) | Q(gene_id__in=changed_genes) | Q(id__in=changed_variants)
+        )
+    return queryset.order_by('id')
+
+
+def iter_variant_chunks(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yields lists of serialized variants, chunk_size variants at a time."""
+    # iterator() uses a server-side cursor on PostgreSQL, only the ids of the current chunk are held in memory.
+    variant_ids = queryset.values_list('id', flat=True).iterator(chunk_size=chunk_size)
+    while True:
+        chunk_ids = list(islice(variant_ids, chunk_size))
+        if not chunk_ids:
+            break
+        variants = models.Variants.objects.filter(id__in=chunk_ids).order_by('id').prefetch_related(*EXPORT_PREFETCHES)
+        yield serializers.VariantExportSerializer(variants, many=True).data
+
+
+def ndjson_gzip_stream(chunks):
+    """Encodes chunks of records as gzip compressed NDJSON, yielding the compressed bytes chunk by chunk."""
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for records in chunks:
+        lines = "".join(json.dumps(record, cls=DjangoJSONEncoder) + "\n" for record in records)
+        data = compressor.compress(lines.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class _ByteSink:
+    """Minimal writable file object collecting what pyarrow writes, so that it can be drained between row groups."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.buffer.extend(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def _parquet_schema(pa):
+    fields = []
+    for field in models.Variants._meta.concrete_fields:
+        if field.name == 'gene':
+            # Nested relations are kept as JSON documents.
+            fields.append(pa.field(field.name, pa.string()))
+        elif field.get_internal_type() in ('AutoField', 'BigAutoField', 'IntegerField'):
+            fields.append(pa.field(field.name, pa.int64()))
+        else:
+            fields.append(pa.field(field.name, pa.string()))
+    fields.append(pa.field('transcripts', pa.string()))
+    return pa.schema(fields)
+
+
+def parquet_available():
+    try:
+        import pyarrow.parquet
+    except ImportError:
+        return False
+    return True
+
+
+def parquet_stream(chunks):
+    """Encodes chunks of records as Parquet, one row group per chunk, yielding the bytes chunk by chunk.
+
+    The variant columns are typed, the gene and transcripts relations are stored as JSON strings.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _parquet_schema(pa)
+    sink = _ByteSink()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+    for records in chunks:
+        columns = {name: [] for name in schema.names}
+        for record in records:
+            for name in schema.names:
+                value = record.get(name)
+                if isinstance(value, (dict, list)):
+                    value = json.dumps(value, cls=DjangoJSONEncoder)
+                columns[name].append(value)
+        writer.write_table(pa.table(columns, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def export_stream(export_format, queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Returns a generator of the encoded export."""
+    chunks = iter_variant_chunks(queryset, chunk_size)
+    if export_format == 'ndjson':
+        return ndjson_gzip_stream(chunks)
+    if export_format == 'parquet':
+        return parquet_stream(chunks)
+    raise ValueError("Unsupported export format %s, expected one of %s" % (export_format, ", ".join(EXPORT_FORMATS)))
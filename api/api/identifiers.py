@@ -0,0 +1,124 @@
+"""
+Unified lookup of HGVS notations and accessions (see models.IdentifierIndex).
+
+Identifiers are stored in many tables (variants, Ensembl/RefSeq/LRG transcripts, HGVSc and peptide tables,
+amino acid changes). The index holds their normalized form with the variant, transcript or amino acid change
+owning them, so that any of them resolves with one indexed lookup.
+
+The index is built by the build_identifier_index management command, to run after migrating and after bulk
+writes (bulk_create and QuerySet.update() send no signals). The entries of the rows saved or deleted one by one
+are refreshed by api.signals, those of the amino acid changes created by api.consequences when they are imported.
+"""
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Q
+
+from api import models
+from api.normalize import normalize_identifier
+
+# (source, model, identifier field, owner, path to the owner id)
+SOURCES = (
+    ('variants.hgvsg_id', models.Variants, 'hgvsg_id', 'variant', 'id'),
+    ('variants.alt_hgvsg_id', models.Variants, 'alt_hgvsg_id', 'variant', 'id'),
+    ('variants.refseq_hgvsg_id', models.Variants, 'refseq_hgvsg_id', 'variant', 'id'),
+    ('variants.lrg_hgvsg_id', models.Variants, 'lrg_hgvsg_id', 'variant', 'id'),
+    ('transcript.ensembl_transcript_id', models.Transcript, 'ensembl_transcript_id', 'transcript', 'id'),
+    ('ensembl_hgvsc.hgvsc_id', models.EnsemblHGVSC, 'hgvsc_id', 'transcript', 'transcript_id'),
+    ('ensembl_peptide.peptide_id', models.EnsemblPeptide, 'peptide_id', 'transcript', 'transcript_id'),
+    ('ensembl_peptide.hgvsp_id', models.EnsemblPeptide, 'hgvsp_id', 'transcript', 'transcript_id'),
+    ('refseq_transcript.refseq_transcript_id', models.RefSeqTranscript, 'refseq_transcript_id', 'transcript', 'transcript_id'),
+    ('refseq_hgvsc.hgvsc_id', models.RefSeqHGVSC, 'hgvsc_id', 'transcript', 'transcript__transcript_id'),
+    ('refseq_peptide.peptide_id', models.RefSeqPeptide, 'peptide_id', 'transcript', 'transcript__transcript_id'),
+    ('refseq_peptide.hgvsp_id', models.RefSeqPeptide, 'hgvsp_id', 'transcript', 'transcript__transcript_id'),
+    ('lrg_transcript.lrg_transcript_id', models.LRGTranscript, 'lrg_transcript_id', 'transcript', 'transcript_id'),
+    ('lrg_hgvsc.hgvsc_id', models.LRGHGVSC, 'hgvsc_id', 'transcript', 'transcript__transcript_id'),
+    ('lrg_peptide.peptide_id', models.LRGPeptide, 'peptide_id', 'transcript', 'transcript__transcript_id'),
+    ('lrg_peptide.hgvsp_id', models.LRGPeptide, 'hgvsp_id', 'transcript', 'transcript__transcript_id'),
+    ('aa_change.long_name', models.AminoAcidChange, 'long_name', 'aa_change', 'id'),
+)
+
+# Models holding identifiers, in the order of SOURCES
+INDEXED_MODELS = tuple(dict.fromkeys(source[1] for source in SOURCES))
+
+DEFAULT_BATCH_SIZE = 5000
+
+
+def iter_entries(sources=SOURCES, queryset_filters=None, chunk_size=DEFAULT_BATCH_SIZE):
+    """Yields the IdentifierIndex rows of the sources.
+    queryset_filters optionally maps a model to the filter restricting the rows to index.
+    """
+    for source, model, field, owner, owner_path in sources:
+        queryset = model.objects.exclude(**{field + '__isnull': True}).exclude(**{field: ''})
+        if queryset_filters and model in queryset_filters:
+            queryset = queryset.filter(queryset_filters[model])
+        for identifier, owner_id in queryset.values_list(field, owner_path).iterator(chunk_size=chunk_size):
+            yield models.IdentifierIndex(identifier=normalize_identifier(identifier), source=source, **{owner + '_id': owner_id})
+
+
+def bulk_insert(entries, batch_size=DEFAULT_BATCH_SIZE):
+    count = 0
+    while True:
+        batch = list(islice(entries, batch_size))
+        if not batch:
+            return count
+        models.IdentifierIndex.objects.bulk_create(batch)
+        count += len(batch)
+
+
+def rebuild(batch_size=DEFAULT_BATCH_SIZE):
+    """Rebuilds the whole index in one transaction. Returns the number of indexed identifiers."""
+    with transaction.atomic():
+        models.IdentifierIndex.objects.all().delete()
+        return bulk_insert(iter_entries(chunk_size=batch_size), batch_size)
+
+
+def sources_of(model):
+    return [source for source in SOURCES if source[1] is model]
+
+
+def owner_of(model):
+    """(owner, path to the owner id) of the identifiers of a model, the same for all its sources."""
+    _, _, _, owner, owner_path = sources_of(model)[0]
+    return owner, owner_path
+
+
+def indexed_fields(model):
+    """Fields of a model its index entries are built from: the identifiers and the first step to the owner."""
+    _, owner_path = owner_of(model)
+    return {source[2] for source in sources_of(model)} | {model._meta.get_field(owner_path.split('__')[0]).attname}
+
+
+def stored_owner_id(model, pk):
+    """Id of the owner of a row, as stored in the database."""
+    if pk is None:
+        return None
+    _, owner_path = owner_of(model)
+    if owner_path == 'id':
+        return pk
+    return model.objects.filter(pk=pk).values_list(owner_path, flat=True).first()
+
+
+def reindex(model, owner_ids, batch_size=DEFAULT_BATCH_SIZE):
+    """Replaces the index entries of the identifiers of a model belonging to some owners, e.g. the variants
+    imported or the transcripts whose HGVSc rows changed."""
+    owner, owner_path = owner_of(model)
+    owner_ids = list(owner_ids)
+    with transaction.atomic():
+        models.IdentifierIndex.objects.filter(
+            source__in=[source[0] for source in sources_of(model)], **{owner + '_id__in': owner_ids}
+        ).delete()
+        entries = iter_entries(sources_of(model), {model: Q(**{owner_path + '__in': owner_ids})}, batch_size)
+        return bulk_insert(entries, batch_size)
+
+
+def reindex_variants(variant_ids, batch_size=DEFAULT_BATCH_SIZE):
+    """Replaces the index entries of some variants, e.g. after importing them."""
+    return reindex(models.Variants, variant_ids, batch_size)
+
+
+def resolve(identifier):
+    """Returns the index entries matching an identifier, as dicts."""
+    return list(models.IdentifierIndex.objects.filter(identifier=normalize_identifier(identifier)).values(
+        'source', 'variant_id', 'transcript_id', 'aa_change_id'
+    ))
@@ -0,0 +1,110 @@
+"""
+Change detection of the spreadsheet imports (see api.views.process_annotation_file).
+
+Every imported row is recorded in ImportedRecord with a hash of its content, under the key identifying it in
+its sheet (e.g. the CPRA of an Annovar row). A re-import hashes its rows, compares them with the stored hashes
+with one query and only writes the new and changed rows, so that re-importing an unchanged workbook writes
+nothing: no WAL, no index churn, no stats refresh and no cache invalidation.
+Rows of earlier imports which are missing from the new one are reported as removed, and deleted with prune.
+"""
+import hashlib
+import json
+import math
+from datetime import date, datetime
+
+from django.db import transaction
+
+from api import models
+
+DEFAULT_BATCH_SIZE = 2000
+
+
+def _clean(value):
+    # Empty spreadsheet cells are NaN in pandas.
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if hasattr(value, 'item'):
+        # numpy scalars
+        return _clean(value.item())
+    return value
+
+
+def clean_values(values):
+    return {name: _clean(value) for name, value in values.items()}
+
+
+def content_hash(values):
+    """md5 of the canonical JSON of a {field: value} dict."""
+    data = json.dumps(clean_values(values), sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.md5(data.encode()).hexdigest()
+
+
+class ImportDiff:
+    """Rows of an import compared with the ImportedRecord of their source."""
+
+    def __init__(self, source, hashes):
+        self.source = source
+        # {key: content hash} of the imported rows
+        self.hashes = hashes
+        self.new = []
+        # {key: id of the object the row was written to}
+        self.changed = {}
+        self.unchanged = []
+        self.removed = {}
+
+    def summary(self):
+        return {
+            'new': len(self.new),
+            'changed': len(self.changed),
+            'unchanged': len(self.unchanged),
+            'removed': len(self.removed),
+        }
+
+
+def diff(source, rows, model):
+    """Compares {key: values} rows with the records of a source. model is the model the rows are written to:
+    unchanged rows whose object was deleted since are imported again."""
+    hashes = {key: content_hash(values) for key, values in rows.items()}
+    result = ImportDiff(source, hashes)
+    stored = {
+        key: (stored_hash, object_id) for key, stored_hash, object_id in
+        models.ImportedRecord.objects.filter(source=source).values_list('key', 'content_hash', 'object_id').iterator()
+    }
+    same = {key: stored[key][1] for key, row_hash in hashes.items() if key in stored and stored[key][0] == row_hash}
+    existing = set()
+    same_ids = list(same.values())
+    for start in range(0, len(same_ids), DEFAULT_BATCH_SIZE):
+        existing.update(model.objects.filter(id__in=same_ids[start:start + DEFAULT_BATCH_SIZE]).values_list('id', flat=True))
+    for key in hashes:
+        if key in same and same[key] in existing:
+            result.unchanged.append(key)
+        elif key in stored:
+            result.changed[key] = stored[key][1]
+        else:
+            result.new.append(key)
+    result.removed = {key: object_id for key, (stored_hash, object_id) in stored.items() if key not in hashes}
+    return result
+
+
+def record(import_diff, written, batch_size=DEFAULT_BATCH_SIZE):
+    """Stores the hashes of the written rows, {key: id of the object written}."""
+    records = [
+        models.ImportedRecord(source=import_diff.source, key=key, content_hash=import_diff.hashes[key], object_id=object_id)
+        for key, object_id in written.items()
+    ]
+    models.ImportedRecord.objects.bulk_create(records, batch_size=batch_size, update_conflicts=True,
+                                              unique_fields=['source', 'key'],
+                                              update_fields=['content_hash', 'object_id', 'imported'])
+
+
+def prune(import_diff, model):
+    """Deletes the objects of the removed rows and their records. Returns the number of objects deleted."""
+    if not import_diff.removed:
+        return 0
+    with transaction.atomic():
+        # QuerySet.delete() sends the signals refreshing the stats of the deleted objects.
+        deleted = model.objects.filter(id__in=list(import_diff.removed.values())).delete()[1].get(model._meta.label, 0)
+        models.ImportedRecord.objects.filter(source=import_diff.source, key__in=list(import_diff.removed)).delete()
+    return deleted
@@ -0,0 +1,27 @@
+"""
+
+"""
+import time
+from django.core.management.base import BaseCommand
+
+from api import identifiers
+
+
+class Command(BaseCommand):
+    """Rebuilds the identifier index used by /api/resolve/<identifier>/.
+
+    See https://docs.djangoproject.com/en/1.11/howto/custom-management-commands/
+    """
+    help = 'Rebuilds the index of HGVS notations and accessions.'
+
+    def add_arguments(self, parser):
+        """Positional arguments
+
+        See https://docs.python.org/3/library/argparse.html for more details about add_argument
+        """
+        parser.add_argument('--batch-size', type=int, default=identifiers.DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        start = time.time()
+        count = identifiers.rebuild(options['batch_size'])
+        self.stdout.write(f"Indexed {count} identifiers in {time.time() - start:.1f}s")
@@ -0,0 +1,31 @@
+"""
+
+"""
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api import variant_index
+
+
+class Command(BaseCommand):
+    """Builds the memory-mapped variant key index used by the /variants/exists/ endpoint.
+    Running workers pick up the new file on their next lookup.
+
+    See https://docs.djangoproject.com/en/1.11/howto/custom-management-commands/
+    """
+    help = 'Builds the variant key index file.'
+
+    def add_arguments(self, parser):
+        """Positional arguments
+
+        See https://docs.python.org/3/library/argparse.html for more details about add_argument
+        """
+        parser.add_argument('--output', type=str, default=None,
+                            help="index file to write, defaults to the VARIANT_INDEX_PATH setting")
+
+    def handle(self, *args, **options):
+        path = options['output'] or settings.VARIANT_INDEX_PATH
+        start = time.time()
+        key_count = variant_index.build_index_file(path)
+        self.stdout.write(f"Wrote {key_count} keys to {path} in {time.time() - start:.1f}s")
@@ -0,0 +1,27 @@
+"""
+
+"""
+import time
+from django.core.management.base import BaseCommand
+
+from api import variant_keys
+
+
+class Command(BaseCommand):
+    """Rebuilds the normalized chrom-pos-ref-alt keys of all variants on both assemblies.
+
+    See https://docs.djangoproject.com/en/1.11/howto/custom-management-commands/
+    """
+    help = 'Rebuilds the variant key table.'
+
+    def add_arguments(self, parser):
+        """Positional arguments
+
+        See https://docs.python.org/3/library/argparse.html for more details about add_argument
+        """
+        parser.add_argument('--batch-size', type=int, default=variant_keys.DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        start = time.time()
+        count = variant_keys.rebuild(options['batch_size'])
+        self.stdout.write(f"Built {count} variant keys in {time.time() - start:.1f}s")
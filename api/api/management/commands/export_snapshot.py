@@ -0,0 +1,33 @@
+"""
+
+"""
+import json
+import os
+import time
+from django.core.management.base import BaseCommand
+
+from api import snapshot
+
+
+class Command(BaseCommand):
+    """Exports a read-only SQLite snapshot of the database, served by the crowdseq.settings_snapshot settings.
+
+    See https://docs.djangoproject.com/en/1.11/howto/custom-management-commands/
+    """
+    help = 'Exports a consistent, indexed and vacuumed SQLite snapshot of the database with FTS5 search tables.'
+
+    def add_arguments(self, parser):
+        """Positional arguments
+
+        See https://docs.python.org/3/library/argparse.html for more details about add_argument
+        """
+        parser.add_argument('path', type=str, help="snapshot file, replaced atomically")
+        parser.add_argument('--batch-size', type=int, default=snapshot.DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        start = time.time()
+        counts = snapshot.export(options['path'], batch_size=options['batch_size'])
+        size = os.path.getsize(options['path'])
+        self.stdout.write(json.dumps(counts, indent=2))
+        self.stdout.write(f"Exported {sum(counts.values())} rows to {options['path']} "
+                          f"({size / 2 ** 20:.1f} MB) in {time.time() - start:.1f}s")
@@ -0,0 +1,44 @@
+"""
+
+"""
+import json
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from api import export
+
+
+class Command(BaseCommand):
+    """Writes the variants knowledge base to a gzip compressed NDJSON or Parquet file.
+
+    See https://docs.djangoproject.com/en/1.11/howto/custom-management-commands/
+    """
+    help = 'Exports variants with their transcripts, amino acid changes and annotations.'
+
+    def add_arguments(self, parser):
+        """Positional arguments
+
+        See https://docs.python.org/3/library/argparse.html for more details about add_argument
+        """
+        parser.add_argument('output_file', type=str, help="local file to write the export to")
+        parser.add_argument('--format', dest='export_format', choices=export.EXPORT_FORMATS, default='ndjson')
+        parser.add_argument('--since', type=str, default=None,
+                            help="ISO 8601 timestamp, only exports what was created or annotated after it")
+        parser.add_argument('--chunk-size', type=int, default=export.DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                raise CommandError("--since must be an ISO 8601 timestamp.")
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+
+        snapshot = timezone.now()
+        queryset = export.export_queryset(since)
+        with open(options['output_file'], 'wb') as f:
+            for data in export.export_stream(options['export_format'], queryset, options['chunk_size']):
+                f.write(data)
+        self.stdout.write(json.dumps({'output_file': options['output_file'], 'snapshot': snapshot.isoformat()}))
@@ -22,6 +22,8 @@ class Command(BaseCommand):
         See https://docs.python.org/3/library/argparse.html for more details about add_argument
         """
         parser.add_argument('annotation_file', type=str, help="local excel file with annotation data")
+        parser.add_argument('--prune', action='store_true',
+                            help="delete the rows of previous imports which are missing from this file")
 
     def handle(self, *args, **options):
 
@@ -29,5 +31,7 @@ class Command(BaseCommand):
 
         if StorageFile(filename).exists():
             xls = pd.ExcelFile(filename, engine='openpyxl')
-            feedback_items = process_annotation_file(xls)
+            feedback_items, changes = process_annotation_file(xls, prune=options['prune'])
+            for sheet, summary in changes.items():
+                self.stdout.write(f"{sheet}: {json.dumps(summary)}")
             StorageFile("/home/parkerc71/workspace/Crowdseq/api/annotation_import_errors.json").write_string(json.dumps(feedback_items))
@@ -0,0 +1,51 @@
+"""
+
+"""
+import gzip
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import consequences
+
+
+class Command(BaseCommand):
+    """Links variants, transcripts, amino acid changes and genes from VEP tab output or Annovar tables
+    (see api.consequences). Amino acid changes are created when missing, the other objects must exist.
+
+    See https://docs.djangoproject.com/en/1.11/howto/custom-management-commands/
+    """
+    help = 'Imports per-transcript consequences from VEP or Annovar output.'
+
+    def add_arguments(self, parser):
+        """Positional arguments
+
+        See https://docs.python.org/3/library/argparse.html for more details about add_argument
+        """
+        parser.add_argument('path', help="VEP tab output or Annovar table, optionally gzipped")
+        parser.add_argument('--format', choices=consequences.FORMATS, default='vep')
+        parser.add_argument('--assembly', help="assembly of the variants of the file, VARIANT_ASSEMBLY by default")
+        parser.add_argument('--chunk-size', type=int, default=consequences.DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--csv', action='store_true', help="comma separated Annovar table")
+
+    def handle(self, *args, **options):
+        start = time.time()
+        opener = gzip.open if options['path'].endswith('.gz') else open
+        if options['format'] == 'annovar':
+            def parse(lines):
+                return consequences.parse_annovar(lines, delimiter=',' if options['csv'] else '\t')
+        else:
+            parse = consequences.parse_vep
+
+        def progress(counts):
+            self.stdout.write(f"{counts['records']} records in {time.time() - start:.1f}s")
+
+        try:
+            with opener(options['path'], 'rt', newline='') as f:
+                counts = consequences.load(parse(f), assembly=options['assembly'], chunk_size=options['chunk_size'],
+                                           progress=progress)
+        except ValueError as e:
+            raise CommandError(str(e))
+        for name, count in counts.items():
+            self.stdout.write(f"{name}: {count}")
+        self.stdout.write(f"Imported consequences in {time.time() - start:.1f}s")
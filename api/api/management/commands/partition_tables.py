@@ -0,0 +1,41 @@
+"""
+
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api import partitioning
+
+
+class Command(BaseCommand):
+    """Partitions the Variants and AnnovarData tables by chromosome on PostgreSQL (see api.partitioning), or lists
+    their partitions with --status. Each table is locked while it is copied, run it during a maintenance window.
+
+    See https://docs.djangoproject.com/en/1.11/howto/custom-management-commands/
+    """
+    help = 'Partitions the variant tables by chromosome.'
+
+    def add_arguments(self, parser):
+        """Positional arguments
+
+        See https://docs.python.org/3/library/argparse.html for more details about add_argument
+        """
+        parser.add_argument('--status', action='store_true', help="only list the partitions and their estimated rows")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("Partitioning requires PostgreSQL.")
+        if not options['status']:
+            start = time.time()
+            # the foreign keys dropped are logged by partition_table
+            partitioning.partition_tables()
+            self.stdout.write(f"Partitioned the tables in {time.time() - start:.1f}s")
+        for model in partitioning.PARTITIONED_MODELS:
+            if not partitioning.is_partitioned(model):
+                self.stdout.write(f"{model._meta.db_table}: not partitioned")
+                continue
+            self.stdout.write(f"{model._meta.db_table}:")
+            for name, bounds, rows in partitioning.partitions(model):
+                self.stdout.write(f"  {name} {bounds}: ~{max(rows, 0)} rows")
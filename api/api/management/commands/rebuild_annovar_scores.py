@@ -0,0 +1,28 @@
+"""
+
+"""
+import time
+from django.core.management.base import BaseCommand
+
+from api import annovar_scores
+
+
+class Command(BaseCommand):
+    """Rebuilds the typed Annovar scores of all AnnovarData rows, e.g. after bulk loads which do not send
+    signals or after changing ANNOVAR_PACKED_SCORES.
+
+    See https://docs.djangoproject.com/en/1.11/howto/custom-management-commands/
+    """
+    help = 'Rebuilds the typed Annovar scores used by the score filters.'
+
+    def add_arguments(self, parser):
+        """Positional arguments
+
+        See https://docs.python.org/3/library/argparse.html for more details about add_argument
+        """
+        parser.add_argument('--batch-size', type=int, default=annovar_scores.DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        start = time.time()
+        count = annovar_scores.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(f"Rebuilt the scores of {count} Annovar rows in {time.time() - start:.1f}s")
@@ -0,0 +1,29 @@
+"""
+
+"""
+import time
+from django.core.management.base import BaseCommand
+
+from api import stats
+
+
+class Command(BaseCommand):
+    """Recomputes the gene and amino acid change stats, fixing the ones which drifted, e.g. after bulk loads
+    which do not send signals. Meant to run periodically.
+
+    See https://docs.djangoproject.com/en/1.11/howto/custom-management-commands/
+    """
+    help = 'Recomputes the gene and amino acid change summary statistics.'
+
+    def add_arguments(self, parser):
+        """Positional arguments
+
+        See https://docs.python.org/3/library/argparse.html for more details about add_argument
+        """
+        parser.add_argument('--batch-size', type=int, default=stats.DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        for name, reconcile in (('genes', stats.reconcile_genes), ('amino acid changes', stats.reconcile_aa_changes)):
+            start = time.time()
+            count, changed = reconcile(options['batch_size'])
+            self.stdout.write(f"Reconciled the stats of {count} {name} in {time.time() - start:.1f}s, {changed} updated")
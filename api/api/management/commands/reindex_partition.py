@@ -0,0 +1,38 @@
+"""
+
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import partitioning
+
+
+class Command(BaseCommand):
+    """Rebuilds the indexes of the partition of one chromosome with REINDEX CONCURRENTLY, and optionally
+    vacuums it, without locking the other partitions (see api.partitioning.reindex_partition).
+
+    See https://docs.djangoproject.com/en/1.11/howto/custom-management-commands/
+    """
+    help = 'Reindexes the partition of one chromosome.'
+
+    def add_arguments(self, parser):
+        """Positional arguments
+
+        See https://docs.python.org/3/library/argparse.html for more details about add_argument
+        """
+        parser.add_argument('model', help="variants or annovardata")
+        parser.add_argument('chromosomes', nargs='+', help="e.g. 7 X")
+        parser.add_argument('--vacuum', action='store_true', help="also VACUUM (ANALYZE) the partitions")
+
+    def handle(self, *args, **options):
+        try:
+            model = partitioning.partition_model(options['model'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if not partitioning.is_partitioned(model):
+            raise CommandError(f"{model._meta.db_table} is not partitioned, see the partition_tables command.")
+        for chromosome in options['chromosomes']:
+            start = time.time()
+            partition = partitioning.reindex_partition(model, chromosome, vacuum=options['vacuum'])
+            self.stdout.write(f"Reindexed {partition} in {time.time() - start:.1f}s")
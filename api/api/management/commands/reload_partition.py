@@ -0,0 +1,54 @@
+"""
+
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+
+from api import models, partitioning, response_cache, variant_keys
+
+
+class Command(BaseCommand):
+    """Replaces the rows of one chromosome of a partitioned table with the rows of a CSV file, e.g. exported with
+    COPY (SELECT * FROM api_variants WHERE chr = '7') TO STDOUT WITH CSV HEADER and corrected.
+    The other chromosomes stay readable and writable during the load (see api.partitioning.reload_partition).
+
+    See https://docs.djangoproject.com/en/1.11/howto/custom-management-commands/
+    """
+    help = 'Reloads the partition of one chromosome from a CSV file.'
+
+    def add_arguments(self, parser):
+        """Positional arguments
+
+        See https://docs.python.org/3/library/argparse.html for more details about add_argument
+        """
+        parser.add_argument('model', help="variants or annovardata")
+        parser.add_argument('chromosome', help="e.g. 7 or X")
+        parser.add_argument('path', help="CSV file with a header of column names, including id and chr")
+
+    def handle(self, *args, **options):
+        start = time.time()
+        try:
+            model = partitioning.partition_model(options['model'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if not partitioning.is_partitioned(model):
+            raise CommandError(f"{model._meta.db_table} is not partitioned, see the partition_tables command.")
+        chromosome_values = partitioning.chromosome_values(options['chromosome'])
+        if model is models.Variants:
+            # The keys of the variants missing from the file are deleted.
+            variant_ids = set(model.objects.filter(chr__in=chromosome_values).values_list('id', flat=True))
+        with open(options['path'], newline='') as f:
+            try:
+                count = partitioning.reload_partition(model, options['chromosome'], f)
+            except DatabaseError as e:
+                raise CommandError(f"The partition was not replaced: {e}")
+        self.stdout.write(f"Loaded {count} rows into {partitioning.partition_name(model, options['chromosome'])} "
+                          f"in {time.time() - start:.1f}s")
+        if model is models.Variants:
+            variant_ids.update(model.objects.filter(chr__in=chromosome_values).values_list('id', flat=True))
+            keys = variant_keys.reindex_variants(list(variant_ids))
+            self.stdout.write(f"Rebuilt {keys} variant keys. Run reconcile_stats and build_identifier_index "
+                              f"to refresh the statistics and identifiers of the chromosome.")
+        response_cache.bump_data_version()
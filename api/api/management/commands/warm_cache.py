@@ -0,0 +1,68 @@
+"""
+
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api import response_cache
+from api.views import PAYLOAD_BUILDERS
+
+
+def _warm(kind, key):
+    try:
+        return response_cache.warm_payload(kind, key, PAYLOAD_BUILDERS[kind])
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    """Precomputes the cached payloads of the most requested genes, amino acid changes and variants
+    (see api.response_cache), e.g. after a deploy or on a schedule.
+
+    See https://docs.djangoproject.com/en/1.11/howto/custom-management-commands/
+    """
+    help = 'Warms the response cache with the most requested payloads.'
+
+    def add_arguments(self, parser):
+        """Positional arguments
+
+        See https://docs.python.org/3/library/argparse.html for more details about add_argument
+        """
+        parser.add_argument('--top', type=int, default=settings.CACHE_WARM_TOP_N, help="keys warmed per kind")
+        parser.add_argument('--workers', type=int, default=4, help="payloads built concurrently")
+        parser.add_argument('--kinds', nargs='+', choices=list(PAYLOAD_BUILDERS), default=list(PAYLOAD_BUILDERS))
+        parser.add_argument('--genes', nargs='*', default=settings.CACHE_WARM_GENES,
+                            help="gene symbols warmed whatever their access count")
+
+    def handle(self, *args, **options):
+        start = time.time()
+        jobs = []
+        coverage = {}
+        for kind in options['kinds']:
+            top = response_cache.top_keys(kind, options['top'])
+            keys = [key for key, count in top]
+            if kind == 'gene':
+                keys += [symbol for symbol in options['genes'] if symbol not in keys]
+            total = response_cache.total_accesses(kind)
+            coverage[kind] = (sum(count for key, count in top), total)
+            jobs.extend((kind, key) for key in keys)
+
+        results = {}
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for (kind, key), result in zip(jobs, executor.map(lambda job: _warm(*job), jobs)):
+                results.setdefault(kind, {}).setdefault(result, 0)
+                results[kind][result] += 1
+
+        for kind in options['kinds']:
+            counts = results.get(kind, {})
+            warmed, total = coverage[kind]
+            share = f"{100 * warmed / total:.1f}%" if total else "n/a"
+            self.stdout.write(
+                f"{kind}: {counts.get('built', 0)} built, {counts.get('cached', 0)} already cached, "
+                f"{counts.get('missing', 0)} missing; the warmed keys served {share} of the recorded requests"
+            )
+        self.stdout.write(f"Warmed {len(jobs)} payloads with {options['workers']} workers in {time.time() - start:.1f}s")
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.3 on 2026-10-19 16:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_aminoacidchange_genes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='variants',
+            name='creation_timestamp',
+            field=models.DateTimeField(auto_now_add=True, db_column='creation_timestamp', db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.1.13 on 2026-10-19 16:52
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_variants_creation_timestamp'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='aminoacidchange',
+            index=models.Index(django.db.models.functions.text.Upper('short_name'), name='aa_change_upper_short_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='genes',
+            index=models.Index(django.db.models.functions.text.Upper('approved_symbol'), name='genes_upper_symbol_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='genes',
+            index=models.Index(django.db.models.functions.text.Upper('ensembl_gene_id'), name='genes_upper_ensembl_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transcript',
+            index=models.Index(django.db.models.functions.text.Upper('ensembl_transcript_id'), name='transcript_upper_ensembl_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='variants',
+            index=models.Index(fields=['chrom_pos_ref_alt'], name='variants_cpra_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='variants',
+            index=models.Index(fields=['alt_chrom_pos_ref_alt'], name='variants_alt_cpra_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='variants',
+            index=models.Index(django.db.models.functions.text.Upper('hgvsg_id'), name='variants_upper_hgvsg_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='variants',
+            index=models.Index(django.db.models.functions.text.Upper('alt_hgvsg_id'), name='variants_upper_alt_hgvsg_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='variants',
+            index=models.Index(django.db.models.functions.text.Upper('refseq_hgvsg_id'), name='variants_upper_rs_hgvsg_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='variants',
+            index=models.Index(django.db.models.functions.text.Upper('lrg_hgvsg_id'), name='variants_upper_lrg_hgvsg_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.1.13 on 2026-10-19 16:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdentifierIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('identifier', models.TextField(db_index=True)),
+                ('source', models.CharField(max_length=50)),
+                ('aa_change', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.aminoacidchange')),
+                ('transcript', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.transcript')),
+                ('variant', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.variants')),
+            ],
+        ),
+    ]
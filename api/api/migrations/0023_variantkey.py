@@ -0,0 +1,27 @@
+# Generated by Django 4.1.13 on 2026-10-19 16:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0022_identifierindex'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VariantKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.TextField(db_index=True)),
+                ('assembly', models.CharField(choices=[('hg19', 'GRCh37/hg19'), ('hg38', 'GRCh38/hg38')], max_length=4)),
+                ('variant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='keys', to='api.variants')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='variantkey',
+            constraint=models.UniqueConstraint(fields=('variant', 'assembly'), name='variant_key_unique_assembly'),
+        ),
+    ]
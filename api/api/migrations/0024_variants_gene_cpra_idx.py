@@ -0,0 +1,17 @@
+# Generated by Django 4.1.13 on 2026-10-19 16:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0023_variantkey'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='variants',
+            index=models.Index(fields=['gene', 'chrom_pos_ref_alt'], name='variants_gene_cpra_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.1.13 on 2026-10-19 16:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0024_variants_gene_cpra_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AAChangeStats',
+            fields=[
+                ('aa_change', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='api.aminoacidchange')),
+                ('annotation_count', models.IntegerField(default=0)),
+                ('gene_count', models.IntegerField(default=0)),
+                ('transcript_count', models.IntegerField(default=0)),
+                ('diagnosis_counts', models.JSONField(default=list)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='GeneStats',
+            fields=[
+                ('gene', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='api.genes')),
+                ('variant_count', models.IntegerField(default=0)),
+                ('exonic_func_counts', models.JSONField(default=list)),
+                ('annotation_count', models.IntegerField(default=0)),
+                ('aa_change_count', models.IntegerField(default=0)),
+                ('aa_annotation_count', models.IntegerField(default=0)),
+                ('diagnosis_counts', models.JSONField(default=list)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.1.13 on 2026-10-19 17:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0025_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccessCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=20)),
+                ('key', models.TextField()),
+                ('count', models.BigIntegerField(default=0)),
+                ('last_access', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='accesscount',
+            index=models.Index(fields=['kind', '-count'], name='access_count_top_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='accesscount',
+            constraint=models.UniqueConstraint(fields=('kind', 'key'), name='access_count_unique_key'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.1.13 on 2026-10-19 17:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0026_accesscount'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='aminoacidannotations',
+            index=models.Index(fields=['amino_acid', 'diagnosis', 'priority'], name='aa_annot_diag_priority_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='geneannotation',
+            index=models.Index(fields=['gene', 'diagnosis', 'priority'], name='gene_annot_diag_priority_idx'),
+        ),
+    ]
@@ -0,0 +1,211 @@
+# Generated by Django 4.1.13 on 2026-10-19 17:16
+
+import math
+import re
+from array import array
+from itertools import islice
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Copies of the fields and parsing of api.annovar_scores at the time of this migration, which must not change
+# with the app code.
+SCORE_FIELDS = (
+    'ex_ac_all', 'gnomad_exome_af_popmax', 'gnomad_genome_af',
+    'sift_score', 'sift_converted_rankscore',
+    'polyphen_2_hdiv_score', 'polyphen_2_hdiv_rankscore',
+    'polyphen_2_hvar_score', 'polyphen_2_hvar_rankscore',
+    'lrt_score', 'lrt_converted_rankscore',
+    'mutation_taster_score', 'mutation_taster_converted_rankscore',
+    'mutation_assessor_score', 'mutation_assessor_score_rankscore',
+    'fathmm_score', 'fathmm_converted_rankscore',
+    'provean_score', 'provean_converted_rankscore',
+    'vest_3_score', 'vest_3_rankscore',
+    'meta_svm_score', 'meta_svm_rankscore',
+    'meta_lr_score', 'meta_lr_rankscore',
+    'm_cap_score', 'm_cap_rankscore',
+    'revel_score', 'revel_rankscore',
+    'mut_pred_score', 'mut_pred_rankscore',
+    'cadd_raw', 'cadd_raw_rankscore', 'cadd_phred',
+    'dann_score', 'dann_rankscore',
+    'fathmm_mkl_coding_score', 'fathmm_mkl_coding_rankscore',
+    'eigen_raw', 'eigen_pc_raw',
+    'geno_canyon_score', 'geno_canyon_score_rankscore',
+    'integrated_fit_cons_score', 'integrated_fit_cons_score_rankscore', 'integrated_confidence_value',
+    'gerp_rs', 'gerp_rs_rankscore',
+    'phylo_p_100_way_vertebrate', 'phylo_p_100_way_vertebrate_rankscore',
+    'phylo_p_20_way_mammalian', 'phylo_p_20_way_mammalian_rankscore',
+    'phast_cons_100_way_vertebrate', 'phast_cons_100_way_vertebrate_rankscore',
+    'phast_cons_20_way_mammalian', 'phast_cons_20_way_mammalian_rankscore',
+    'si_phy_29_way_log_odds', 'si_phy_29_way_log_odds_rankscore',
+)
+PRED_FIELDS = (
+    'sift_pred', 'polyphen_2_hdiv_pred', 'polyphen_2_hvar_pred', 'lrt_pred', 'mutation_taster_pred',
+    'mutation_assessor_pred', 'fathmm_pred', 'provean_pred', 'meta_svm_pred', 'meta_lr_pred', 'm_cap_pred',
+    'fathmm_mkl_coding_pred',
+)
+PRED_CODES = frozenset('ABDHLMNPTU')
+BATCH_SIZE = 2000
+
+
+def parse_score(value):
+    if value is None:
+        return None
+    for part in re.split(r'[;,|]', str(value)):
+        try:
+            number = float(part)
+        except ValueError:
+            continue
+        if not math.isnan(number):
+            return number
+    return None
+
+
+def parse_pred(value):
+    if not isinstance(value, str):
+        return None
+    for part in re.split(r'[;,|]', value):
+        part = part.strip().upper()
+        if part in PRED_CODES:
+            return part
+    return None
+
+
+def scores_of(record):
+    values = {field: parse_score(getattr(record, field)) for field in SCORE_FIELDS}
+    values['packed'] = None
+    if getattr(settings, 'ANNOVAR_PACKED_SCORES', False):
+        values['packed'] = array('f', [math.nan if values[field] is None else values[field]
+                                       for field in SCORE_FIELDS]).tobytes()
+    values.update({field: parse_pred(getattr(record, field)) for field in PRED_FIELDS})
+    return values
+
+
+def build_scores(apps, schema_editor):
+    AnnovarData = apps.get_model('api', 'AnnovarData')
+    AnnovarScores = apps.get_model('api', 'AnnovarScores')
+    rows = AnnovarData.objects.order_by('id').only('id', *SCORE_FIELDS, *PRED_FIELDS).iterator(chunk_size=BATCH_SIZE)
+    while True:
+        batch = list(islice(rows, BATCH_SIZE))
+        if not batch:
+            return
+        AnnovarScores.objects.bulk_create([AnnovarScores(annovar_id=record.pk, **scores_of(record)) for record in batch])
+
+
+class Migration(migrations.Migration):
+    # Each batch of scores is committed on its own.
+    atomic = False
+
+    dependencies = [
+        ('api', '0027_annotation_diagnosis_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnnovarScores',
+            fields=[
+                ('annovar', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='scores', serialize=False, to='api.annovardata')),
+                ('ex_ac_all', models.FloatField(blank=True, null=True)),
+                ('gnomad_exome_af_popmax', models.FloatField(blank=True, null=True)),
+                ('gnomad_genome_af', models.FloatField(blank=True, null=True)),
+                ('sift_score', models.FloatField(blank=True, null=True)),
+                ('sift_converted_rankscore', models.FloatField(blank=True, null=True)),
+                ('polyphen_2_hdiv_score', models.FloatField(blank=True, null=True)),
+                ('polyphen_2_hdiv_rankscore', models.FloatField(blank=True, null=True)),
+                ('polyphen_2_hvar_score', models.FloatField(blank=True, null=True)),
+                ('polyphen_2_hvar_rankscore', models.FloatField(blank=True, null=True)),
+                ('lrt_score', models.FloatField(blank=True, null=True)),
+                ('lrt_converted_rankscore', models.FloatField(blank=True, null=True)),
+                ('mutation_taster_score', models.FloatField(blank=True, null=True)),
+                ('mutation_taster_converted_rankscore', models.FloatField(blank=True, null=True)),
+                ('mutation_assessor_score', models.FloatField(blank=True, null=True)),
+                ('mutation_assessor_score_rankscore', models.FloatField(blank=True, null=True)),
+                ('fathmm_score', models.FloatField(blank=True, null=True)),
+                ('fathmm_converted_rankscore', models.FloatField(blank=True, null=True)),
+                ('provean_score', models.FloatField(blank=True, null=True)),
+                ('provean_converted_rankscore', models.FloatField(blank=True, null=True)),
+                ('vest_3_score', models.FloatField(blank=True, null=True)),
+                ('vest_3_rankscore', models.FloatField(blank=True, null=True)),
+                ('meta_svm_score', models.FloatField(blank=True, null=True)),
+                ('meta_svm_rankscore', models.FloatField(blank=True, null=True)),
+                ('meta_lr_score', models.FloatField(blank=True, null=True)),
+                ('meta_lr_rankscore', models.FloatField(blank=True, null=True)),
+                ('m_cap_score', models.FloatField(blank=True, null=True)),
+                ('m_cap_rankscore', models.FloatField(blank=True, null=True)),
+                ('revel_score', models.FloatField(blank=True, null=True)),
+                ('revel_rankscore', models.FloatField(blank=True, null=True)),
+                ('mut_pred_score', models.FloatField(blank=True, null=True)),
+                ('mut_pred_rankscore', models.FloatField(blank=True, null=True)),
+                ('cadd_raw', models.FloatField(blank=True, null=True)),
+                ('cadd_raw_rankscore', models.FloatField(blank=True, null=True)),
+                ('cadd_phred', models.FloatField(blank=True, null=True)),
+                ('dann_score', models.FloatField(blank=True, null=True)),
+                ('dann_rankscore', models.FloatField(blank=True, null=True)),
+                ('fathmm_mkl_coding_score', models.FloatField(blank=True, null=True)),
+                ('fathmm_mkl_coding_rankscore', models.FloatField(blank=True, null=True)),
+                ('eigen_raw', models.FloatField(blank=True, null=True)),
+                ('eigen_pc_raw', models.FloatField(blank=True, null=True)),
+                ('geno_canyon_score', models.FloatField(blank=True, null=True)),
+                ('geno_canyon_score_rankscore', models.FloatField(blank=True, null=True)),
+                ('integrated_fit_cons_score', models.FloatField(blank=True, null=True)),
+                ('integrated_fit_cons_score_rankscore', models.FloatField(blank=True, null=True)),
+                ('integrated_confidence_value', models.FloatField(blank=True, null=True)),
+                ('gerp_rs', models.FloatField(blank=True, null=True)),
+                ('gerp_rs_rankscore', models.FloatField(blank=True, null=True)),
+                ('phylo_p_100_way_vertebrate', models.FloatField(blank=True, null=True)),
+                ('phylo_p_100_way_vertebrate_rankscore', models.FloatField(blank=True, null=True)),
+                ('phylo_p_20_way_mammalian', models.FloatField(blank=True, null=True)),
+                ('phylo_p_20_way_mammalian_rankscore', models.FloatField(blank=True, null=True)),
+                ('phast_cons_100_way_vertebrate', models.FloatField(blank=True, null=True)),
+                ('phast_cons_100_way_vertebrate_rankscore', models.FloatField(blank=True, null=True)),
+                ('phast_cons_20_way_mammalian', models.FloatField(blank=True, null=True)),
+                ('phast_cons_20_way_mammalian_rankscore', models.FloatField(blank=True, null=True)),
+                ('si_phy_29_way_log_odds', models.FloatField(blank=True, null=True)),
+                ('si_phy_29_way_log_odds_rankscore', models.FloatField(blank=True, null=True)),
+                ('sift_pred', models.CharField(blank=True, choices=[('A', 'Disease causing automatic'), ('B', 'Benign'), ('D', 'Damaging'), ('H', 'High'), ('L', 'Low'), ('M', 'Medium'), ('N', 'Neutral'), ('P', 'Possibly damaging or polymorphism automatic'), ('T', 'Tolerated'), ('U', 'Unknown')], max_length=1, null=True)),
+                ('polyphen_2_hdiv_pred', models.CharField(blank=True, choices=[('A', 'Disease causing automatic'), ('B', 'Benign'), ('D', 'Damaging'), ('H', 'High'), ('L', 'Low'), ('M', 'Medium'), ('N', 'Neutral'), ('P', 'Possibly damaging or polymorphism automatic'), ('T', 'Tolerated'), ('U', 'Unknown')], max_length=1, null=True)),
+                ('polyphen_2_hvar_pred', models.CharField(blank=True, choices=[('A', 'Disease causing automatic'), ('B', 'Benign'), ('D', 'Damaging'), ('H', 'High'), ('L', 'Low'), ('M', 'Medium'), ('N', 'Neutral'), ('P', 'Possibly damaging or polymorphism automatic'), ('T', 'Tolerated'), ('U', 'Unknown')], max_length=1, null=True)),
+                ('lrt_pred', models.CharField(blank=True, choices=[('A', 'Disease causing automatic'), ('B', 'Benign'), ('D', 'Damaging'), ('H', 'High'), ('L', 'Low'), ('M', 'Medium'), ('N', 'Neutral'), ('P', 'Possibly damaging or polymorphism automatic'), ('T', 'Tolerated'), ('U', 'Unknown')], max_length=1, null=True)),
+                ('mutation_taster_pred', models.CharField(blank=True, choices=[('A', 'Disease causing automatic'), ('B', 'Benign'), ('D', 'Damaging'), ('H', 'High'), ('L', 'Low'), ('M', 'Medium'), ('N', 'Neutral'), ('P', 'Possibly damaging or polymorphism automatic'), ('T', 'Tolerated'), ('U', 'Unknown')], max_length=1, null=True)),
+                ('mutation_assessor_pred', models.CharField(blank=True, choices=[('A', 'Disease causing automatic'), ('B', 'Benign'), ('D', 'Damaging'), ('H', 'High'), ('L', 'Low'), ('M', 'Medium'), ('N', 'Neutral'), ('P', 'Possibly damaging or polymorphism automatic'), ('T', 'Tolerated'), ('U', 'Unknown')], max_length=1, null=True)),
+                ('fathmm_pred', models.CharField(blank=True, choices=[('A', 'Disease causing automatic'), ('B', 'Benign'), ('D', 'Damaging'), ('H', 'High'), ('L', 'Low'), ('M', 'Medium'), ('N', 'Neutral'), ('P', 'Possibly damaging or polymorphism automatic'), ('T', 'Tolerated'), ('U', 'Unknown')], max_length=1, null=True)),
+                ('provean_pred', models.CharField(blank=True, choices=[('A', 'Disease causing automatic'), ('B', 'Benign'), ('D', 'Damaging'), ('H', 'High'), ('L', 'Low'), ('M', 'Medium'), ('N', 'Neutral'), ('P', 'Possibly damaging or polymorphism automatic'), ('T', 'Tolerated'), ('U', 'Unknown')], max_length=1, null=True)),
+                ('meta_svm_pred', models.CharField(blank=True, choices=[('A', 'Disease causing automatic'), ('B', 'Benign'), ('D', 'Damaging'), ('H', 'High'), ('L', 'Low'), ('M', 'Medium'), ('N', 'Neutral'), ('P', 'Possibly damaging or polymorphism automatic'), ('T', 'Tolerated'), ('U', 'Unknown')], max_length=1, null=True)),
+                ('meta_lr_pred', models.CharField(blank=True, choices=[('A', 'Disease causing automatic'), ('B', 'Benign'), ('D', 'Damaging'), ('H', 'High'), ('L', 'Low'), ('M', 'Medium'), ('N', 'Neutral'), ('P', 'Possibly damaging or polymorphism automatic'), ('T', 'Tolerated'), ('U', 'Unknown')], max_length=1, null=True)),
+                ('m_cap_pred', models.CharField(blank=True, choices=[('A', 'Disease causing automatic'), ('B', 'Benign'), ('D', 'Damaging'), ('H', 'High'), ('L', 'Low'), ('M', 'Medium'), ('N', 'Neutral'), ('P', 'Possibly damaging or polymorphism automatic'), ('T', 'Tolerated'), ('U', 'Unknown')], max_length=1, null=True)),
+                ('fathmm_mkl_coding_pred', models.CharField(blank=True, choices=[('A', 'Disease causing automatic'), ('B', 'Benign'), ('D', 'Damaging'), ('H', 'High'), ('L', 'Low'), ('M', 'Medium'), ('N', 'Neutral'), ('P', 'Possibly damaging or polymorphism automatic'), ('T', 'Tolerated'), ('U', 'Unknown')], max_length=1, null=True)),
+                ('packed', models.BinaryField(blank=True, null=True)),
+            ],
+        ),
+        # Before the indexes, which are faster to build on the filled table.
+        migrations.RunPython(build_scores, reverse_code=migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='annovarscores',
+            index=models.Index(fields=['cadd_phred'], name='annovar_cadd_phred_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='annovarscores',
+            index=models.Index(fields=['revel_score'], name='annovar_revel_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='annovarscores',
+            index=models.Index(fields=['sift_score'], name='annovar_sift_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='annovarscores',
+            index=models.Index(fields=['polyphen_2_hdiv_score'], name='annovar_polyphen_hdiv_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='annovarscores',
+            index=models.Index(fields=['gerp_rs'], name='annovar_gerp_rs_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='annovarscores',
+            index=models.Index(fields=['gnomad_exome_af_popmax'], name='annovar_gnomad_exome_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='annovarscores',
+            index=models.Index(fields=['gnomad_genome_af'], name='annovar_gnomad_genome_idx'),
+        ),
+    ]
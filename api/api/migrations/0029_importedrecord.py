@@ -0,0 +1,28 @@
+# Generated by Django 4.1.13 on 2026-10-19 17:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0028_annovarscores'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportedRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=50)),
+                ('key', models.TextField()),
+                ('content_hash', models.CharField(max_length=32)),
+                ('object_id', models.BigIntegerField()),
+                ('imported', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='importedrecord',
+            constraint=models.UniqueConstraint(fields=('source', 'key'), name='imported_record_unique_key'),
+        ),
+    ]
@@ -0,0 +1,102 @@
+# Generated by Django 4.1.13 on 2026-10-19 17:38
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+# Frozen copy of api.partitioning.partition_table at the time of this migration, which must not change with the
+# app code.
+CHROMOSOMES = [str(number) for number in range(1, 23)] + ['X', 'Y', 'MT']
+PARTITION_KEY = 'chr'
+
+
+def chromosome_values(chrom):
+    return [chrom, 'chr' + chrom] + (['M', 'chrM'] if chrom == 'MT' else [])
+
+
+def partition_table(connection, table):
+    """Converts a table to a table partitioned by LIST (chr), with one partition per chromosome and a default
+    partition (see api.partitioning)."""
+    quote = connection.ops.quote_name
+    old = f'{table}_unpartitioned'
+    sequence = f'{table}_partitioned_id_seq'
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)', [table])
+        if cursor.fetchone() is not None:
+            return
+        cursor.execute(f'LOCK TABLE {quote(table)} IN ACCESS EXCLUSIVE MODE')
+        cursor.execute(
+            'SELECT pg_get_indexdef(x.indexrelid) FROM pg_index x WHERE x.indrelid = %s::regclass '
+            'AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = x.indexrelid)', [table]
+        )
+        indexes = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass "
+            "AND contype = 'u'", [table]
+        )
+        uniques = cursor.fetchall()
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass "
+            "AND contype = 'f'", [table]
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(f'ALTER TABLE {quote(table)} RENAME TO {quote(old)}')
+        cursor.execute(
+            f'CREATE TABLE {quote(table)} (LIKE {quote(old)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS '
+            f'INCLUDING STORAGE) PARTITION BY LIST ({quote(PARTITION_KEY)})'
+        )
+        cursor.execute(f'CREATE SEQUENCE {quote(sequence)} OWNED BY {quote(table)}.id')
+        cursor.execute(f"ALTER TABLE {quote(table)} ALTER COLUMN id SET DEFAULT nextval('{sequence}')")
+        for chrom in CHROMOSOMES:
+            values = ', '.join(f"'{value}'" for value in chromosome_values(chrom))
+            cursor.execute(f'CREATE TABLE {quote(f"{table}_chr_{chrom.lower()}")} PARTITION OF {quote(table)} '
+                           f'FOR VALUES IN ({values})')
+        cursor.execute(f'CREATE TABLE {quote(f"{table}_chr_other")} PARTITION OF {quote(table)} DEFAULT')
+        cursor.execute(f'INSERT INTO {quote(table)} SELECT * FROM {quote(old)}')
+        cursor.execute(f"SELECT setval('{sequence}', COALESCE((SELECT MAX(id) FROM {quote(table)}), 0) + 1, false)")
+        cursor.execute(f'DROP TABLE {quote(old)} CASCADE')
+        cursor.execute(f'ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(table + "_pkey")} '
+                       f'PRIMARY KEY (id, {quote(PARTITION_KEY)})')
+        for name, definition in uniques:
+            definition = definition[:definition.rindex(')')] + f', {quote(PARTITION_KEY)})'
+            cursor.execute(f'ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(name)} {definition}')
+        for definition in indexes:
+            cursor.execute(definition)
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(name)} {definition}')
+        cursor.execute(f'ANALYZE {quote(table)}')
+
+
+def fill_chr(apps, schema_editor):
+    AnnovarData = apps.get_model('api', 'AnnovarData')
+    Variants = apps.get_model('api', 'Variants')
+    AnnovarData.objects.update(chr=Subquery(Variants.objects.filter(id=OuterRef('variant_id')).values('chr')[:1]))
+
+
+def partition_tables(apps, schema_editor):
+    """Only with VARIANT_PARTITIONING on PostgreSQL. The partition_tables command can partition them later."""
+    if settings.VARIANT_PARTITIONING and schema_editor.connection.vendor == 'postgresql':
+        for model_name in ('Variants', 'AnnovarData'):
+            partition_table(schema_editor.connection, apps.get_model('api', model_name)._meta.db_table)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0029_importedrecord'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='annovardata',
+            name='chr',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.RunPython(fill_chr, reverse_code=migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='variants',
+            index=models.Index(fields=['chr', 'start_pos'], name='variants_chr_start_idx'),
+        ),
+        # After the index, which is then built on every partition.
+        migrations.RunPython(partition_tables, reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 4.1.13 on 2026-10-19 19:02
+
+import re
+from itertools import islice
+
+from django.conf import settings
+from django.db import migrations
+
+BATCH_SIZE = 5000
+
+# Copy of api.normalize.normalize_cpra at the time of this migration, which must not change with the app code.
+CPRA_PATTERN = re.compile(
+    r'^(?:chr)?([0-9]{1,2}|X|Y|MT?)[-:_\s]+(\d+)[-:_\s]+([ACGTN]+|[-.]?)[-:_/>\s]([ACGTN]+|[-.]?)$',
+    re.IGNORECASE,
+)
+
+
+def normalize_cpra(cpra):
+    match = CPRA_PATTERN.match(str(cpra).strip())
+    if not match:
+        return None
+    chrom, pos, ref, alt = match.groups()
+    chrom = chrom.upper()
+    if chrom == 'M':
+        chrom = 'MT'
+    pos = int(pos)
+    ref = ref.upper().strip('-.')
+    alt = alt.upper().strip('-.')
+    while ref and alt and ref[-1] == alt[-1]:
+        ref, alt = ref[:-1], alt[:-1]
+    while ref and alt and ref[0] == alt[0]:
+        ref, alt = ref[1:], alt[1:]
+        pos += 1
+    return "%s-%s-%s-%s" % (chrom, pos, ref or '-', alt or '-')
+
+
+def fill_keys(apps, schema_editor):
+    """Keys of the variants which have none, so that the variants imported before 0023 resolve by CPRA."""
+    Variants = apps.get_model('api', 'Variants')
+    VariantKey = apps.get_model('api', 'VariantKey')
+    rows = Variants.objects.filter(keys__isnull=True).values_list('id', 'chrom_pos_ref_alt', 'alt_chrom_pos_ref_alt')
+    keys = (
+        VariantKey(key=key, assembly=assembly, variant_id=variant_id)
+        for variant_id, cpra, alt_cpra in rows.iterator(chunk_size=BATCH_SIZE)
+        for assembly, key in ((settings.VARIANT_ASSEMBLY, normalize_cpra(cpra)),
+                              (settings.VARIANT_ALT_ASSEMBLY, normalize_cpra(alt_cpra)))
+        if key
+    )
+    while True:
+        batch = list(islice(keys, BATCH_SIZE))
+        if not batch:
+            return
+        VariantKey.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0030_annovardata_chr_partitioning'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_keys, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,11 @@
 import uuid
 
 from django.db import models
+from django.db.models.functions import Upper
 from django.contrib.auth import get_user_model
 
+from api import annovar_scores
+
 User = get_user_model()
 
 
@@ -11,6 +14,9 @@ class DiagnosisCategory(models.Model):
     name = models.CharField(max_length=255, unique=True)
     description = models.TextField(blank=True, null=True)
 
+    def __str__(self):
+        return self.name
+
 
 class Diagnosis(models.Model):
     """Model for managing the universe of diagnoses ( Diagnosis List )"""
@@ -19,6 +25,9 @@ class Diagnosis(models.Model):
     description = models.TextField(blank=True, null=True)
     category = models.ForeignKey(DiagnosisCategory, blank=True, null=True, on_delete=models.SET_NULL)
 
+    def __str__(self):
+        return self.name
+
 
 class Genes(models.Model):
     hgnc_gene_id = models.IntegerField(unique=True)
@@ -49,6 +58,16 @@ class Genes(models.Model):
     omim_id = models.TextField(blank=True, null=True)
     ucsc_id = models.TextField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # Case insensitive lookups of the search (api.search)
+            models.Index(Upper('approved_symbol'), name='genes_upper_symbol_idx'),
+            models.Index(Upper('ensembl_gene_id'), name='genes_upper_ensembl_idx'),
+        ]
+
+    def __str__(self):
+        return self.approved_symbol or f'HGNC:{self.hgnc_gene_id}'
+
 
 class GeneAnnotation(models.Model):
     gene = models.ForeignKey(Genes, related_name="annotations", on_delete=models.CASCADE)
@@ -58,6 +77,12 @@ class GeneAnnotation(models.Model):
     creation_timestamp = models.DateTimeField(db_column='creation_timestamp', auto_now_add=True)
     diagnosis = models.ForeignKey(DiagnosisCategory, blank=True, null=True, on_delete=models.CASCADE, related_name='gene_annotations')
 
+    class Meta:
+        indexes = [
+            # Annotations of a gene in a diagnosis by priority (see api.annotations.annotation_filters)
+            models.Index(fields=['gene', 'diagnosis', 'priority'], name='gene_annot_diag_priority_idx'),
+        ]
+
 
 class Transcript(models.Model):
     ensembl_transcript_id = models.TextField(blank=False, null=False, unique=True)
@@ -65,6 +90,14 @@ class Transcript(models.Model):
     transcript_length = models.IntegerField(blank=True, null=True)
     refseq_match = models.TextField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(Upper('ensembl_transcript_id'), name='transcript_upper_ensembl_idx'),
+        ]
+
+    def __str__(self):
+        return self.ensembl_transcript_id
+
 
 class EnsemblPeptide(models.Model):
     transcript = models.ForeignKey(Transcript, on_delete=models.CASCADE, related_name='peptides')
@@ -83,6 +116,9 @@ class RefSeqTranscript(models.Model):
     refseq_transcript_id = models.TextField(blank=False, null=False, unique=True)
     transcript_type = models.TextField(blank=False, null=False)
 
+    def __str__(self):
+        return self.refseq_transcript_id
+
 
 class RefSeqHGVSC(models.Model):
     transcript = models.ForeignKey(RefSeqTranscript, on_delete=models.CASCADE, related_name='hgvsc')
@@ -100,6 +136,9 @@ class LRGTranscript(models.Model):
     transcript = models.ForeignKey(Transcript, on_delete=models.CASCADE, related_name='lrg_transcripts')
     lrg_transcript_id = models.TextField(blank=False, null=False, unique=True)
 
+    def __str__(self):
+        return self.lrg_transcript_id
+
 
 class LRGHGVSC(models.Model):
     transcript = models.ForeignKey(LRGTranscript, on_delete=models.CASCADE, related_name='hgvsc')
@@ -118,6 +157,14 @@ class AminoAcidChange(models.Model):
     transcripts = models.ManyToManyField(Transcript, related_name='aa_changes')
     genes = models.ManyToManyField(Genes, related_name='aa_changes')
 
+    class Meta:
+        indexes = [
+            models.Index(Upper('short_name'), name='aa_change_upper_short_idx'),
+        ]
+
+    def __str__(self):
+        return self.long_name
+
 
 class AminoAcidAnnotations(models.Model):
     gene = models.ForeignKey(Genes, on_delete=models.CASCADE, related_name="aa_annotations")
@@ -128,6 +175,11 @@ class AminoAcidAnnotations(models.Model):
     creation_timestamp = models.DateTimeField(db_column='creation_timestamp', auto_now_add=True)
     diagnosis = models.ForeignKey(DiagnosisCategory, blank=True, null=True, on_delete=models.CASCADE, related_name='aachange_annotations')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['amino_acid', 'diagnosis', 'priority'], name='aa_annot_diag_priority_idx'),
+        ]
+
 
 class Variants(models.Model):
     md5sum = models.TextField(unique=True)
@@ -145,10 +197,50 @@ class Variants(models.Model):
     alt_chr = models.TextField()
     alt_chrom_pos_ref_alt = models.TextField()
     transcripts = models.ManyToManyField(Transcript, related_name='variants')
+    creation_timestamp = models.DateTimeField(db_column='creation_timestamp', auto_now_add=True, null=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['chrom_pos_ref_alt'], name='variants_cpra_idx'),
+            models.Index(fields=['gene', 'chrom_pos_ref_alt'], name='variants_gene_cpra_idx'),
+            models.Index(fields=['alt_chrom_pos_ref_alt'], name='variants_alt_cpra_idx'),
+            # Region lookups (see api.partitioning.parse_region)
+            models.Index(fields=['chr', 'start_pos'], name='variants_chr_start_idx'),
+            models.Index(Upper('hgvsg_id'), name='variants_upper_hgvsg_idx'),
+            models.Index(Upper('alt_hgvsg_id'), name='variants_upper_alt_hgvsg_idx'),
+            models.Index(Upper('refseq_hgvsg_id'), name='variants_upper_rs_hgvsg_idx'),
+            models.Index(Upper('lrg_hgvsg_id'), name='variants_upper_lrg_hgvsg_idx'),
+        ]
+
+    def __str__(self):
+        return self.chrom_pos_ref_alt
+
+
+class VariantKey(models.Model):
+    """Normalized chrom-pos-ref-alt keys (see api.normalize) of a variant on both assemblies.
+    Kept up to date on save (see api.signals), rebuilt by the build_variant_keys management command after writes
+    which send no signals (bulk_create, update(), raw SQL)."""
+    ASSEMBLIES = (
+        ('hg19', 'GRCh37/hg19'),
+        ('hg38', 'GRCh38/hg38'),
+    )
+    key = models.TextField(db_index=True)
+    assembly = models.CharField(max_length=4, choices=ASSEMBLIES)
+    variant = models.ForeignKey(Variants, on_delete=models.CASCADE, related_name='keys')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['variant', 'assembly'], name='variant_key_unique_assembly'),
+        ]
 
 
 class AnnovarData(models.Model):
+    """Annovar annotations of a variant, as imported. The scores and predictions are text, with "." for missing
+    values and sometimes several values: their typed copies for filtering are in AnnovarScores."""
     variant = models.ForeignKey(Variants, blank=False, null=False, on_delete=models.CASCADE, related_name='annovar')
+    # Chromosome of the variant, the partition key of the partitioned table (see api.partitioning).
+    # Set from the variant when the row is saved.
+    chr = models.TextField(blank=True, default='')
     func_ref_gene = models.CharField(max_length=50)
     gene_ref_gene = models.CharField(max_length=150)
     gene_detail_ref_gene = models.TextField(null=True, blank=True)
@@ -238,3 +330,160 @@ class AnnovarData(models.Model):
     clndisdb = models.TextField(null=True, blank=True)
     clnrevstat = models.TextField(null=True, blank=True)
     clnsig = models.TextField(null=True, blank=True)
+
+
+class AnnovarScores(models.Model):
+    """Typed Annovar scores and predictions of an AnnovarData row, parsed from its text columns so that they
+    can be filtered by range (see api.annovar_scores)."""
+    annovar = models.OneToOneField(AnnovarData, primary_key=True, on_delete=models.CASCADE, related_name='scores')
+    ex_ac_all = models.FloatField(null=True, blank=True)
+    gnomad_exome_af_popmax = models.FloatField(null=True, blank=True)
+    gnomad_genome_af = models.FloatField(null=True, blank=True)
+    sift_score = models.FloatField(null=True, blank=True)
+    sift_converted_rankscore = models.FloatField(null=True, blank=True)
+    polyphen_2_hdiv_score = models.FloatField(null=True, blank=True)
+    polyphen_2_hdiv_rankscore = models.FloatField(null=True, blank=True)
+    polyphen_2_hvar_score = models.FloatField(null=True, blank=True)
+    polyphen_2_hvar_rankscore = models.FloatField(null=True, blank=True)
+    lrt_score = models.FloatField(null=True, blank=True)
+    lrt_converted_rankscore = models.FloatField(null=True, blank=True)
+    mutation_taster_score = models.FloatField(null=True, blank=True)
+    mutation_taster_converted_rankscore = models.FloatField(null=True, blank=True)
+    mutation_assessor_score = models.FloatField(null=True, blank=True)
+    mutation_assessor_score_rankscore = models.FloatField(null=True, blank=True)
+    fathmm_score = models.FloatField(null=True, blank=True)
+    fathmm_converted_rankscore = models.FloatField(null=True, blank=True)
+    provean_score = models.FloatField(null=True, blank=True)
+    provean_converted_rankscore = models.FloatField(null=True, blank=True)
+    vest_3_score = models.FloatField(null=True, blank=True)
+    vest_3_rankscore = models.FloatField(null=True, blank=True)
+    meta_svm_score = models.FloatField(null=True, blank=True)
+    meta_svm_rankscore = models.FloatField(null=True, blank=True)
+    meta_lr_score = models.FloatField(null=True, blank=True)
+    meta_lr_rankscore = models.FloatField(null=True, blank=True)
+    m_cap_score = models.FloatField(null=True, blank=True)
+    m_cap_rankscore = models.FloatField(null=True, blank=True)
+    revel_score = models.FloatField(null=True, blank=True)
+    revel_rankscore = models.FloatField(null=True, blank=True)
+    mut_pred_score = models.FloatField(null=True, blank=True)
+    mut_pred_rankscore = models.FloatField(null=True, blank=True)
+    cadd_raw = models.FloatField(null=True, blank=True)
+    cadd_raw_rankscore = models.FloatField(null=True, blank=True)
+    cadd_phred = models.FloatField(null=True, blank=True)
+    dann_score = models.FloatField(null=True, blank=True)
+    dann_rankscore = models.FloatField(null=True, blank=True)
+    fathmm_mkl_coding_score = models.FloatField(null=True, blank=True)
+    fathmm_mkl_coding_rankscore = models.FloatField(null=True, blank=True)
+    eigen_raw = models.FloatField(null=True, blank=True)
+    eigen_pc_raw = models.FloatField(null=True, blank=True)
+    geno_canyon_score = models.FloatField(null=True, blank=True)
+    geno_canyon_score_rankscore = models.FloatField(null=True, blank=True)
+    integrated_fit_cons_score = models.FloatField(null=True, blank=True)
+    integrated_fit_cons_score_rankscore = models.FloatField(null=True, blank=True)
+    integrated_confidence_value = models.FloatField(null=True, blank=True)
+    gerp_rs = models.FloatField(null=True, blank=True)
+    gerp_rs_rankscore = models.FloatField(null=True, blank=True)
+    phylo_p_100_way_vertebrate = models.FloatField(null=True, blank=True)
+    phylo_p_100_way_vertebrate_rankscore = models.FloatField(null=True, blank=True)
+    phylo_p_20_way_mammalian = models.FloatField(null=True, blank=True)
+    phylo_p_20_way_mammalian_rankscore = models.FloatField(null=True, blank=True)
+    phast_cons_100_way_vertebrate = models.FloatField(null=True, blank=True)
+    phast_cons_100_way_vertebrate_rankscore = models.FloatField(null=True, blank=True)
+    phast_cons_20_way_mammalian = models.FloatField(null=True, blank=True)
+    phast_cons_20_way_mammalian_rankscore = models.FloatField(null=True, blank=True)
+    si_phy_29_way_log_odds = models.FloatField(null=True, blank=True)
+    si_phy_29_way_log_odds_rankscore = models.FloatField(null=True, blank=True)
+    sift_pred = models.CharField(max_length=1, choices=annovar_scores.PRED_CHOICES, null=True, blank=True)
+    polyphen_2_hdiv_pred = models.CharField(max_length=1, choices=annovar_scores.PRED_CHOICES, null=True, blank=True)
+    polyphen_2_hvar_pred = models.CharField(max_length=1, choices=annovar_scores.PRED_CHOICES, null=True, blank=True)
+    lrt_pred = models.CharField(max_length=1, choices=annovar_scores.PRED_CHOICES, null=True, blank=True)
+    mutation_taster_pred = models.CharField(max_length=1, choices=annovar_scores.PRED_CHOICES, null=True, blank=True)
+    mutation_assessor_pred = models.CharField(max_length=1, choices=annovar_scores.PRED_CHOICES, null=True, blank=True)
+    fathmm_pred = models.CharField(max_length=1, choices=annovar_scores.PRED_CHOICES, null=True, blank=True)
+    provean_pred = models.CharField(max_length=1, choices=annovar_scores.PRED_CHOICES, null=True, blank=True)
+    meta_svm_pred = models.CharField(max_length=1, choices=annovar_scores.PRED_CHOICES, null=True, blank=True)
+    meta_lr_pred = models.CharField(max_length=1, choices=annovar_scores.PRED_CHOICES, null=True, blank=True)
+    m_cap_pred = models.CharField(max_length=1, choices=annovar_scores.PRED_CHOICES, null=True, blank=True)
+    fathmm_mkl_coding_pred = models.CharField(max_length=1, choices=annovar_scores.PRED_CHOICES, null=True, blank=True)
+    # float32 array of the scores in annovar_scores.SCORE_FIELDS order, with settings.ANNOVAR_PACKED_SCORES.
+    packed = models.BinaryField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['cadd_phred'], name='annovar_cadd_phred_idx'),
+            models.Index(fields=['revel_score'], name='annovar_revel_idx'),
+            models.Index(fields=['sift_score'], name='annovar_sift_idx'),
+            models.Index(fields=['polyphen_2_hdiv_score'], name='annovar_polyphen_hdiv_idx'),
+            models.Index(fields=['gerp_rs'], name='annovar_gerp_rs_idx'),
+            models.Index(fields=['gnomad_exome_af_popmax'], name='annovar_gnomad_exome_idx'),
+            models.Index(fields=['gnomad_genome_af'], name='annovar_gnomad_genome_idx'),
+        ]
+
+
+class IdentifierIndex(models.Model):
+    """Normalized identifiers (HGVS notations and accessions, see api.normalize) pointing to the variant,
+    transcript or amino acid change owning them. Built by the build_identifier_index management command, which must
+    be run after migrating and after bulk writes; the entries of the rows saved or deleted one by one and of the
+    amino acid changes created by the consequence importer are kept up to date."""
+    identifier = models.TextField(db_index=True)
+    source = models.CharField(max_length=50)
+    variant = models.ForeignKey(Variants, blank=True, null=True, on_delete=models.CASCADE, related_name='+')
+    transcript = models.ForeignKey(Transcript, blank=True, null=True, on_delete=models.CASCADE, related_name='+')
+    aa_change = models.ForeignKey(AminoAcidChange, blank=True, null=True, on_delete=models.CASCADE, related_name='+')
+
+
+class ImportedRecord(models.Model):
+    """Content hash of a row imported from a spreadsheet, used to skip the unchanged rows of re-imports
+    (see api.imports). key identifies the row within its source sheet, object_id is the row it was written to."""
+    source = models.CharField(max_length=50)
+    key = models.TextField()
+    content_hash = models.CharField(max_length=32)
+    object_id = models.BigIntegerField()
+    imported = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'key'], name='imported_record_unique_key'),
+        ]
+
+
+class GeneStats(models.Model):
+    """Precomputed counts of a gene, kept up to date by api.signals and the importers (see api.stats)
+    and fully recomputed by the reconcile_stats management command."""
+    gene = models.OneToOneField(Genes, primary_key=True, on_delete=models.CASCADE, related_name='stats')
+    variant_count = models.IntegerField(default=0)
+    # [{"exonic_func": <Annovar ExonicFunc.refGene or null>, "count": <variants>}, ...]
+    exonic_func_counts = models.JSONField(default=list)
+    annotation_count = models.IntegerField(default=0)
+    aa_change_count = models.IntegerField(default=0)
+    aa_annotation_count = models.IntegerField(default=0)
+    # [{"diagnosis": <diagnosis category name or null>, "count": <gene and aa change annotations>}, ...]
+    diagnosis_counts = models.JSONField(default=list)
+    updated = models.DateTimeField(auto_now=True)
+
+
+class AAChangeStats(models.Model):
+    """Precomputed counts of an amino acid change, see GeneStats."""
+    aa_change = models.OneToOneField(AminoAcidChange, primary_key=True, on_delete=models.CASCADE, related_name='stats')
+    annotation_count = models.IntegerField(default=0)
+    gene_count = models.IntegerField(default=0)
+    transcript_count = models.IntegerField(default=0)
+    # [{"diagnosis": <diagnosis category name or null>, "count": <annotations>}, ...]
+    diagnosis_counts = models.JSONField(default=list)
+    updated = models.DateTimeField(auto_now=True)
+
+
+class AccessCount(models.Model):
+    """Number of requests of the cached detail payloads (see api.response_cache), used to warm the cache."""
+    kind = models.CharField(max_length=20)
+    key = models.TextField()
+    count = models.BigIntegerField(default=0)
+    last_access = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'key'], name='access_count_unique_key'),
+        ]
+        indexes = [
+            models.Index(fields=['kind', '-count'], name='access_count_top_idx'),
+        ]
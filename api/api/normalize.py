@@ -0,0 +1,49 @@
+"""
+Normalization of the identifiers used to look up variants, transcripts and amino acid changes.
+"""
+import re
+
+VERSION_SUFFIX = re.compile(r'\.\d+$')
+
+
+def normalize_identifier(identifier):
+    """Version-stripped, case-folded form of an accession or HGVS notation,
+    e.g. NM_004333.4:c.1799T>A -> nm_004333:c.1799t>a and ENST00000288602.6 -> enst00000288602.
+    """
+    identifier = str(identifier).strip().casefold()
+    accession, separator, notation = identifier.partition(':')
+    return VERSION_SUFFIX.sub('', accession) + separator + notation
+
+
+# chrom, pos, ref and alt separated by "-", ":", "_", whitespace, or "/" and ">" between the alleles.
+# Empty alleles are written "-" (or ".") or left empty, e.g. 7-140453136-AT-- or chr7:140453136:AT:.
+CPRA_PATTERN = re.compile(
+    r'^(?:chr)?([0-9]{1,2}|X|Y|MT?)[-:_\s]+(\d+)[-:_\s]+([ACGTN]+|[-.]?)[-:_/>\s]([ACGTN]+|[-.]?)$',
+    re.IGNORECASE,
+)
+EMPTY_ALLELE = '-'
+
+
+def normalize_cpra(cpra):
+    """Canonical chrom-pos-ref-alt key of a variant, e.g. chr7:140453136:a>t -> 7-140453136-A-T.
+
+    The "chr" prefix and case are normalized, and the bases shared by both alleles are trimmed, first at the end
+    then at the start (moving the position), so that 7-140453135-CA-CT and 7-140453136-A-T are the same key.
+    Raises ValueError if the string is not a chrom-pos-ref-alt.
+    """
+    match = CPRA_PATTERN.match(str(cpra).strip())
+    if not match:
+        raise ValueError("%s is not a chrom-pos-ref-alt" % cpra)
+    chrom, pos, ref, alt = match.groups()
+    chrom = chrom.upper()
+    if chrom == 'M':
+        chrom = 'MT'
+    pos = int(pos)
+    ref = ref.upper().strip('-.')
+    alt = alt.upper().strip('-.')
+    while ref and alt and ref[-1] == alt[-1]:
+        ref, alt = ref[:-1], alt[:-1]
+    while ref and alt and ref[0] == alt[0]:
+        ref, alt = ref[1:], alt[1:]
+        pos += 1
+    return "%s-%s-%s-%s" % (chrom, pos, ref or EMPTY_ALLELE, alt or EMPTY_ALLELE)
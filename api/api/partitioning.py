@@ -0,0 +1,258 @@
+"""
+Optional PostgreSQL list partitioning of the Variants and AnnovarData tables by chromosome (VARIANT_PARTITIONING).
+
+partition_table() converts a table in one transaction: the rows are copied into a table partitioned by LIST (chr)
+with one partition per chromosome (accepting "7" and "chr7") and a default partition, then the indexes, unique
+constraints and foreign keys are created again on the partitioned table, which builds them on every partition.
+
+Postgres requires the partition key in the primary key and the unique constraints of a partitioned table:
+the primary key becomes (id, chr) and Variants.md5sum is unique per chromosome. Foreign keys referencing the
+partitioned tables (AnnovarData.variant, VariantKey.variant, AnnovarScores.annovar, ...) cannot be kept and are
+dropped, Django still maintains the relations and cascades.
+
+Queries only skip partitions when they filter on chr: variant_keys.variants_by_cpra() and the region filter of
+the variant list add the chromosome of the CPRA or region (chromosome_values). The reload_partition and
+reindex_partition management commands work on the partition of one chromosome, leaving the others usable.
+"""
+import logging
+import re
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+
+from api import models
+
+logger = logging.getLogger(__name__)
+
+CHROMOSOMES = [str(number) for number in range(1, 23)] + ['X', 'Y', 'MT']
+
+PARTITIONED_MODELS = (models.Variants, models.AnnovarData)
+
+PARTITION_KEY = 'chr'
+
+DEFAULT_PARTITION_SUFFIX = 'other'
+
+REGION_PATTERN = re.compile(r'^(?:chr)?([0-9]{1,2}|X|Y|MT?)[:\-_\s]+(\d+)[-_\s]+(\d+)$', re.IGNORECASE)
+
+
+def chromosome(chrom):
+    """Canonical chromosome, e.g. chr7 -> 7 and chrM -> MT."""
+    chrom = str(chrom).strip()
+    if chrom.lower().startswith('chr'):
+        chrom = chrom[3:]
+    chrom = chrom.upper()
+    return 'MT' if chrom == 'M' else chrom
+
+
+def chromosome_values(chrom):
+    """Values of the chr column of a chromosome, the values of its partition."""
+    chrom = chromosome(chrom)
+    return [chrom, 'chr' + chrom] + (['M', 'chrM'] if chrom == 'MT' else [])
+
+
+def parse_region(region):
+    """(chromosome, start, end) of a region such as 7:140453000-140454000. Raises ValueError."""
+    match = REGION_PATTERN.match(str(region).strip())
+    if not match:
+        raise ValueError(f"{region} is not a region, e.g. 7:140453000-140454000")
+    chrom, start, end = match.groups()
+    start, end = int(start), int(end)
+    if start > end:
+        raise ValueError(f"The region {region} ends before it starts.")
+    return chromosome(chrom), start, end
+
+
+def partition_name(model, chrom=None):
+    suffix = chromosome(chrom).lower() if chrom else DEFAULT_PARTITION_SUFFIX
+    return f'{model._meta.db_table}_chr_{suffix}'
+
+
+def is_partitioned(model):
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)', [model._meta.db_table])
+        return cursor.fetchone() is not None
+
+
+def partitioning_enabled():
+    """Whether queries should add the partition key, i.e. VARIANT_PARTITIONING on PostgreSQL."""
+    return settings.VARIANT_PARTITIONING and connection.vendor == 'postgresql'
+
+
+def _table_definitions(cursor, table):
+    """(indexes, unique constraints, foreign keys, referencing foreign keys) of a table as SQL definitions."""
+    cursor.execute(
+        'SELECT pg_get_indexdef(x.indexrelid) FROM pg_index x WHERE x.indrelid = %s::regclass '
+        'AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = x.indexrelid)', [table]
+    )
+    indexes = [row[0] for row in cursor.fetchall()]
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'u'",
+        [table]
+    )
+    uniques = cursor.fetchall()
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+        [table]
+    )
+    foreign_keys = cursor.fetchall()
+    cursor.execute(
+        "SELECT conrelid::regclass::text, conname FROM pg_constraint WHERE confrelid = %s::regclass AND contype = 'f' "
+        "AND conrelid <> confrelid", [table]
+    )
+    referencing = cursor.fetchall()
+    return indexes, uniques, foreign_keys, referencing
+
+
+def partition_table(model, chromosomes=CHROMOSOMES):
+    """Converts the table of a model to a table partitioned by chromosome, in one transaction holding an
+    exclusive lock on the table. Returns the foreign keys referencing the table which were dropped."""
+    if is_partitioned(model):
+        return []
+    table = model._meta.db_table
+    quote = connection.ops.quote_name
+    old = f'{table}_unpartitioned'
+    sequence = f'{table}_partitioned_id_seq'
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {quote(table)} IN ACCESS EXCLUSIVE MODE')
+        indexes, uniques, foreign_keys, referencing = _table_definitions(cursor, table)
+        cursor.execute(f'ALTER TABLE {quote(table)} RENAME TO {quote(old)}')
+        cursor.execute(
+            f'CREATE TABLE {quote(table)} (LIKE {quote(old)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE) '
+            f'PARTITION BY LIST ({quote(PARTITION_KEY)})'
+        )
+        # The serial or identity sequence of the id belongs to the old table.
+        cursor.execute(f'CREATE SEQUENCE {quote(sequence)} OWNED BY {quote(table)}.id')
+        cursor.execute(f"ALTER TABLE {quote(table)} ALTER COLUMN id SET DEFAULT nextval('{sequence}')")
+        for chrom in chromosomes:
+            values = ', '.join(f"'{value}'" for value in chromosome_values(chrom))
+            cursor.execute(f'CREATE TABLE {quote(partition_name(model, chrom))} PARTITION OF {quote(table)} FOR VALUES IN ({values})')
+        cursor.execute(f'CREATE TABLE {quote(partition_name(model))} PARTITION OF {quote(table)} DEFAULT')
+        cursor.execute(f'INSERT INTO {quote(table)} SELECT * FROM {quote(old)}')
+        cursor.execute(f"SELECT setval('{sequence}', COALESCE((SELECT MAX(id) FROM {quote(table)}), 0) + 1, false)")
+        # Also drops the foreign keys referencing the old table, which a partitioned table cannot keep.
+        cursor.execute(f'DROP TABLE {quote(old)} CASCADE')
+        # Indexes are built once the rows are copied, on every partition.
+        cursor.execute(f'ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(table + "_pkey")} PRIMARY KEY (id, {quote(PARTITION_KEY)})')
+        for name, definition in uniques:
+            # UNIQUE (md5sum) -> UNIQUE (md5sum, chr)
+            definition = definition[:definition.rindex(')')] + f', {quote(PARTITION_KEY)})'
+            cursor.execute(f'ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(name)} {definition}')
+        for definition in indexes:
+            cursor.execute(definition)
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(name)} {definition}')
+        cursor.execute(f'ANALYZE {quote(table)}')
+    for referencing_table, name in referencing:
+        logger.warning(f"Dropped the foreign key {name} of {referencing_table}, which referenced {table}")
+    return referencing
+
+
+def partition_tables():
+    """Partitions the Variants and AnnovarData tables unless they are. Returns {table: dropped foreign keys}."""
+    return {model._meta.db_table: partition_table(model) for model in PARTITIONED_MODELS}
+
+
+def partitions(model):
+    """[(partition, bounds, estimated rows)] of the table of a model."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), c.reltuples::bigint FROM pg_inherits i '
+            'JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = %s::regclass ORDER BY c.relname',
+            [model._meta.db_table]
+        )
+        return cursor.fetchall()
+
+
+def partition_model(label):
+    for model in PARTITIONED_MODELS:
+        if label in (model._meta.model_name, model._meta.db_table):
+            return model
+    raise ValueError(f"{label} is not a partitioned model, choose from "
+                     f"{', '.join(model._meta.model_name for model in PARTITIONED_MODELS)}")
+
+
+def _load_staging(cursor, partition, staging, columns, values, csv_file):
+    """Copies the CSV file into the staging table, checked against the bounds of the partition first so that a
+    row of another chromosome fails the copy."""
+    quote = connection.ops.quote_name
+    cursor.execute(f'ALTER TABLE {quote(staging)} ADD CONSTRAINT {quote(staging + "_bounds")} '
+                   f'CHECK ({quote(PARTITION_KEY)} IS NOT NULL AND {quote(PARTITION_KEY)} IN ({values}))')
+    cursor.cursor.copy_expert(f'COPY {quote(staging)} ({columns}) FROM STDIN WITH CSV HEADER', csv_file)
+
+
+def _build_staging_indexes(cursor, partition, staging):
+    """Builds the indexes of the partition on the staging table. Built before the swap, the attach adopts them
+    as the partitions of the indexes of the table: the indexes of the primary key and unique constraints must
+    back constraints too, or the attach builds them again. Returns [(staging index, partition index)]."""
+    quote = connection.ops.quote_name
+    cursor.execute(
+        'SELECT i.relname, pg_get_indexdef(i.oid), c.contype FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid '
+        'LEFT JOIN pg_constraint c ON c.conindid = i.oid AND c.conrelid = x.indrelid WHERE x.indrelid = %s::regclass',
+        [partition]
+    )
+    renames = []
+    for number, (name, definition, constraint_type) in enumerate(cursor.fetchall()):
+        staging_index = f'{staging}_{number}_idx'
+        definition = re.sub(r'^(CREATE (?:UNIQUE )?INDEX) \S+ ON (?:ONLY )?\S+',
+                            lambda match: f'{match.group(1)} {quote(staging_index)} ON {quote(staging)}', definition)
+        cursor.execute(definition)
+        if constraint_type in ('p', 'u'):
+            constraint = 'PRIMARY KEY' if constraint_type == 'p' else 'UNIQUE'
+            cursor.execute(f'ALTER TABLE {quote(staging)} ADD CONSTRAINT {quote(staging_index)} '
+                           f'{constraint} USING INDEX {quote(staging_index)}')
+        renames.append((staging_index, name))
+    return renames
+
+
+def reload_partition(model, chrom, csv_file):
+    """Replaces the partition of a chromosome with the rows of a CSV file with a header of column names
+    (e.g. written by COPY ... TO STDOUT WITH CSV HEADER). Returns the number of rows loaded.
+
+    The rows are loaded into a new table with the indexes of the partition built after the load, without
+    locks on the partitioned table. The swap then detaches the old partition and attaches the new one in a
+    short transaction: the CHECK constraint matching the partition bounds spares the scan of the attach.
+    The ids are kept from the file, so that the rows referencing them stay valid.
+    """
+    table = model._meta.db_table
+    quote = connection.ops.quote_name
+    partition = partition_name(model, chrom)
+    staging = f'{partition}_reload'
+    values = ', '.join(f"'{value}'" for value in chromosome_values(chrom))
+    header = csv_file.readline()
+    columns = ', '.join(quote(column.strip()) for column in header.strip().split(','))
+    csv_file.seek(0)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {quote(staging)}')
+        cursor.execute(f'CREATE TABLE {quote(staging)} (LIKE {quote(partition)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE)')
+        try:
+            _load_staging(cursor, partition, staging, columns, values, csv_file)
+            renames = _build_staging_indexes(cursor, partition, staging)
+        except DatabaseError:
+            cursor.execute(f'DROP TABLE IF EXISTS {quote(staging)}')
+            raise
+        cursor.execute(f'SELECT COUNT(*) FROM {quote(staging)}')
+        count = cursor.fetchone()[0]
+        with transaction.atomic():
+            cursor.execute(f'ALTER TABLE {quote(table)} DETACH PARTITION {quote(partition)}')
+            cursor.execute(f'ALTER TABLE {quote(table)} ATTACH PARTITION {quote(staging)} FOR VALUES IN ({values})')
+            cursor.execute(f'DROP TABLE {quote(partition)}')
+            cursor.execute(f'ALTER TABLE {quote(staging)} RENAME TO {quote(partition)}')
+            for staging_index, name in renames:
+                cursor.execute(f'ALTER INDEX {quote(staging_index)} RENAME TO {quote(name)}')
+            cursor.execute(f'ALTER TABLE {quote(partition)} DROP CONSTRAINT {quote(staging + "_bounds")}')
+        cursor.execute(f'ANALYZE {quote(partition)}')
+    return count
+
+
+def reindex_partition(model, chrom, vacuum=False):
+    """Rebuilds the indexes of the partition of a chromosome without blocking its reads and writes
+    (REINDEX CONCURRENTLY, PostgreSQL 12), then optionally vacuums it. Must run outside of a transaction."""
+    partition = partition_name(model, chrom)
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(f'REINDEX TABLE CONCURRENTLY {quote(partition)}')
+        if vacuum:
+            cursor.execute(f'VACUUM (ANALYZE) {quote(partition)}')
+    return partition
@@ -0,0 +1,195 @@
+"""
+Cache of the gene, amino acid change and variant detail payloads, and the access counts used to warm it.
+
+Payloads are stored in the default cache (settings.CACHES, shared by the workers and kept across worker
+recycles) under a key holding the current data version. Every change of the data bumps the version
+(see api.signals), which invalidates all payloads at once.
+
+Payloads are stored as their JSON compressed once with gzip and, when the brotli package is installed, brotli
+(compress_payload), so that responses are sent in the encoding negotiated with Accept-Encoding
+(negotiate_encoding) without being rendered or compressed again.
+
+Responses carry an ETag made of the data version (payload_etag), so that clients holding a payload can
+revalidate it with If-None-Match without the payload being built or read. Concurrent requests of a missing
+payload wait for the one building it (see api.singleflight).
+
+Each worker counts the payloads it serves and adds the counts to the AccessCount table every
+ACCESS_FLUSH_SECONDS. The warm_cache management command builds the payloads of the most requested keys. The
+read-only snapshot databases (settings.SNAPSHOT_MODE) have no AccessCount table, nothing is counted there.
+"""
+import gzip
+import hashlib
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, transaction
+from django.db.models import F, Sum
+from rest_framework.renderers import JSONRenderer
+
+from api import models, singleflight
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+DATA_VERSION_KEY = 'crowdseq:data_version'
+ACCESS_FLUSH_SECONDS = 60
+ACCESS_FLUSH_COUNT = 1000
+
+# Content codings of the stored payloads, by order of preference.
+PAYLOAD_ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+_access_counts = Counter()
+_access_total = 0
+_access_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def data_version():
+    version = cache.get(DATA_VERSION_KEY)
+    if version is None:
+        cache.add(DATA_VERSION_KEY, 1, timeout=None)
+        version = cache.get(DATA_VERSION_KEY, 1)
+    return version
+
+
+def _bump_data_version():
+    try:
+        cache.incr(DATA_VERSION_KEY)
+    except ValueError:
+        # The key expired or was evicted, any new value invalidates the payloads.
+        cache.set(DATA_VERSION_KEY, int(time.time()), timeout=None)
+
+
+def bump_data_version():
+    """Invalidates the cached payloads once the current transaction commits."""
+    transaction.on_commit(_bump_data_version)
+
+
+def payload_key(kind, key, version=None):
+    digest = hashlib.md5(str(key).encode()).hexdigest()
+    return f'crowdseq:document:{version or data_version()}:{kind}:{digest}'
+
+
+def payload_etag(kind, key, encoding=None):
+    """ETag of the payload of a key in an encoding, which changes with the data version."""
+    digest = hashlib.md5(f'{kind}:{key}'.encode()).hexdigest()[:16]
+    return f'"{data_version()}-{digest}{"-" + encoding if encoding else ""}"'
+
+
+def compress_payload(payload):
+    """Document of a payload stored in the cache: {encoding: the JSON of the payload, rendered as the API does,
+    compressed}."""
+    return compress_json(JSONRenderer().render(payload))
+
+
+def compress_json(body):
+    document = {'gzip': gzip.compress(body, compresslevel=settings.PAYLOAD_GZIP_LEVEL, mtime=0)}
+    if brotli is not None:
+        document['br'] = brotli.compress(body, mode=brotli.MODE_TEXT, quality=settings.PAYLOAD_BROTLI_QUALITY)
+    return document
+
+
+def payload_json(document):
+    """JSON of a payload document, for the clients accepting none of its encodings."""
+    return gzip.decompress(document['gzip'])
+
+
+def negotiate_encoding(accept_encoding):
+    """Preferred encoding of PAYLOAD_ENCODINGS accepted by an Accept-Encoding header, None for none of them."""
+    qualities = {}
+    for coding in accept_encoding.split(','):
+        coding, _, params = coding.partition(';')
+        name, _, quality = params.strip().partition('=')
+        try:
+            qualities[coding.strip().lower()] = float(quality) if name.strip() == 'q' else 1.0
+        except ValueError:
+            continue
+    best, best_quality = None, 0
+    for encoding in PAYLOAD_ENCODINGS:
+        quality = qualities.get(encoding, qualities.get('*', 0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def get_payload(kind, key, build, record=True):
+    """Cached payload document of a key (see compress_payload), built with build(key) when missing.
+    Payloads which are None are not cached."""
+    if record:
+        record_access(kind, key)
+    cache_key = payload_key(kind, key)
+    payload = cache.get(cache_key)
+    if payload is None:
+        # The concurrent requests of a missing payload wait for the one building it.
+        payload = singleflight.coalesce(cache_key, lambda: _build_payload(cache_key, key, build))
+    return payload
+
+
+def _build_payload(cache_key, key, build):
+    payload = build(key)
+    if payload is None:
+        return None
+    document = compress_payload(payload)
+    cache.set(cache_key, document, timeout=settings.RESPONSE_CACHE_TIMEOUT)
+    return document
+
+
+def warm_payload(kind, key, build):
+    """Builds and caches the payload of a key unless it is cached. Returns "cached", "built" or "missing"."""
+    cache_key = payload_key(kind, key)
+    if cache.get(cache_key) is not None:
+        return 'cached'
+    if _build_payload(cache_key, key, build) is None:
+        return 'missing'
+    return 'built'
+
+
+def _counting_accesses():
+    return not getattr(settings, 'SNAPSHOT_MODE', False)
+
+
+def record_access(kind, key):
+    global _access_total, _last_flush
+    if not _counting_accesses():
+        return
+    with _access_lock:
+        _access_counts[(kind, str(key))] += 1
+        _access_total += 1
+        if _access_total < ACCESS_FLUSH_COUNT and time.monotonic() - _last_flush < ACCESS_FLUSH_SECONDS:
+            return
+        counts = dict(_access_counts)
+        _access_counts.clear()
+        _access_total = 0
+        _last_flush = time.monotonic()
+    flush_access_counts(counts)
+
+
+def flush_access_counts(counts):
+    """Adds counts of (kind, key) to the AccessCount table. Failures only lose the counts."""
+    if not _counting_accesses():
+        return
+    try:
+        for (kind, key), count in counts.items():
+            updated = models.AccessCount.objects.filter(kind=kind, key=key).update(count=F('count') + count)
+            if not updated:
+                models.AccessCount.objects.bulk_create([models.AccessCount(kind=kind, key=key, count=count)],
+                                                       ignore_conflicts=True)
+    except DatabaseError as exc:
+        logger.warning("Could not save the access counts: %s" % exc)
+
+
+def top_keys(kind, count):
+    """(key, count) of the most requested keys of a kind."""
+    return list(models.AccessCount.objects.filter(kind=kind).order_by('-count').values_list('key', 'count')[:count])
+
+
+def total_accesses(kind):
+    return models.AccessCount.objects.filter(kind=kind).aggregate(total=Sum('count'))['total'] or 0
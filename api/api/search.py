@@ -0,0 +1,412 @@
+"""
+Ranked search over genes, amino acid changes and variants.
+
+Each search term is classified (gene symbol, HGVS g./c./p. notation, CPRA, Ensembl or RefSeq id...) with
+precompiled patterns and only matched against the columns relevant to its type, so that "BRAF V600E" looks
+for a gene BRAF and an amino acid change V600E instead of every column containing "V" or "600".
+
+Results are scored per term, exact (3) > prefix (2) > substring (1), the scores of all terms are summed
+and each result list is ordered by decreasing score.
+
+The search is made of independent per-table sub-queries, so that the synchronous endpoint can run
+them one after another while the asynchronous endpoint runs them concurrently.
+
+The ids of the results are cached per normalized token set (see normalize_tokens) under the data version
+of api.response_cache, which imports bump. Searches without results, mostly misspelled terms, are cached
+for SEARCH_CACHE_EMPTY_TIMEOUT only, so that rows added by later edits are found soon. Concurrent identical
+searches run once (see api.singleflight).
+"""
+import asyncio
+import hashlib
+import json
+import re
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.db.models import Case, Exists, IntegerField, Max, Min, OuterRef, Q, Value, When
+from django.db.models.functions import Upper
+
+from api import models, response_cache, singleflight, snapshot
+from api.variant_keys import try_normalize_cpra
+
+EXACT = 3
+PREFIX = 2
+SUBSTRING = 1
+
+# Maximum number of results of each entity type.
+SEARCH_RESULT_LIMIT = 50
+
+# Ordered, the first matching pattern gives the token type. Anything else is "text".
+TOKEN_PATTERNS = (
+    ('cpra', re.compile(r'^(?:chr)?([0-9]{1,2}|X|Y|MT?)[-:_](\d+)[-:_]([ACGTN]+|-)[-:_/>]([ACGTN]+|-)$', re.IGNORECASE)),
+    ('position', re.compile(r'^(?:chr)?([0-9]{1,2}|X|Y|MT?)[-:_](\d+)$', re.IGNORECASE)),
+    ('hgvs_g', re.compile(r'^(?:[A-Z]{2}_\d+(?:\.\d+)?:)?g\.\S+$', re.IGNORECASE)),
+    ('hgvs_c', re.compile(r'^(?:[A-Z_]+\d+(?:\.\d+)?:)?[cn]\.\S+$', re.IGNORECASE)),
+    ('hgvs_p', re.compile(r'^(?:[A-Z_]+\d+(?:\.\d+)?:)?p\.\S+$', re.IGNORECASE)),
+    ('ensembl_gene', re.compile(r'^ENSG\d+(?:\.\d+)?$', re.IGNORECASE)),
+    ('ensembl_transcript', re.compile(r'^ENST\d+(?:\.\d+)?$', re.IGNORECASE)),
+    ('ensembl_protein', re.compile(r'^ENSP\d+(?:\.\d+)?$', re.IGNORECASE)),
+    ('refseq_transcript', re.compile(r'^[NX][MR]_\d+(?:\.\d+)?$', re.IGNORECASE)),
+    # V600E, Val600Glu, G12fs, E746del...
+    ('protein_change', re.compile(r'^(?:[A-Z]|[A-Z][a-z]{2})\d+(?:[A-Z]|[A-Z][a-z]{2}|\*|=|fs\S*|del\S*|ins\S*|dup\S*)$')),
+    # V600, Val600
+    ('protein_position', re.compile(r'^(?:[A-Z]|[A-Z][a-z]{2})\d+$')),
+)
+
+VERSION_SUFFIX = re.compile(r'\.\d+$')
+
+# Relations serialized by serializers.VariantSerializer
+VARIANT_PREFETCHES = ('gene', 'gene__annotations', 'transcripts', 'transcripts__aa_changes')
+
+VARIANT_CPRA_FIELDS = ('chrom_pos_ref_alt', 'alt_chrom_pos_ref_alt')
+VARIANT_HGVSG_FIELDS = ('hgvsg_id', 'alt_hgvsg_id', 'refseq_hgvsg_id', 'lrg_hgvsg_id')
+TRANSCRIPT_HGVSC_FIELDS = ('transcripts__hgvsc__hgvsc_id', 'transcripts__refseq_transcripts__hgvsc__hgvsc_id',
+                           'transcripts__lrg_transcripts__hgvsc__hgvsc_id')
+
+
+def split_search_terms(search_term):
+    """Splits the search string on spaces, dropping blank and duplicated terms."""
+    terms = []
+    for term in search_term.split(' '):
+        if term and term not in terms:
+            terms.append(term)
+    return terms
+
+
+def classify_token(token):
+    for token_type, pattern in TOKEN_PATTERNS:
+        if pattern.match(token):
+            return token_type
+    return 'text'
+
+
+def classify_tokens(search_terms):
+    """Returns the list of (token type, token) of the search terms."""
+    return [(classify_token(term), term) for term in search_terms]
+
+
+def normalize_tokens(search_terms):
+    """Case-folded (token type, token) of the search terms, sorted and without duplicates.
+
+    The terms are classified before being case-folded, as protein changes (V600E) are told apart from text by
+    their case. The sub-queries only use case-insensitive lookups, so "BRAF V600E", "V600E braf" and
+    "braf V600E BRAF" have the same results.
+    """
+    return sorted({(token_type, token.casefold()) for token_type, token in classify_tokens(search_terms)})
+
+
+def tokens_of_type(tokens, *token_types):
+    return [token for token_type, token in tokens if token_type in token_types]
+
+
+def normalize_position_token(token):
+    chrom, pos = TOKEN_PATTERNS[1][1].match(token).groups()
+    return "-".join((chrom, pos)).upper()
+
+
+def strip_version(token):
+    return VERSION_SUFFIX.sub('', token)
+
+
+def any_field(fields, lookup, value):
+    condition = Q()
+    for field in fields:
+        condition |= Q(**{f"{field}__{lookup}": value})
+    return condition
+
+
+def contains(model, fields, lookup, value):
+    """any_field() for a lookup implying that the field contains the value (icontains, iendswith...),
+    restricted to the rows found by the FTS tables of snapshots (see api.snapshot.fts_ids)."""
+    condition = any_field(fields, lookup, value)
+    ids = snapshot.fts_ids(model, fields, value)
+    if ids is not None:
+        condition &= Q(id__in=ids)
+    return condition
+
+
+class ScoredQuery:
+    """Accumulates the conditions matching each token, with their score.
+
+    The score of a token is the one of its best matching condition, the score of a row is the sum of the
+    scores of all tokens. Conditions on multi-valued relations must set aggregate, so that the score of a row
+    is computed over all its related rows.
+    """
+
+    def __init__(self, aggregate=False):
+        self.aggregate = aggregate
+        self.condition = Q()
+        self.token_scores = []
+
+    def add(self, matches):
+        """Adds the conditions matching a token, matches is a list of (condition, score)."""
+        matches = sorted(matches, key=lambda x: -x[1])
+        for condition, _ in matches:
+            self.condition |= condition
+        score = Case(*[When(condition, then=Value(score)) for condition, score in matches],
+                     default=Value(0), output_field=IntegerField())
+        self.token_scores.append(Max(score) if self.aggregate else score)
+
+    def __bool__(self):
+        return bool(self.token_scores)
+
+    def score(self):
+        total = self.token_scores[0]
+        for score in self.token_scores[1:]:
+            total = total + score
+        return total
+
+    def apply(self, queryset, *ordering):
+        """Filters the queryset on the conditions and orders it by decreasing score."""
+        matches = queryset.filter(self.condition)
+        if not self.aggregate:
+            matches = matches.annotate(search_score=self.score())
+            return list(matches.order_by('-search_score', *ordering)[:SEARCH_RESULT_LIMIT])
+        # Grouped on the id only, which PostgreSQL does not take for the primary key of the partitioned tables
+        # (id, chr, see api.partitioning): the ordering columns are aggregated too, then the rows read by id.
+        sort_keys = {f'sort_{number}': Min(field.lstrip('-')) for number, field in enumerate(ordering)}
+        sort_order = [('-' if field.startswith('-') else '') + f'sort_{number}'
+                      for number, field in enumerate(ordering)]
+        scores = matches.values('id').annotate(search_score=self.score(), **sort_keys)
+        scores = scores.order_by('-search_score', *sort_order)
+        scores = list(scores.values_list('id', 'search_score')[:SEARCH_RESULT_LIMIT])
+        rows = queryset.in_bulk([row_id for row_id, _ in scores])
+        ranked = []
+        for row_id, score in scores:
+            # Deleted since the scores were read.
+            row = rows.get(row_id)
+            if row is None:
+                continue
+            row.search_score = score
+            ranked.append(row)
+        return ranked
+
+
+def exact_gene_symbols(tokens):
+    """Tokens which may be a gene symbol, including ambiguous ones such as F2R (also a protein change)."""
+    return tokens_of_type(tokens, 'text', 'protein_change', 'protein_position')
+
+
+def searched_gene_ids(symbols):
+    """Subquery of the ids of the genes of the symbols, case-insensitive (C1orf112) using genes_upper_symbol_idx."""
+    return models.Genes.objects.annotate(upper_symbol=Upper('approved_symbol')).filter(
+        upper_symbol__in=[symbol.upper() for symbol in symbols]
+    ).values('id')
+
+
+def search_genes(tokens):
+    query = ScoredQuery()
+    for token_type, token in tokens:
+        if token_type == 'text':
+            matches = [(Q(approved_symbol__iexact=token), EXACT), (Q(approved_symbol__istartswith=token), PREFIX)]
+            if len(token) >= 2:
+                matches.append((contains(models.Genes, ('alias_symbols', 'previous_symbols'), 'icontains', token), SUBSTRING))
+            if len(token) >= 3:
+                matches.append((contains(models.Genes, ('approved_symbol',), 'icontains', token), SUBSTRING))
+            if len(token) >= 4:
+                matches.append((contains(models.Genes, ('approved_name',), 'icontains', token), SUBSTRING))
+            query.add(matches)
+        elif token_type in ('protein_change', 'protein_position'):
+            query.add([(Q(approved_symbol__iexact=token), EXACT)])
+        elif token_type == 'ensembl_gene':
+            token = strip_version(token)
+            query.add([(Q(ensembl_gene_id__iexact=token), EXACT), (Q(ensembl_gene_id__istartswith=token), PREFIX)])
+    if not query:
+        return []
+    return query.apply(models.Genes.objects.all(), 'approved_symbol')
+
+
+def search_aa_changes(tokens):
+    query = ScoredQuery()
+    for token_type, token in tokens:
+        if token_type == 'protein_change':
+            query.add([
+                (Q(short_name__iexact=token), EXACT),
+                (Q(long_name__iendswith=':p.' + token), EXACT),
+                (Q(short_name__istartswith=token), PREFIX),
+            ])
+        elif token_type == 'protein_position':
+            query.add([(Q(short_name__istartswith=token), PREFIX),
+                       (contains(models.AminoAcidChange, ('long_name',), 'icontains', ':p.' + token), SUBSTRING)])
+        elif token_type == 'hgvs_p':
+            accession, _, change = token.rpartition(':')
+            change = change[2:]
+            if accession:
+                query.add([(Q(long_name__iexact=token), EXACT), (Q(long_name__istartswith=token), PREFIX),
+                           (Q(long_name__istartswith=strip_version(accession) + '.', long_name__iendswith=':p.' + change), PREFIX)])
+            else:
+                query.add([(Q(short_name__iexact=change), EXACT), (Q(long_name__iendswith=':p.' + change), EXACT),
+                           (Q(short_name__istartswith=change), PREFIX)])
+        elif token_type == 'ensembl_protein':
+            query.add([(Q(long_name__istartswith=strip_version(token)), PREFIX)])
+    if not query:
+        return []
+    genes = exact_gene_symbols(tokens)
+    queryset = models.AminoAcidChange.objects.all()
+    if genes:
+        # Amino acid changes of a gene also being searched for ("BRAF V600E") rank first.
+        in_searched_gene = models.AminoAcidChange.genes.through.objects.filter(
+            aminoacidchange_id=OuterRef('pk'), genes_id__in=searched_gene_ids(genes)
+        )
+        query.token_scores.append(Case(When(Exists(in_searched_gene), then=Value(EXACT)), default=Value(0), output_field=IntegerField()))
+    return query.apply(queryset, 'short_name')
+
+
+def search_variants(tokens):
+    """Variants whose own identifiers match the search terms."""
+    query = ScoredQuery(aggregate=True)
+    for token_type, token in tokens:
+        if token_type == 'cpra':
+            key = try_normalize_cpra(token)
+            if key:
+                query.add([(Q(keys__key=key), EXACT)])
+        elif token_type == 'position':
+            query.add([(any_field(VARIANT_CPRA_FIELDS, 'startswith', normalize_position_token(token) + '-'), PREFIX)])
+        elif token_type == 'hgvs_g':
+            matches = [(any_field(VARIANT_HGVSG_FIELDS, 'iexact', token), EXACT)]
+            if ':' not in token:
+                matches.append((contains(models.Variants, VARIANT_HGVSG_FIELDS, 'iendswith', ':' + token), PREFIX))
+            else:
+                accession, _, change = token.partition(':')
+                matches.append((any_field(VARIANT_HGVSG_FIELDS, 'iendswith', ':' + change) &
+                                any_field(VARIANT_HGVSG_FIELDS, 'istartswith', strip_version(accession) + '.'), PREFIX))
+            query.add(matches)
+    if not query:
+        return []
+    return query.apply(models.Variants.objects.prefetch_related(*VARIANT_PREFETCHES), 'chrom_pos_ref_alt')
+
+
+def search_transcript_variants(tokens):
+    """Variants linked to a transcript matching the search terms,
+    or to an amino acid change matching the search terms on a gene also being searched for.
+    """
+    query = ScoredQuery(aggregate=True)
+    genes = exact_gene_symbols(tokens)
+    for token_type, token in tokens:
+        if token_type == 'ensembl_transcript':
+            token = strip_version(token)
+            query.add([(Q(transcripts__ensembl_transcript_id__iexact=token), EXACT),
+                       (Q(transcripts__ensembl_transcript_id__istartswith=token), PREFIX)])
+        elif token_type == 'refseq_transcript':
+            query.add([(Q(transcripts__refseq_transcripts__refseq_transcript_id__iexact=token), EXACT),
+                       (Q(transcripts__refseq_transcripts__refseq_transcript_id__istartswith=strip_version(token) + '.'), PREFIX)])
+        elif token_type == 'hgvs_c':
+            query.add([(any_field(TRANSCRIPT_HGVSC_FIELDS, 'iexact', token), EXACT)])
+        elif token_type == 'protein_change' and [gene for gene in genes if gene != token]:
+            in_searched_gene = Q(gene_id__in=searched_gene_ids([gene for gene in genes if gene != token]))
+            query.add([(in_searched_gene & Q(transcripts__aa_changes__short_name__iexact=token), EXACT)])
+    if not query:
+        return []
+    return query.apply(models.Variants.objects.prefetch_related(*VARIANT_PREFETCHES), 'chrom_pos_ref_alt')
+
+
+def merge_variants(*variant_lists):
+    """Merges lists of variants, keeping the best score of duplicates, and orders them by decreasing score."""
+    variants = {}
+    for variant_list in variant_lists:
+        for variant in variant_list:
+            if variant.id not in variants or variants[variant.id].search_score < variant.search_score:
+                variants[variant.id] = variant
+    ranked = sorted(variants.values(), key=lambda v: (-v.search_score, v.chrom_pos_ref_alt))
+    return ranked[:SEARCH_RESULT_LIMIT]
+
+
+def search_results(genes, aa_changes, variants):
+    """Packs the sub-query results in the structure expected by serializers.SearchSerializer."""
+    return {'search_genes': genes, 'search_aa_changes': aa_changes, 'search_variants': variants}
+
+
+def search_cache_key(tokens):
+    digest = hashlib.md5(json.dumps(tokens).encode()).hexdigest()
+    return f'crowdseq:search:{response_cache.data_version()}:{digest}'
+
+
+def cache_results(cache_key, results):
+    """Caches the ids of the results, for a short time if there are none. Returns the ids."""
+    ids = {name: [row.id for row in rows] for name, rows in results.items()}
+    empty = not any(ids.values())
+    cache.set(cache_key, ids, timeout=settings.SEARCH_CACHE_EMPTY_TIMEOUT if empty else settings.SEARCH_CACHE_TIMEOUT)
+    return ids
+
+
+def _in_order(queryset, ids):
+    rows = queryset.in_bulk(ids) if ids else {}
+    return [rows[row_id] for row_id in ids if row_id in rows]
+
+
+def results_from_ids(ids):
+    """Results of cached ids, in the cached order."""
+    return search_results(
+        _in_order(models.Genes.objects.all(), ids['search_genes']),
+        _in_order(models.AminoAcidChange.objects.all(), ids['search_aa_changes']),
+        _in_order(models.Variants.objects.prefetch_related(*VARIANT_PREFETCHES), ids['search_variants']),
+    )
+
+
+def cached_ids(tokens):
+    """(cache key, cached ids or None) of the tokens."""
+    cache_key = search_cache_key(tokens)
+    return cache_key, cache.get(cache_key)
+
+
+def _search_ids(tokens, cache_key):
+    results = search_results(
+        search_genes(tokens),
+        search_aa_changes(tokens),
+        merge_variants(search_variants(tokens), search_transcript_variants(tokens)),
+    )
+    return cache_results(cache_key, results)
+
+
+def run_search(search_terms):
+    """Runs the sub-queries one after another, unless the results of the search terms are cached.
+    Concurrent identical searches wait for the one running (see api.singleflight) and read its results by id.
+    """
+    tokens = normalize_tokens(search_terms)
+    if not tokens:
+        return search_results([], [], [])
+    cache_key, ids = cached_ids(tokens)
+    if ids is None:
+        ids = singleflight.coalesce(cache_key, lambda: _search_ids(tokens, cache_key))
+    return results_from_ids(ids)
+
+
+def _run_in_thread(func, tokens):
+    # Executor threads are reused between requests, expire their connections like a request would.
+    close_old_connections()
+    try:
+        return func(tokens)
+    finally:
+        close_old_connections()
+
+
+async def _run_concurrently(func, tokens):
+    # thread_sensitive=False runs each sub-query in its own executor thread,
+    # and therefore on its own database connection.
+    return await sync_to_async(_run_in_thread, thread_sensitive=False)(func, tokens)
+
+
+async def _search_ids_async(tokens, cache_key):
+    genes, aa_changes, variants, transcript_variants = await asyncio.gather(
+        _run_concurrently(search_genes, tokens),
+        _run_concurrently(search_aa_changes, tokens),
+        _run_concurrently(search_variants, tokens),
+        _run_concurrently(search_transcript_variants, tokens),
+    )
+    results = search_results(genes, aa_changes, merge_variants(variants, transcript_variants))
+    return await sync_to_async(cache_results)(cache_key, results)
+
+
+async def run_search_async(search_terms):
+    """Runs the sub-queries concurrently, each on a separate connection, unless the results of the search
+    terms are cached. The latency is roughly the one of the slowest sub-query.
+    """
+    tokens = normalize_tokens(search_terms)
+    if not tokens:
+        return search_results([], [], [])
+    cache_key, ids = await sync_to_async(cached_ids)(tokens)
+    if ids is None:
+        ids = await singleflight.coalesce_async(cache_key, lambda: _search_ids_async(tokens, cache_key))
+    return await sync_to_async(results_from_ids)(ids)
@@ -1,12 +1,48 @@
 import logging
 
+from django.conf import settings
 from rest_framework import serializers
-from api import models
+from api import models, stats
 
 # Get an instance of a logger
 logger = logging.getLogger(__name__)
 
 
+class SparseFieldsMixin:
+    """Serializer whose fields can be narrowed down (fields) and extended with nested relations (expand),
+    see views.SparseFieldsViewSetMixin for the matching ?fields= and ?expand= query parameters.
+
+    expandable_fields maps the name of an expandable relation to its serializer class and arguments. Expanding
+    a default field keeps it when fields narrows the others down.
+    select_related_fields and prefetch_related_fields map field names to the lookups loading them.
+    """
+    expandable_fields = {}
+    select_related_fields = {}
+    prefetch_related_fields = {}
+
+    def __init__(self, *args, fields=None, expand=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        for name in expand:
+            if name in self.expandable_fields:
+                serializer_class, serializer_kwargs = self.expandable_fields[name]
+                self.fields[name] = serializer_class(read_only=True, **serializer_kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields) - set(expand):
+                self.fields.pop(name)
+
+
+class GeneStatsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = models.GeneStats
+        exclude = ('gene',)
+
+
+class AAChangeStatsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = models.AAChangeStats
+        exclude = ('aa_change',)
+
+
 class GeneAnnotationSerializer(serializers.ModelSerializer):
     class Meta:
         model = models.GeneAnnotation
@@ -21,7 +57,20 @@ class GeneWithAnnotationSerializer(serializers.ModelSerializer):
         fields = serializers.ALL_FIELDS
 
 
-class GeneSerializer(serializers.ModelSerializer):
+class GeneSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    # Null until the stats of the gene are built, the list does not compute them.
+    stats = GeneStatsSerializer(required=False, read_only=True, default=None)
+
+    expandable_fields = {
+        'annotations': (GeneAnnotationSerializer, {'many': True}),
+    }
+    select_related_fields = {
+        'stats': ('stats',),
+    }
+    prefetch_related_fields = {
+        'annotations': ('annotations',),
+    }
+
     class Meta:
         model = models.Genes
         fields = serializers.ALL_FIELDS
@@ -33,35 +82,57 @@ class GeneSearchSerializer(serializers.ModelSerializer):
         fields = serializers.ALL_FIELDS
 
 
-class TranscriptSerializer(serializers.ModelSerializer):
+class TranscriptNoAASerializer(serializers.ModelSerializer):
+    # aa_changes is a reverse relation, which ALL_FIELDS does not include.
     class Meta:
         model = models.Transcript
         fields = serializers.ALL_FIELDS
 
 
-class TranscriptNoAASerializer(serializers.ModelSerializer):
+class AminoAcidAnnotationSerializer(serializers.ModelSerializer):
     class Meta:
-        model = models.Transcript
-        exclude = ('aa_changes',)
+        model = models.AminoAcidAnnotations
+        fields = serializers.ALL_FIELDS
 
 
-class AminoAcidChangeSerializer(serializers.ModelSerializer):
+class AminoAcidChangeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {
+        'annotations': (AminoAcidAnnotationSerializer, {'many': True}),
+        'genes': (GeneSearchSerializer, {'many': True}),
+        'transcripts': (TranscriptNoAASerializer, {'many': True}),
+        'stats': (AAChangeStatsSerializer, {'default': None}),
+    }
+    select_related_fields = {
+        'stats': ('stats',),
+    }
+    prefetch_related_fields = {
+        'annotations': ('annotations',),
+        'genes': ('genes',),
+        'transcripts': ('transcripts',),
+    }
 
     class Meta:
         model = models.AminoAcidChange
         exclude = ('transcripts', 'genes',)
 
 
-class AminoAcidSearchSerializer(serializers.ModelSerializer):
+class TranscriptSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {
+        'aa_changes': (AminoAcidChangeSerializer, {'many': True}),
+    }
+    prefetch_related_fields = {
+        'aa_changes': ('aa_changes',),
+    }
+
     class Meta:
-        model = models.AminoAcidChange
-        exclude = ('transcripts', 'genes',)
+        model = models.Transcript
+        fields = serializers.ALL_FIELDS
 
 
-class AminoAcidAnnotationSerializer(serializers.ModelSerializer):
+class AminoAcidSearchSerializer(serializers.ModelSerializer):
     class Meta:
-        model = models.AminoAcidAnnotations
-        fields = serializers.ALL_FIELDS
+        model = models.AminoAcidChange
+        exclude = ('transcripts', 'genes',)
 
 
 class GeneAminoAcidSerializer(serializers.ModelSerializer):
@@ -76,11 +147,15 @@ class AminoAcidWithAnnotationsSerializer(serializers.ModelSerializer):
     annotations = AminoAcidAnnotationSerializer(many=True, required=False)
     genes = GeneWithAnnotationSerializer(many=True, required=False)
     transcripts = TranscriptSerializer(many=True, required=False)
+    stats = serializers.SerializerMethodField()
 
     class Meta:
         model = models.AminoAcidChange
         fields = serializers.ALL_FIELDS
 
+    def get_stats(self, obj):
+        return AAChangeStatsSerializer(stats.get_aa_change_stats(obj)).data
+
 
 class TranscriptAminoAcidSerializer(serializers.ModelSerializer):
     aa_changes = AminoAcidChangeSerializer(many=True, required=False)
@@ -90,10 +165,28 @@ class TranscriptAminoAcidSerializer(serializers.ModelSerializer):
         fields = serializers.ALL_FIELDS
 
 
-class VariantSerializer(serializers.ModelSerializer):
+class AnnovarDataSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = models.AnnovarData
+        exclude = ('variant',)
+
+
+class VariantSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     transcripts = TranscriptAminoAcidSerializer(many=True, required=False)
     gene = GeneWithAnnotationSerializer(many=False, required=False)
 
+    expandable_fields = {
+        'annovar': (AnnovarDataSerializer, {'many': True}),
+    }
+    select_related_fields = {
+        'gene': ('gene',),
+    }
+    prefetch_related_fields = {
+        'transcripts': ('transcripts', 'transcripts__aa_changes'),
+        'gene': ('gene__annotations',),
+        'annovar': ('annovar',),
+    }
+
     class Meta:
         model = models.Variants
         fields = serializers.ALL_FIELDS
@@ -112,6 +205,20 @@ class SearchSerializer(serializers.Serializer):
     aa_changes = AminoAcidSearchSerializer(source='search_aa_changes', many=True, required=False)
 
 
+class AnnotationDataFileSerializer(serializers.Serializer):
+    """Annotation workbook upload (see api.views.annotation_data_upload)."""
+    file = serializers.FileField(allow_empty_file=False)
+
+    def validate_file(self, value):
+        if not value.name.lower().endswith('.xlsx'):
+            raise serializers.ValidationError("The annotation data must be an Excel workbook (.xlsx).")
+        if value.size > settings.ANNOTATION_UPLOAD_MAX_BYTES:
+            raise serializers.ValidationError(
+                f"The workbook is larger than {settings.ANNOTATION_UPLOAD_MAX_BYTES // 2 ** 20} MB."
+            )
+        return value
+
+
 class FullAminoAcidSerializer(serializers.ModelSerializer):
     transcripts = TranscriptNoAASerializer(many=True, required=False)
     annotations = AminoAcidAnnotationSerializer(many=True, required=False)
@@ -127,4 +234,42 @@ class FullGeneSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = models.Genes
-        fields = serializers.ALL_FIELDS
\ No newline at end of file
+        fields = serializers.ALL_FIELDS
+
+
+class GeneDetailSerializer(serializers.ModelSerializer):
+    """Gene with its annotations and stats. The variants are paged through /genes/symbol/<symbol>/variants/."""
+    annotations = GeneAnnotationSerializer(many=True, required=False)
+    stats = serializers.SerializerMethodField()
+
+    class Meta:
+        model = models.Genes
+        fields = serializers.ALL_FIELDS
+
+    def get_stats(self, obj):
+        return GeneStatsSerializer(stats.get_gene_stats(obj)).data
+
+
+class ExportGeneSerializer(serializers.ModelSerializer):
+    annotations = GeneAnnotationSerializer(many=True, required=False)
+
+    class Meta:
+        model = models.Genes
+        fields = ('id', 'hgnc_gene_id', 'approved_symbol', 'ensembl_gene_id', 'annotations')
+
+
+class ExportTranscriptSerializer(serializers.ModelSerializer):
+    aa_changes = GeneAminoAcidSerializer(many=True, required=False)
+
+    class Meta:
+        model = models.Transcript
+        fields = serializers.ALL_FIELDS
+
+
+class VariantExportSerializer(serializers.ModelSerializer):
+    gene = ExportGeneSerializer(many=False, required=False)
+    transcripts = ExportTranscriptSerializer(many=True, required=False)
+
+    class Meta:
+        model = models.Variants
+        fields = serializers.ALL_FIELDS
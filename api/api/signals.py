@@ -0,0 +1,153 @@
+"""
+Signal handlers keeping the summary statistics (api.stats), the typed Annovar scores (api.annovar_scores),
+the chromosome of the Annovar rows (api.partitioning), the CPRA keys of the variants (api.variant_keys), the
+identifier index (api.identifiers) and the cached payloads (api.response_cache) up to date. Connected in ApiConfig.ready().
+"""
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from api import annovar_scores, identifiers, models, response_cache, stats, variant_keys
+
+
+# Models which are not part of the cached payloads. AnnovarScores are derived from AnnovarData, the VariantKey
+# rows from the variants.
+PAYLOAD_EXEMPT_MODELS = (models.AccessCount, models.IdentifierIndex, models.AnnovarScores, models.VariantKey)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+@receiver(m2m_changed)
+def data_changed(sender, **kwargs):
+    if sender._meta.app_label == 'api' and not issubclass(sender, PAYLOAD_EXEMPT_MODELS):
+        response_cache.bump_data_version()
+
+
+def _loaded_value(instance, field):
+    # __dict__ rather than getattr, so that a deferred field is not loaded for every instance.
+    return instance.__dict__.get(field)
+
+
+@receiver(post_init, sender=models.Variants)
+@receiver(post_init, sender=models.GeneAnnotation)
+@receiver(post_init, sender=models.AminoAcidAnnotations)
+def remember_gene(sender, instance, **kwargs):
+    """Keeps the gene an object was loaded with, to also refresh it when the object moves to another gene."""
+    instance._stats_gene_id = _loaded_value(instance, 'gene_id')
+
+
+@receiver(post_init, sender=models.AminoAcidAnnotations)
+def remember_aa_change(sender, instance, **kwargs):
+    instance._stats_aa_change_id = _loaded_value(instance, 'amino_acid_id')
+
+
+@receiver(post_save, sender=models.Variants)
+@receiver(post_delete, sender=models.Variants)
+@receiver(post_save, sender=models.GeneAnnotation)
+@receiver(post_delete, sender=models.GeneAnnotation)
+def gene_object_changed(sender, instance, **kwargs):
+    stats.mark_genes([instance.gene_id, getattr(instance, '_stats_gene_id', None)])
+    instance._stats_gene_id = instance.gene_id
+
+
+@receiver(post_save, sender=models.AminoAcidAnnotations)
+@receiver(post_delete, sender=models.AminoAcidAnnotations)
+def aa_annotation_changed(sender, instance, **kwargs):
+    stats.mark_genes([instance.gene_id, getattr(instance, '_stats_gene_id', None)])
+    stats.mark_aa_changes([instance.amino_acid_id, getattr(instance, '_stats_aa_change_id', None)])
+    instance._stats_gene_id = instance.gene_id
+    instance._stats_aa_change_id = instance.amino_acid_id
+
+
+# Fields of Variants the CPRA keys and the identifier index entries are built from.
+VARIANT_KEY_FIELDS = {'chrom_pos_ref_alt', 'alt_chrom_pos_ref_alt'}
+VARIANT_IDENTIFIER_FIELDS = {source[2] for source in identifiers.SOURCES if source[1] is models.Variants}
+
+
+@receiver(post_save, sender=models.Variants)
+def variant_saved(sender, instance, update_fields=None, **kwargs):
+    # The keys and index entries of a deleted variant are deleted with it (on_delete=CASCADE).
+    if update_fields is None or VARIANT_KEY_FIELDS.intersection(update_fields):
+        variant_keys.reindex_variants([instance.pk])
+    if update_fields is None or VARIANT_IDENTIFIER_FIELDS.intersection(update_fields):
+        identifiers.reindex_variants([instance.pk])
+
+
+# Models whose identifiers belong to a transcript or an amino acid change. Those of Variants are indexed by variant_saved.
+IDENTIFIER_MODELS = [model for model in identifiers.INDEXED_MODELS if model is not models.Variants]
+
+
+def _indexed_fields_saved(sender, update_fields):
+    return update_fields is None or identifiers.indexed_fields(sender).intersection(update_fields)
+
+
+def remember_identifier_owner(sender, instance, update_fields=None, **kwargs):
+    """Keeps the stored owner of a row, to also refresh its entries when the row moves to another owner."""
+    if _indexed_fields_saved(sender, update_fields):
+        instance._identifier_owner_id = identifiers.stored_owner_id(sender, instance.pk)
+
+
+def identifier_row_saved(sender, instance, update_fields=None, **kwargs):
+    if _indexed_fields_saved(sender, update_fields):
+        owner_ids = {getattr(instance, '_identifier_owner_id', None), identifiers.stored_owner_id(sender, instance.pk)}
+        identifiers.reindex(sender, owner_ids - {None})
+
+
+def identifier_row_deleted(sender, instance, **kwargs):
+    owner_id = getattr(instance, '_identifier_owner_id', None)
+    if owner_id is not None:
+        identifiers.reindex(sender, [owner_id])
+
+
+for model in IDENTIFIER_MODELS:
+    pre_save.connect(remember_identifier_owner, sender=model)
+    post_save.connect(identifier_row_saved, sender=model)
+    if identifiers.owner_of(model)[1] != 'id':
+        # The entries of a deleted transcript or amino acid change are deleted with it (on_delete=CASCADE).
+        pre_delete.connect(remember_identifier_owner, sender=model)
+        post_delete.connect(identifier_row_deleted, sender=model)
+
+
+@receiver(post_save, sender=models.AnnovarData)
+@receiver(post_delete, sender=models.AnnovarData)
+def annovar_changed(sender, instance, **kwargs):
+    # The exonic function counts of the gene of the variant.
+    gene_id = models.Variants.objects.filter(id=instance.variant_id).values_list('gene_id', flat=True).first()
+    stats.mark_genes([gene_id])
+
+
+@receiver(pre_save, sender=models.AnnovarData)
+def annovar_chromosome(sender, instance, **kwargs):
+    # The partition key of the partitioned table. The importers set it, other saves read it from the variant.
+    if not instance.chr and instance.variant_id:
+        instance.chr = models.Variants.objects.filter(id=instance.variant_id).values_list('chr', flat=True).first() or ''
+
+
+@receiver(post_save, sender=models.AnnovarData)
+def annovar_saved(sender, instance, **kwargs):
+    annovar_scores.save_scores([instance])
+
+
+def _changed_ids(instance, reverse, pk_set, field):
+    """(aa change ids, related object ids) of an m2m_changed signal of one of the AminoAcidChange many to many fields."""
+    if pk_set is None:
+        # pre_clear, the relations are about to be removed.
+        related = instance.aa_changes if reverse else getattr(instance, field)
+        pk_set = set(related.values_list('id', flat=True))
+    if reverse:
+        return pk_set, {instance.pk}
+    return {instance.pk}, pk_set
+
+
+@receiver(m2m_changed, sender=models.AminoAcidChange.genes.through)
+def aa_change_genes_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'pre_clear'):
+        aa_change_ids, gene_ids = _changed_ids(instance, reverse, pk_set, 'genes')
+        stats.mark_aa_changes(aa_change_ids)
+        stats.mark_genes(gene_ids)
+
+
+@receiver(m2m_changed, sender=models.AminoAcidChange.transcripts.through)
+def aa_change_transcripts_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'pre_clear'):
+        aa_change_ids, transcript_ids = _changed_ids(instance, reverse, pk_set, 'transcripts')
+        stats.mark_aa_changes(aa_change_ids)
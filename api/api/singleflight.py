@@ -0,0 +1,169 @@
+"""
+Coalescing of concurrent identical computations ("single flight"), so that a burst of requests for the same
+uncached payload or search runs its queries and serialization once.
+
+share(key, func): within a process, the first caller runs func() while the concurrent callers of the same key
+wait for it and get its result (or exception).
+
+coalesce(cache_key, build): share(), and across the uWSGI workers of the host: build() must cache its result
+under cache_key in the default cache. The first worker holds a local lock, an flock() of a file of the key in
+SINGLEFLIGHT_LOCK_DIR, while it builds. The other workers poll the cache for the result and take the lock over
+if it is released without a result (e.g. not found, or the build failed), for up to SINGLEFLIGHT_WAIT_SECONDS,
+then build it themselves. The lock does not depend on the cache backend, the file based cache having no atomic
+add(), but only spans one host: with several hosts, each host builds the result once.
+
+coalesce_async(cache_key, build) is coalesce() for a coroutine function, the requests of the event loop
+awaiting the one in flight.
+"""
+import asyncio
+import errno
+import fcntl
+import hashlib
+import os
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+POLL_SECONDS = 0.05
+
+_flights = {}
+_flights_lock = threading.Lock()
+_async_flights = {}
+
+
+class _Flight:
+    """Call in flight, with its result or exception once done is set."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def share(key, func):
+    """Result of func(), shared with the calls of the same key running concurrently in this process."""
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+    if not leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+    try:
+        flight.result = func()
+        return flight.result
+    except Exception as exc:
+        flight.error = exc
+        raise
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+
+
+def _lock_path(cache_key):
+    return os.path.join(settings.SINGLEFLIGHT_LOCK_DIR, hashlib.sha1(cache_key.encode()).hexdigest() + '.lock')
+
+
+def _acquire(cache_key):
+    """Open file holding the lock of the key, None if another worker holds it."""
+    path = _lock_path(cache_key)
+    os.makedirs(settings.SINGLEFLIGHT_LOCK_DIR, exist_ok=True)
+    lock_file = open(path, 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        # The holder removes the file when releasing the lock: a file locked after its removal is stale.
+        if os.fstat(lock_file.fileno()).st_ino == os.stat(path).st_ino:
+            return lock_file
+    except OSError as e:
+        if e.errno not in (errno.EAGAIN, errno.EACCES, errno.ENOENT):
+            lock_file.close()
+            raise
+    lock_file.close()
+    return None
+
+
+def _release(lock_file):
+    # Removed before unlocking, so that the files do not pile up, one per key.
+    os.unlink(lock_file.name)
+    lock_file.close()
+
+
+def _try_build(cache_key, build):
+    """(done, result): done if this worker took the lock and built, or found, the result."""
+    lock_file = _acquire(cache_key)
+    if lock_file is None:
+        return False, None
+    try:
+        # Built by another worker between the cache miss of the caller and the lock.
+        value = cache.get(cache_key)
+        return True, build() if value is None else value
+    finally:
+        _release(lock_file)
+
+
+def _build_across_workers(cache_key, build):
+    if not settings.SINGLEFLIGHT_WAIT_SECONDS:
+        return build()
+    deadline = time.monotonic() + settings.SINGLEFLIGHT_WAIT_SECONDS
+    while True:
+        done, value = _try_build(cache_key, build)
+        if done:
+            return value
+        if time.monotonic() >= deadline:
+            # The worker holding the lock is too slow.
+            return build()
+        time.sleep(POLL_SECONDS)
+        value = cache.get(cache_key)
+        if value is not None:
+            return value
+
+
+def coalesce(cache_key, build):
+    """Result of build(), which caches it under cache_key, built once for the concurrent callers of all workers."""
+    return share(cache_key, lambda: _build_across_workers(cache_key, build))
+
+
+async def _try_build_async(cache_key, build):
+    lock_file = await sync_to_async(_acquire)(cache_key)
+    if lock_file is None:
+        return False, None
+    try:
+        value = await sync_to_async(cache.get)(cache_key)
+        return True, await build() if value is None else value
+    finally:
+        await sync_to_async(_release)(lock_file)
+
+
+async def _build_across_workers_async(cache_key, build):
+    if not settings.SINGLEFLIGHT_WAIT_SECONDS:
+        return await build()
+    deadline = time.monotonic() + settings.SINGLEFLIGHT_WAIT_SECONDS
+    while True:
+        done, value = await _try_build_async(cache_key, build)
+        if done:
+            return value
+        if time.monotonic() >= deadline:
+            return await build()
+        await asyncio.sleep(POLL_SECONDS)
+        value = await sync_to_async(cache.get)(cache_key)
+        if value is not None:
+            return value
+
+
+async def coalesce_async(cache_key, build):
+    """coalesce() for a coroutine function build."""
+    key = (asyncio.get_running_loop(), cache_key)
+    flight = _async_flights.get(key)
+    if flight is None:
+        # A task, so that the computation carries on for the waiting requests if the first one is cancelled.
+        flight = asyncio.ensure_future(_build_across_workers_async(cache_key, build))
+        _async_flights[key] = flight
+        flight.add_done_callback(lambda _: _async_flights.pop(key, None))
+    return await asyncio.shield(flight)
@@ -0,0 +1,208 @@
+"""
+Read-only SQLite snapshots of the database, serving the read API without a database server
+(air-gapped instruments, CI).
+
+The export_snapshot management command copies the api tables in one repeatable read transaction of the source
+database into a new SQLite file with the same schema and indexes, adds FTS5 trigram tables used by the
+substring conditions of the search (see fts_ids), then runs ANALYZE and VACUUM.
+
+The crowdseq.settings_snapshot settings open the file in immutable read-only mode, where SQLite takes no
+locks and reads the file through mmap (SNAPSHOT_MMAP_BYTES).
+"""
+import json
+import logging
+import os
+import sqlite3
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, connections, transaction
+from django.db.backends.sqlite3.base import DatabaseWrapper as SQLiteDatabaseWrapper
+from django.db.backends.signals import connection_created
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 5000
+
+# Bookkeeping tables which the read API does not use.
+EXCLUDED_MODELS = ('api.AccessCount', 'api.ImportedRecord')
+
+# Trigram FTS5 tables of the text columns searched with substring conditions, by model.
+FTS_TABLES = {
+    'api.Genes': ('snapshot_genes_fts', ('approved_symbol', 'approved_name', 'alias_symbols', 'previous_symbols')),
+    'api.AminoAcidChange': ('snapshot_aa_changes_fts', ('short_name', 'long_name')),
+    'api.Variants': ('snapshot_variants_fts', ('hgvsg_id', 'alt_hgvsg_id', 'refseq_hgvsg_id', 'lrg_hgvsg_id')),
+}
+
+INFO_TABLE = 'snapshot_info'
+
+# Whether the current database has the FTS tables, checked once per process.
+_fts_available = None
+
+
+def snapshot_models():
+    """Models copied to the snapshot, including the many to many tables."""
+    copied = [get_user_model()]
+    for model in apps.get_app_config('api').get_models(include_auto_created=True):
+        if model._meta.label not in EXCLUDED_MODELS:
+            copied.append(model)
+    return copied
+
+
+def _target_connection(path):
+    """Django connection to a new SQLite file, with the settings of the default connection."""
+    settings_dict = dict(connections['default'].settings_dict)
+    settings_dict.update({'ENGINE': 'django.db.backends.sqlite3', 'NAME': path, 'OPTIONS': {},
+                          'USER': '', 'PASSWORD': '', 'HOST': '', 'PORT': '', 'CONN_MAX_AGE': 0})
+    return SQLiteDatabaseWrapper(settings_dict, alias='snapshot')
+
+
+def _user_rows(rows):
+    # Only the identity of the annotation authors, no credentials.
+    for user_id, username, first_name, last_name, date_joined in rows:
+        yield user_id, username, first_name, last_name, date_joined, '!', False, False, False, ''
+
+
+def _copy_model(model, target, batch_size):
+    """Copies the rows of a model from the default database. Returns the number of rows."""
+    User = get_user_model()
+    if model is User:
+        names = ('id', 'username', 'first_name', 'last_name', 'date_joined',
+                 'password', 'is_superuser', 'is_staff', 'is_active', 'email')
+        fields = [model._meta.get_field(name) for name in names]
+        source_fields = fields[:5]
+    else:
+        fields = source_fields = model._meta.concrete_fields
+    rows = model.objects.using('default').order_by().values_list(*(field.attname for field in source_fields))
+    rows = rows.iterator(chunk_size=batch_size)
+    if model is User:
+        rows = _user_rows(rows)
+    quote = target.ops.quote_name
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        quote(model._meta.db_table), ', '.join(quote(field.column) for field in fields), ', '.join(['%s'] * len(fields))
+    )
+    count = 0
+    batch = []
+    with target.cursor() as cursor:
+        for row in rows:
+            batch.append(tuple(field.get_db_prep_save(value, target) for field, value in zip(fields, row)))
+            if len(batch) >= batch_size:
+                cursor.executemany(sql, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(sql, batch)
+            count += len(batch)
+    return count
+
+
+def _build_fts(target):
+    with target.cursor() as cursor:
+        for label, (fts_table, columns) in FTS_TABLES.items():
+            model = apps.get_model(label)
+            cursor.execute(
+                "CREATE VIRTUAL TABLE %s USING fts5(%s, content='%s', content_rowid='id', tokenize='trigram')"
+                % (fts_table, ', '.join(columns), model._meta.db_table)
+            )
+            cursor.execute("INSERT INTO %s(%s) VALUES('rebuild')" % (fts_table, fts_table))
+
+
+def export(path, batch_size=DEFAULT_BATCH_SIZE):
+    """Writes a snapshot of the database to path, replacing it atomically. Returns {table: number of rows}."""
+    build_path = path + '.build'
+    for stale in (build_path, build_path + '-journal'):
+        if os.path.exists(stale):
+            os.remove(stale)
+    target = _target_connection(build_path)
+    # Registered for the schema editor and transaction.atomic(), for this thread only.
+    connections[target.alias] = target
+    counts = {}
+    try:
+        copied = snapshot_models()
+        with target.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode = OFF')
+            cursor.execute('PRAGMA synchronous = OFF')
+        with target.schema_editor() as editor:
+            for model in copied:
+                if not model._meta.auto_created:
+                    # Also creates the many to many tables.
+                    editor.create_model(model)
+        # Tables are filled in any order, the constraints hold in the source.
+        target.disable_constraint_checking()
+        with transaction.atomic(using='default'):
+            if connection.vendor == 'postgresql':
+                # All tables are read from the same snapshot of the data.
+                with connection.cursor() as cursor:
+                    cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY')
+            with transaction.atomic(using=target.alias):
+                for model in copied:
+                    counts[model._meta.db_table] = _copy_model(model, target, batch_size)
+        fts = sqlite3.sqlite_version_info >= (3, 34, 0)
+        if fts:
+            _build_fts(target)
+        else:
+            logger.warning("SQLite %s has no FTS5 trigram tokenizer, the snapshot search uses LIKE",
+                           sqlite3.sqlite_version)
+        info = {
+            'created': timezone.now().isoformat(),
+            'source': connection.vendor,
+            'fts': fts,
+            'counts': counts,
+        }
+        with target.cursor() as cursor:
+            cursor.execute('CREATE TABLE %s (key TEXT PRIMARY KEY, value TEXT)' % INFO_TABLE)
+            cursor.executemany('INSERT INTO %s VALUES (%%s, %%s)' % INFO_TABLE,
+                               [(key, json.dumps(value)) for key, value in info.items()])
+            cursor.execute('ANALYZE')
+            cursor.execute('VACUUM')
+    finally:
+        target.close()
+        del connections[target.alias]
+    os.replace(build_path, path)
+    return counts
+
+
+def configure_connection(sender, connection, **kwargs):
+    """Reads the snapshot through mmap. Connected by ApiConfig.ready() in snapshot mode."""
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA mmap_size = %d' % settings.SNAPSHOT_MMAP_BYTES)
+            cursor.execute('PRAGMA query_only = ON')
+
+
+def connect_signals():
+    connection_created.connect(configure_connection, dispatch_uid='snapshot_configure_connection')
+
+
+def snapshot_info():
+    """{key: value} of the info table of the snapshot, {} when the database is not a snapshot."""
+    if connection.vendor != 'sqlite':
+        return {}
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = %s", [INFO_TABLE])
+        if not cursor.fetchone():
+            return {}
+        cursor.execute('SELECT key, value FROM %s' % INFO_TABLE)
+        return {key: json.loads(value) for key, value in cursor.fetchall()}
+
+
+def fts_ids(model, fields, token):
+    """Subquery of the ids of the rows of which one of the fields contains token, using the FTS tables of
+    the snapshot. None outside of snapshot mode, for fields without FTS columns and for tokens shorter than
+    the 3 characters of a trigram."""
+    global _fts_available
+    if not getattr(settings, 'SNAPSHOT_MODE', False) or len(token) < 3:
+        return None
+    fts_table, columns = FTS_TABLES.get(model._meta.label, (None, ()))
+    if not fts_table or not set(fields) <= set(columns):
+        return None
+    if _fts_available is None:
+        _fts_available = bool(snapshot_info().get('fts'))
+    if not _fts_available:
+        return None
+    phrase = '"%s"' % token.replace('"', '""')
+    query = '{%s} : %s' % (' '.join(fields), phrase)
+    return RawSQL(f'SELECT rowid FROM {fts_table} WHERE {fts_table} MATCH %s', [query])
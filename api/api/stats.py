@@ -0,0 +1,216 @@
+"""
+Summary statistics of genes and amino acid changes (GeneStats and AAChangeStats).
+
+The counts are recomputed per gene / amino acid change with a few grouped queries whenever their variants,
+Annovar data or annotations change: api.signals marks the changed objects, and the importers wrap their
+row by row saves in deferred() so that every object is refreshed once per import. Refreshes run when the
+transaction commits. The reconcile_stats management command recomputes everything periodically, catching
+the changes made without signals (bulk_create, update(), raw SQL).
+"""
+import contextvars
+from collections import defaultdict
+from contextlib import contextmanager
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from api import models, response_cache
+
+DEFAULT_BATCH_SIZE = 1000
+
+GENE_STATS_FIELDS = ('variant_count', 'exonic_func_counts', 'annotation_count', 'aa_change_count',
+                     'aa_annotation_count', 'diagnosis_counts')
+AA_CHANGE_STATS_FIELDS = ('annotation_count', 'gene_count', 'transcript_count', 'diagnosis_counts')
+
+# Ids marked in the current deferred() block, None outside of one.
+_pending = contextvars.ContextVar('pending_stats', default=None)
+
+
+def _count_list(counts, key):
+    return [{key: name, 'count': count} for name, count in sorted(counts.items(), key=lambda item: item[0] or '')]
+
+
+def _grouped_counts(queryset, group_field, key_field, count_field='id', distinct=False):
+    """{group id: {key: count}} of a queryset."""
+    counts = defaultdict(lambda: defaultdict(int))
+    rows = queryset.values_list(group_field, key_field).annotate(count=Count(count_field, distinct=distinct)).order_by()
+    for group_id, key, count in rows:
+        counts[group_id][key] += count
+    return counts
+
+
+def _totals(queryset, group_field):
+    rows = queryset.values_list(group_field).annotate(count=Count('id')).order_by()
+    return dict(rows)
+
+
+def gene_stats(gene_ids):
+    """Computes the GeneStats of existing genes, without saving them."""
+    gene_ids = list(models.Genes.objects.filter(id__in=gene_ids).values_list('id', flat=True))
+    variants = models.Variants.objects.filter(gene_id__in=gene_ids)
+    variant_counts = _totals(variants, 'gene_id')
+    # Variants can have several Annovar rows.
+    exonic_func_counts = _grouped_counts(variants, 'gene_id', 'annovar__exonic_func_ref_gene', distinct=True)
+    gene_annotations = _grouped_counts(models.GeneAnnotation.objects.filter(gene_id__in=gene_ids),
+                                       'gene_id', 'diagnosis__name')
+    aa_annotations = _grouped_counts(models.AminoAcidAnnotations.objects.filter(gene_id__in=gene_ids),
+                                     'gene_id', 'diagnosis__name')
+    aa_change_counts = _totals(models.AminoAcidChange.genes.through.objects.filter(genes_id__in=gene_ids), 'genes_id')
+    stats = []
+    for gene_id in gene_ids:
+        diagnosis_counts = defaultdict(int)
+        for counts in (gene_annotations[gene_id], aa_annotations[gene_id]):
+            for diagnosis, count in counts.items():
+                diagnosis_counts[diagnosis] += count
+        stats.append(models.GeneStats(
+            gene_id=gene_id,
+            variant_count=variant_counts.get(gene_id, 0),
+            exonic_func_counts=_count_list(exonic_func_counts[gene_id], 'exonic_func'),
+            annotation_count=sum(gene_annotations[gene_id].values()),
+            aa_change_count=aa_change_counts.get(gene_id, 0),
+            aa_annotation_count=sum(aa_annotations[gene_id].values()),
+            diagnosis_counts=_count_list(diagnosis_counts, 'diagnosis'),
+        ))
+    return stats
+
+
+def aa_change_stats(aa_change_ids):
+    """Computes the AAChangeStats of existing amino acid changes, without saving them."""
+    aa_change_ids = list(models.AminoAcidChange.objects.filter(id__in=aa_change_ids).values_list('id', flat=True))
+    annotations = _grouped_counts(models.AminoAcidAnnotations.objects.filter(amino_acid_id__in=aa_change_ids),
+                                  'amino_acid_id', 'diagnosis__name')
+    gene_counts = _totals(models.AminoAcidChange.genes.through.objects.filter(aminoacidchange_id__in=aa_change_ids),
+                          'aminoacidchange_id')
+    transcript_counts = _totals(
+        models.AminoAcidChange.transcripts.through.objects.filter(aminoacidchange_id__in=aa_change_ids),
+        'aminoacidchange_id'
+    )
+    return [
+        models.AAChangeStats(
+            aa_change_id=aa_change_id,
+            annotation_count=sum(annotations[aa_change_id].values()),
+            gene_count=gene_counts.get(aa_change_id, 0),
+            transcript_count=transcript_counts.get(aa_change_id, 0),
+            diagnosis_counts=_count_list(annotations[aa_change_id], 'diagnosis'),
+        )
+        for aa_change_id in aa_change_ids
+    ]
+
+
+def refresh_genes(gene_ids, invalidate=True):
+    stats = gene_stats(gene_ids)
+    models.GeneStats.objects.bulk_create(stats, update_conflicts=True, unique_fields=['gene'],
+                                         update_fields=GENE_STATS_FIELDS + ('updated',))
+    if invalidate:
+        # The gene payloads include the stats.
+        response_cache.bump_data_version()
+    return stats
+
+
+def refresh_aa_changes(aa_change_ids, invalidate=True):
+    stats = aa_change_stats(aa_change_ids)
+    models.AAChangeStats.objects.bulk_create(stats, update_conflicts=True, unique_fields=['aa_change'],
+                                             update_fields=AA_CHANGE_STATS_FIELDS + ('updated',))
+    if invalidate:
+        response_cache.bump_data_version()
+    return stats
+
+
+REFRESH = {
+    'genes': refresh_genes,
+    'aa_changes': refresh_aa_changes,
+}
+
+
+def _schedule(kind, ids):
+    ids = {object_id for object_id in ids if object_id}
+    if not ids:
+        return
+    pending = _pending.get()
+    if pending is not None:
+        pending[kind].update(ids)
+    else:
+        transaction.on_commit(lambda: REFRESH[kind](ids))
+
+
+def mark_genes(gene_ids):
+    """Refreshes the stats of genes once the current transaction commits (or at the end of the deferred() block)."""
+    _schedule('genes', gene_ids)
+
+
+def mark_aa_changes(aa_change_ids):
+    _schedule('aa_changes', aa_change_ids)
+
+
+@contextmanager
+def deferred():
+    """Collects the objects marked in the block and refreshes each of them once, e.g. around an import."""
+    token = _pending.set({kind: set() for kind in REFRESH})
+    try:
+        yield
+    except BaseException:
+        _pending.reset(token)
+        raise
+    pending = _pending.get()
+    _pending.reset(token)
+    for kind, ids in pending.items():
+        _schedule(kind, ids)
+
+
+def _batches(ids, batch_size):
+    ids = iter(ids)
+    while True:
+        batch = list(islice(ids, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def _reconcile(model, stats_model, compute, fields, batch_size):
+    """Recomputes the stats of all objects of a model. Returns the number of rows and of rows which were wrong."""
+    count = 0
+    changed = 0
+    for batch in _batches(model.objects.order_by('id').values_list('id', flat=True).iterator(chunk_size=batch_size),
+                          batch_size):
+        stats = compute(batch)
+        current = stats_model.objects.in_bulk([row.pk for row in stats])
+        stale = [row for row in stats if row.pk not in current or
+                 any(getattr(row, field) != getattr(current[row.pk], field) for field in fields)]
+        if stale:
+            stats_model.objects.bulk_create(stale, update_conflicts=True, unique_fields=[stats_model._meta.pk.name],
+                                            update_fields=fields + ('updated',))
+            response_cache.bump_data_version()
+        count += len(stats)
+        changed += len(stale)
+    return count, changed
+
+
+def reconcile_genes(batch_size=DEFAULT_BATCH_SIZE):
+    return _reconcile(models.Genes, models.GeneStats, gene_stats, GENE_STATS_FIELDS, batch_size)
+
+
+def reconcile_aa_changes(batch_size=DEFAULT_BATCH_SIZE):
+    return _reconcile(models.AminoAcidChange, models.AAChangeStats, aa_change_stats, AA_CHANGE_STATS_FIELDS, batch_size)
+
+
+def get_gene_stats(gene):
+    """Stats of a gene, computed and saved on the first request if they were not built yet."""
+    try:
+        return gene.stats
+    except models.GeneStats.DoesNotExist:
+        if getattr(settings, 'SNAPSHOT_MODE', False):
+            # Read-only database
+            return gene_stats([gene.id])[0]
+        # New stats are in no cached payload.
+        return refresh_genes([gene.id], invalidate=False)[0]
+
+
+def get_aa_change_stats(aa_change):
+    try:
+        return aa_change.stats
+    except models.AAChangeStats.DoesNotExist:
+        if getattr(settings, 'SNAPSHOT_MODE', False):
+            return aa_change_stats([aa_change.id])[0]
+        return refresh_aa_changes([aa_change.id], invalidate=False)[0]
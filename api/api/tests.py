@@ -1,3 +1,910 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+from unittest import mock, skipUnless
+from urllib.parse import quote
 
-# Create your tests here.
+import pandas as pd
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from api import (annotations, annovar_scores, consequences, imports, models, response_cache, search, singleflight,
+                 stats, variant_index, variant_keys, views)
+from api.normalize import normalize_cpra
+
+TEST_DIR = tempfile.mkdtemp(prefix='crowdseq-tests-')
+
+
+def create_gene(symbol, hgnc_gene_id, **fields):
+    return models.Genes.objects.create(hgnc_gene_id=hgnc_gene_id, approved_symbol=symbol, chromosome='7',
+                                       locus_group='protein-coding gene', locus_type='gene with protein product',
+                                       status='Approved', **fields)
+
+
+def create_variant(cpra, alt_cpra, gene=None, **fields):
+    chrom, pos, ref, alt = cpra.split('-')
+    values = {
+        'md5sum': hashlib.md5(cpra.encode()).hexdigest(),
+        'chrom_pos_ref_alt': cpra,
+        'chr': chrom,
+        'start_pos': int(pos),
+        'end_pos': int(pos) + len(ref) - 1,
+        'ref_allele': ref,
+        'alt_allele': alt,
+        'gene': gene,
+        'hgvsg_id': f'NC_0000{chrom:0>2}.10:g.{pos}{ref}>{alt}',
+        'alt_hgvsg_id': '',
+        'refseq_hgvsg_id': '',
+        'alt_chr': alt_cpra.split('-')[0],
+        'alt_chrom_pos_ref_alt': alt_cpra,
+    }
+    values.update(fields)
+    return models.Variants.objects.create(**values)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    VARIANT_INDEX_PATH=os.path.join(TEST_DIR, 'missing-index.npy'),
+    SINGLEFLIGHT_LOCK_DIR=os.path.join(TEST_DIR, 'locks'),
+)
+class ApiTestCase(TestCase):
+    """BRAF with V600E (hg19 7-140453136-A-T, hg38 7-140753336-A-T) and KRAS with G12D. The cache is cleared
+    before each test."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.braf = create_gene('BRAF', 1097, approved_name='B-Raf proto-oncogene')
+        cls.kras = create_gene('KRAS', 6407, approved_name='KRAS proto-oncogene')
+        cls.braf_variant = create_variant('7-140453136-A-T', '7-140753336-A-T', cls.braf)
+        cls.kras_variant = create_variant('12-25398284-C-T', '12-25245350-C-T', cls.kras)
+        cls.transcript = models.Transcript.objects.create(ensembl_transcript_id='ENST00000288602')
+        cls.braf_variant.transcripts.add(cls.transcript)
+        cls.v600e = models.AminoAcidChange.objects.create(long_name='ENSP00000288602.6:p.Val600Glu', short_name='V600E')
+        cls.v600e.genes.add(cls.braf)
+        cls.v600e.transcripts.add(cls.transcript)
+
+    def setUp(self):
+        cache.clear()
+
+
+class ExistsTests(ApiTestCase):
+
+    def results(self, response):
+        self.assertEqual(response.status_code, 200)
+        return {(x['key_type'], x['key']): (x['exists'], x['variant'], x['gene']) for x in response.json()['results']}
+
+    def check_lookups(self):
+        response = self.client.get('/variants/exists/', {
+            'cpra': 'chr7:140453136:a>t,7-140753336-A-T,1-1-A-T',
+            'md5sum': self.kras_variant.md5sum.upper(),
+        })
+        self.assertEqual(self.results(response), {
+            ('cpra', 'chr7:140453136:a>t'): (True, self.braf_variant.id, self.braf.id),
+            ('cpra', '7-140753336-A-T'): (True, self.braf_variant.id, self.braf.id),
+            ('cpra', '1-1-A-T'): (False, None, None),
+            ('md5sum', self.kras_variant.md5sum.upper()): (True, self.kras_variant.id, self.kras.id),
+        })
+
+    def test_database_lookup(self):
+        self.check_lookups()
+
+    def test_index_lookup(self):
+        path = os.path.join(TEST_DIR, 'variant-index.npy')
+        variant_index.build_index_file(path)
+        with override_settings(VARIANT_INDEX_PATH=path):
+            self.check_lookups()
+
+    def test_post(self):
+        response = self.client.post('/variants/exists/', {'cpra': ['12-25398284-C-T'], 'md5sum': 'missing'},
+                                    content_type='application/json')
+        self.assertEqual(self.results(response), {
+            ('cpra', '12-25398284-C-T'): (True, self.kras_variant.id, self.kras.id),
+            ('md5sum', 'missing'): (False, None, None),
+        })
+
+    def test_invalid_post(self):
+        for body in (['7-140453136-A-T'], {'cpra': [1]}, {'cpra': {'key': '7-140453136-A-T'}}):
+            response = self.client.post('/variants/exists/', body, content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+
+    def test_key_limit(self):
+        with mock.patch.object(views, 'MAX_EXISTS_KEYS', 2):
+            response = self.client.get('/variants/exists/', {'cpra': '1-1-A-T,1-2-A-T,1-3-A-T'})
+        self.assertEqual(response.status_code, 400)
+
+
+class SearchRankingTests(ApiTestCase):
+
+    def scores(self, search_function, query):
+        return [(str(row), row.search_score)
+                for row in search_function(search.normalize_tokens(search.split_search_terms(query)))]
+
+    def test_classify_token(self):
+        for token, token_type in (('BRAF', 'text'), ('V600E', 'protein_change'), ('Val600', 'protein_position'),
+                                  ('chr7:140453136:A>T', 'cpra'), ('7:140453136', 'position'),
+                                  ('NC_000007.13:g.140453136A>T', 'hgvs_g'), ('c.1799T>A', 'hgvs_c'),
+                                  ('p.V600E', 'hgvs_p'), ('ENST00000288602.6', 'ensembl_transcript'),
+                                  ('NM_004333.4', 'refseq_transcript')):
+            self.assertEqual(search.classify_token(token), token_type, token)
+
+    def test_exact_before_prefix_before_substring(self):
+        create_gene('BRAFP1', 1098)
+        create_gene('ABRAF', 1099)
+        self.assertEqual(self.scores(search.search_genes, 'braf'),
+                         [('BRAF', search.EXACT), ('BRAFP1', search.PREFIX), ('ABRAF', search.SUBSTRING)])
+
+    def test_aa_change_of_searched_gene(self):
+        other = models.AminoAcidChange.objects.create(long_name='ENSP00000311936.3:p.Val600Glu', short_name='V600E')
+        other.genes.add(self.kras)
+        # The gene symbol is matched case-insensitively.
+        self.assertEqual(self.scores(search.search_aa_changes, 'braf V600E'),
+                         [(self.v600e.long_name, 2 * search.EXACT), (other.long_name, search.EXACT)])
+        self.assertEqual(self.scores(search.search_transcript_variants, 'braf V600E'),
+                         [('7-140453136-A-T', search.EXACT)])
+
+    def test_variant_by_cpra_on_both_assemblies(self):
+        for query in ('chr7:140453136:A:T', '7-140753336-A-T'):
+            self.assertEqual(self.scores(search.search_variants, query), [('7-140453136-A-T', search.EXACT)])
+
+    def test_endpoint(self):
+        response = self.client.get('/api/search/', {'query': 'BRAF V600E'})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([gene['approved_symbol'] for gene in data['genes']], ['BRAF'])
+        self.assertEqual([aa_change['short_name'] for aa_change in data['aa_changes']], ['V600E'])
+        self.assertEqual([variant['chrom_pos_ref_alt'] for variant in data['variants']], ['7-140453136-A-T'])
+
+
+class SearchCacheTests(ApiTestCase):
+
+    def found(self, query):
+        results = search.run_search(search.split_search_terms(query))
+        return {name: [str(row) for row in rows] for name, rows in results.items() if rows}
+
+    def test_key(self):
+        key = search.search_cache_key(search.normalize_tokens(['BRAF', 'V600E']))
+        for terms in (['V600E', 'braf'], ['braf', 'V600E', 'BRAF']):
+            self.assertEqual(search.search_cache_key(search.normalize_tokens(terms)), key)
+        # The protein change is classified before being case-folded.
+        self.assertNotEqual(search.search_cache_key(search.normalize_tokens(['BRAF', 'v600e'])), key)
+
+    def test_cached_results(self):
+        found = self.found('BRAF V600E')
+        self.assertEqual(found['search_genes'], ['BRAF'])
+        with mock.patch.object(search, 'search_genes', side_effect=AssertionError):
+            self.assertEqual(self.found('V600E braf'), found)
+
+    def test_timeouts(self):
+        with mock.patch.object(search.cache, 'set', wraps=search.cache.set) as cache_set:
+            self.found('BRAF')
+            self.found('NOTAGENE')
+        self.assertEqual([call.kwargs['timeout'] for call in cache_set.call_args_list],
+                         [settings.SEARCH_CACHE_TIMEOUT, settings.SEARCH_CACHE_EMPTY_TIMEOUT])
+
+    def test_data_version_invalidates(self):
+        self.assertEqual(self.found('ABRAF'), {})
+        with self.captureOnCommitCallbacks(execute=True):
+            create_gene('ABRAF', 1099)
+        self.assertEqual(self.found('ABRAF'), {'search_genes': ['ABRAF']})
+
+
+class VariantKeyTests(ApiTestCase):
+
+    def test_normalize_cpra(self):
+        for cpra, key in (('7-140453136-A-T', '7-140453136-A-T'), ('chr7:140453136:a>t', '7-140453136-A-T'),
+                          ('7_140453135_CA/CT', '7-140453136-A-T'), ('chrM-10-A-G', 'MT-10-A-G'),
+                          ('7-100-AT-.', '7-100-AT--'), ('7:100::GA', '7-100---GA')):
+            self.assertEqual(normalize_cpra(cpra), key, cpra)
+        for cpra in ('BRAF', '7-140453136', 'chr7:p:A:T'):
+            with self.assertRaises(ValueError):
+                normalize_cpra(cpra)
+
+    def test_lookup_on_both_assemblies(self):
+        def found(cpra, assembly=None):
+            return list(variant_keys.variants_by_cpra(cpra, assembly).values_list('id', flat=True))
+
+        self.assertEqual(found('chr7:140453136:A:T'), [self.braf_variant.id])
+        self.assertEqual(found('chr7:140753336:A:T'), [self.braf_variant.id])
+        self.assertEqual(found('7-140753336-A-T', 'hg38'), [self.braf_variant.id])
+        self.assertEqual(found('7-140753336-A-T', 'hg19'), [])
+        self.assertEqual(found('not a cpra'), [])
+
+    def test_resolve_prefers_the_primary_assembly(self):
+        # Its hg38 CPRA is the hg19 CPRA of the KRAS variant.
+        other = create_variant('12-25100000-C-T', '12-25398284-C-T', md5sum='other')
+        self.assertEqual(variant_keys.resolve(['12-25398284-C-T', '12-25100000-C-T']), {
+            '12-25398284-C-T': (self.kras_variant.id, self.kras.id),
+            '12-25100000-C-T': (other.id, None),
+        })
+
+    def test_keys_follow_the_saved_variants(self):
+        self.braf_variant.chrom_pos_ref_alt = '7-140453137-A-T'
+        self.braf_variant.save()
+        self.assertFalse(variant_keys.variants_by_cpra('7-140453136-A-T').exists())
+        self.assertTrue(variant_keys.variants_by_cpra('7-140453137-A-T').exists())
+        self.braf_variant.delete()
+        self.assertFalse(models.VariantKey.objects.filter(key='7-140453137-A-T').exists())
+
+    def test_reindex_leaves_the_data_version(self):
+        # The saves of the variants invalidate the payloads, the keys derived from them do not again.
+        with self.captureOnCommitCallbacks() as callbacks:
+            variant_keys.reindex_variants([self.braf_variant.pk, self.kras_variant.pk])
+        self.assertEqual(callbacks, [])
+        with mock.patch.object(response_cache, 'bump_data_version') as bump:
+            self.kras_variant.save(update_fields=['chrom_pos_ref_alt'])
+        self.assertEqual(bump.call_count, 1)
+
+    def test_endpoint(self):
+        for cpra, assembly in (('chr7:140453136:A>T', ''), ('7-140753336-A-T', ''), ('7-140753336-A-T', 'hg38')):
+            response = self.client.get(f'/variants/cpra/{cpra}/', {'assembly': assembly} if assembly else {},
+                                       HTTP_ACCEPT='application/json')
+            self.assertEqual(response.status_code, 200, cpra)
+            self.assertEqual(response.json()['chrom_pos_ref_alt'], '7-140453136-A-T')
+        response = self.client.get('/variants/cpra/7-140753336-A-T/', {'assembly': 'hg19'})
+        self.assertEqual(response.status_code, 404)
+
+
+class ResolveTests(ApiTestCase):
+
+    def matches(self, identifier):
+        response = self.client.get(f'/api/resolve/{quote(identifier)}/', HTTP_ACCEPT='application/json')
+        if response.status_code == 404:
+            return []
+        self.assertEqual(response.status_code, 200)
+        return [(match['source'], match['variant'] or match['transcript'] or match['aa_change'])
+                for match in response.json()['matches']]
+
+    def test_saved_rows(self):
+        self.assertEqual(self.matches('enst00000288602.6'), [('transcript.ensembl_transcript_id', self.transcript.pk)])
+        self.assertEqual(self.matches('ENSP00000288602.6:p.Val600Glu'), [('aa_change.long_name', self.v600e.pk)])
+        self.assertEqual(self.matches('NC_000007.10:g.140453136A>T'), [('variants.hgvsg_id', self.braf_variant.pk)])
+        self.assertEqual(self.matches('ENST00000000000'), [])
+
+        models.EnsemblPeptide.objects.create(transcript=self.transcript, peptide_id='ENSP00000288602',
+                                             hgvsp_id='ENSP00000288602.6:p.Val600Glu')
+        self.assertEqual(self.matches('ENSP00000288602.6:p.Val600Glu'), [
+            ('aa_change.long_name', self.v600e.pk), ('ensembl_peptide.hgvsp_id', self.transcript.pk),
+        ])
+
+    def test_renamed_moved_and_deleted_rows(self):
+        self.transcript.ensembl_transcript_id = 'ENST00000646891'
+        self.transcript.save()
+        self.assertEqual(self.matches('ENST00000288602'), [])
+        self.assertEqual(self.matches('ENST00000646891'), [('transcript.ensembl_transcript_id', self.transcript.pk)])
+
+        refseq = models.RefSeqTranscript.objects.create(transcript=self.transcript, refseq_transcript_id='NM_004333.4',
+                                                        transcript_type='mRNA')
+        hgvsc = models.RefSeqHGVSC.objects.create(transcript=refseq, hgvsc_id='NM_004333.4:c.1799T>A',
+                                                  transcript_type='mRNA')
+        self.assertEqual(self.matches('NM_004333.6:c.1799T>A'), [('refseq_hgvsc.hgvsc_id', self.transcript.pk)])
+
+        other = models.Transcript.objects.create(ensembl_transcript_id='ENST00000496384')
+        hgvsc.transcript = models.RefSeqTranscript.objects.create(transcript=other, transcript_type='mRNA',
+                                                                  refseq_transcript_id='NM_001354609.2')
+        hgvsc.save()
+        self.assertEqual(self.matches('NM_004333.4:c.1799T>A'), [('refseq_hgvsc.hgvsc_id', other.pk)])
+
+        hgvsc.delete()
+        self.assertEqual(self.matches('NM_004333.4:c.1799T>A'), [])
+        other.delete()
+        self.assertEqual(self.matches('NM_001354609.2'), [])
+
+
+class BulkAnnotationTests(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('curator')
+        self.client.force_login(self.user)
+
+    def post(self, body, content_type='application/json', **params):
+        query = '?' + '&'.join(f'{name}={value}' for name, value in params.items()) if params else ''
+        return self.client.post('/api/annotations/bulk/' + query, body, content_type=content_type)
+
+    def test_create(self):
+        response = self.post({'annotations': [
+            {'type': 'gene', 'gene': 'BRAF', 'annotation': 'Oncogene', 'priority': 1},
+            {'type': 'aa_change', 'gene': 'BRAF', 'aa_change': 'V600E', 'annotation': 'Hotspot'},
+            {'type': 'aa_change', 'gene': 'KRAS', 'aa_change': 'ENSP00000288602.6:p.Val600Glu',
+             'annotation': 'By long name'},
+            {'type': 'gene', 'gene': 'BRAF', 'annotation': 'Oncogene', 'priority': 1},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['counts'], {'created': 3, 'exists': 1})
+        annotation = models.GeneAnnotation.objects.get(gene=self.braf)
+        self.assertEqual((annotation.annotation, annotation.priority, annotation.user), ('Oncogene', 1, self.user))
+        self.assertEqual(models.AminoAcidAnnotations.objects.filter(amino_acid=self.v600e).count(), 2)
+
+        # Retried, the annotations exist.
+        response = self.post([{'type': 'gene', 'gene': 'BRAF', 'annotation': 'Oncogene', 'priority': 1}])
+        self.assertEqual(response.json()['results'], [{'index': 0, 'status': 'exists', 'id': None, 'errors': []}])
+
+    def test_ndjson(self):
+        body = '{"gene": "BRAF", "annotation": "First"}\n\n{"gene": "KRAS", "annotation": "Second"}\n'
+        response = self.post(body, content_type='application/x-ndjson')
+        self.assertEqual(response.json()['counts'], {'created': 2})
+
+    def test_invalid_items(self):
+        items = [
+            {'gene': 'BRAF', 'annotation': 'Valid'},
+            {'gene': 'NOTAGENE', 'annotation': 'Unknown gene'},
+            {'gene': 'BRAF', 'annotation': 'Bad priority', 'priority': '1'},
+            {'type': 'aa_change', 'gene': 'KRAS', 'aa_change': 'V600E', 'annotation': 'Not a change of KRAS'},
+            'not an object',
+        ]
+        response = self.post(items)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['status'] for result in response.json()['results']],
+                         ['created', 'invalid', 'invalid', 'invalid', 'invalid'])
+        self.assertEqual(response.json()['results'][1]['errors'], ["Gene NOTAGENE does not exist."])
+
+        response = self.post([{'gene': 'KRAS', 'annotation': 'Valid'}, {'gene': 'BRAF'}], atomic='true')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['counts'], {'skipped': 1, 'invalid': 1})
+        self.assertFalse(models.GeneAnnotation.objects.filter(gene=self.kras).exists())
+
+    def test_requests(self):
+        self.assertEqual(self.post({'annotations': 'BRAF'}).status_code, 400)
+        with mock.patch.object(views.annotations, 'MAX_BULK_ANNOTATIONS', 1):
+            response = self.post([{'gene': 'BRAF', 'annotation': 'A'}, {'gene': 'BRAF', 'annotation': 'B'}])
+        self.assertEqual(response.status_code, 400)
+        self.client.logout()
+        self.assertIn(self.post([{'gene': 'BRAF', 'annotation': 'A'}]).status_code, (401, 403))
+
+
+class SparseFieldsTests(ApiTestCase):
+
+    def get(self, path, **params):
+        return self.client.get(path, params, HTTP_ACCEPT='application/json')
+
+    def test_only_selected_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get('/genes/', fields='approved_symbol')
+        self.assertEqual(response.json()['results'], [{'approved_symbol': 'BRAF'}, {'approved_symbol': 'KRAS'}])
+        # The count of the page and the genes, without the stats.
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn('approved_name', queries[-1]['sql'])
+        self.assertNotIn('api_genestats', queries[-1]['sql'])
+
+    def test_expand(self):
+        models.GeneAnnotation.objects.create(gene=self.braf, annotation='Oncogene', priority=1)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get('/genes/', fields='approved_symbol', expand='annotations,stats')
+        braf = response.json()['results'][0]
+        self.assertEqual(set(braf), {'approved_symbol', 'annotations', 'stats'})
+        self.assertEqual([annotation['annotation'] for annotation in braf['annotations']], ['Oncogene'])
+        # The stats are joined and the annotations of the page prefetched.
+        self.assertEqual(len(queries), 3)
+        self.assertIn('api_genestats', queries[1]['sql'])
+
+        response = self.get('/aa-changes/', fields='short_name', expand='stats')
+        self.assertEqual(set(response.json()['results'][0]), {'short_name', 'stats'})
+        response = self.get(f'/variants/{self.braf_variant.pk}/', fields='chrom_pos_ref_alt', expand='annovar')
+        self.assertEqual(response.json(), {'chrom_pos_ref_alt': '7-140453136-A-T', 'annovar': []})
+
+    def test_detail_payloads(self):
+        self.assertEqual(self.get('/genes/symbol/BRAF/', fields='approved_symbol').json(), {'approved_symbol': 'BRAF'})
+        self.assertEqual(self.get('/aa-changes/short_name/V600E/', fields='long_name,stats').json(),
+                         {'long_name': 'ENSP00000288602.6:p.Val600Glu', 'stats': mock.ANY})
+        response = self.get('/variants/cpra/chr7:140453136:A:T/', fields='chrom_pos_ref_alt,gene')
+        self.assertEqual(set(response.json()), {'chrom_pos_ref_alt', 'gene'})
+        self.assertEqual(response.json()['gene']['approved_symbol'], 'BRAF')
+        self.assertEqual(self.get('/genes/symbol/NOTAGENE/', fields='approved_symbol').status_code, 404)
+
+    def test_unknown_fields(self):
+        for path in ('/genes/', '/genes/symbol/BRAF/', f'/variants/{self.braf_variant.pk}/', '/transcripts/'):
+            self.assertEqual(self.get(path, fields='nonexistent').status_code, 400, path)
+            self.assertEqual(self.get(path, expand='nonexistent').status_code, 400, path)
+
+
+class PayloadCacheTests(ApiTestCase):
+
+    def get_gene(self):
+        response = self.client.get('/genes/symbol/BRAF/', HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_cached_until_the_data_changes(self):
+        annotation = models.GeneAnnotation.objects.create(gene=self.braf, annotation='Before', priority=1)
+        self.assertEqual(self.get_gene().json()['annotations'][0]['annotation'], 'Before')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_gene().json()['annotations'][0]['annotation'], 'Before')
+
+        version = response_cache.data_version()
+        annotation.annotation = 'After'
+        with self.captureOnCommitCallbacks(execute=True):
+            annotation.save()
+        self.assertGreater(response_cache.data_version(), version)
+        self.assertEqual(self.get_gene().json()['annotations'][0]['annotation'], 'After')
+
+    def test_filtered_requests_are_not_cached(self):
+        models.GeneAnnotation.objects.create(gene=self.braf, annotation='Low', priority=5)
+        response = self.client.get('/genes/symbol/BRAF/', {'max_priority': 1}, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.json()['annotations'], [])
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_not_found_is_not_cached(self):
+        self.assertEqual(self.client.get('/genes/symbol/NOTAGENE/').status_code, 404)
+        create_gene('NOTAGENE', 1)
+        self.assertEqual(self.client.get('/genes/symbol/NOTAGENE/').status_code, 200)
+
+    def test_warm_payload(self):
+        self.assertEqual(response_cache.warm_payload('gene', 'BRAF', views.gene_payload), 'built')
+        self.assertEqual(response_cache.warm_payload('gene', 'BRAF', views.gene_payload), 'cached')
+        self.assertEqual(response_cache.warm_payload('gene', 'NOTAGENE', views.gene_payload), 'missing')
+
+
+class ETagTests(ApiTestCase):
+
+    def test_not_modified(self):
+        response = self.client.get('/aa-changes/short_name/V600E/', HTTP_ACCEPT='application/json')
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/aa-changes/short_name/V600E/', HTTP_ACCEPT='application/json',
+                                       HTTP_IF_NONE_MATCH=f'"other", {etag}')
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+    def test_new_etag_once_the_data_changes(self):
+        etag = self.client.get('/variants/cpra/7-140453136-A-T/', HTTP_ACCEPT='application/json')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            models.GeneAnnotation.objects.create(gene=self.braf, annotation='New', priority=1)
+        response = self.client.get('/variants/cpra/7-140453136-A-T/', HTTP_ACCEPT='application/json',
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['gene']['annotations'][0]['annotation'], 'New')
+
+
+class CompressionTests(ApiTestCase):
+
+    def get(self, path, **headers):
+        return self.client.get(path, HTTP_ACCEPT='application/json', **headers)
+
+    def test_negotiate_encoding(self):
+        preferred = response_cache.PAYLOAD_ENCODINGS[0]
+        self.assertEqual(response_cache.negotiate_encoding(''), None)
+        self.assertEqual(response_cache.negotiate_encoding('identity, deflate'), None)
+        self.assertEqual(response_cache.negotiate_encoding('gzip'), 'gzip')
+        self.assertEqual(response_cache.negotiate_encoding('gzip, deflate, br'), preferred)
+        self.assertEqual(response_cache.negotiate_encoding('*'), preferred)
+        self.assertEqual(response_cache.negotiate_encoding('br;q=0, GZIP;q=0.5'), 'gzip')
+        self.assertEqual(response_cache.negotiate_encoding('gzip;q=0, *;q=0.1'),
+                         'br' if response_cache.brotli else None)
+        self.assertEqual(response_cache.negotiate_encoding('gzip;q=high'), None)
+
+    def test_gzip(self):
+        identity = self.get('/genes/symbol/BRAF/')
+        self.assertFalse(identity.has_header('Content-Encoding'))
+        self.assertEqual(identity.json()['approved_symbol'], 'BRAF')
+
+        response = self.get('/genes/symbol/BRAF/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), identity.content)
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(response['ETag'], response_cache.payload_etag('gene', 'BRAF', 'gzip'))
+        self.assertNotEqual(response['ETag'], identity['ETag'])
+
+        # The ETag of an encoding only matches the requests negotiating it.
+        response = self.get('/genes/symbol/BRAF/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    @skipUnless(response_cache.brotli, "brotli is not installed")
+    def test_brotli(self):
+        identity = self.get('/variants/cpra/7-140453136-A-T/')
+        response = self.get('/variants/cpra/7-140453136-A-T/', HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(response_cache.brotli.decompress(response.content), identity.content)
+
+    def test_browsable_api(self):
+        response = self.client.get('/genes/symbol/BRAF/', HTTP_ACCEPT='text/html', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertIn(b'BRAF', response.content)
+
+
+def create_annovar(variant, **scores):
+    return models.AnnovarData.objects.create(variant=variant, func_ref_gene='exonic',
+                                             gene_ref_gene=variant.gene.approved_symbol,
+                                             exonic_func_ref_gene='nonsynonymous SNV', aa_change_ref_gene='', **scores)
+
+
+class ScoreFilterTests(ApiTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        create_annovar(cls.braf_variant, cadd_phred='32', sift_score='0.0;0.01', sift_pred='D;D')
+        create_annovar(cls.kras_variant, cadd_phred='.', sift_score='0.2', sift_pred='T')
+
+    def test_parse(self):
+        self.assertEqual(annovar_scores.parse_score('.'), None)
+        self.assertEqual(annovar_scores.parse_score('.;0.5;0.7'), 0.5)
+        self.assertEqual(annovar_scores.parse_score('nan'), None)
+        self.assertEqual(annovar_scores.parse_pred('.;d'), 'D')
+        self.assertEqual(annovar_scores.parse_pred('unknown'), None)
+
+    def test_scores_follow_the_annovar_rows(self):
+        scores = models.AnnovarScores.objects.get(annovar__variant=self.braf_variant)
+        self.assertEqual((scores.cadd_phred, scores.sift_score, scores.sift_pred), (32.0, 0.0, 'D'))
+        annovar = self.kras_variant.annovar.get()
+        annovar.cadd_phred = '25.1'
+        annovar.save()
+        self.assertEqual(models.AnnovarScores.objects.get(annovar=annovar).cadd_phred, 25.1)
+
+    def test_score_filters(self):
+        self.assertEqual(annovar_scores.score_filters(['cadd_phred>=20', ' sift_pred = d ']),
+                         {'cadd_phred__gte': 20.0, 'sift_pred': 'D'})
+        for condition in ('cadd_phred>high', 'cadd_phred>nan', 'sift_pred>D', 'sift_pred=Z', 'unknown>1', 'cadd_phred'):
+            with self.assertRaises(ValueError):
+                annovar_scores.score_filters([condition])
+
+    def test_variant_list(self):
+        def listed(score):
+            response = self.client.get('/variants/', {'score': score}, HTTP_ACCEPT='application/json')
+            self.assertEqual(response.status_code, 200)
+            return [variant['chrom_pos_ref_alt'] for variant in response.json()['results']]
+
+        self.assertEqual(listed('cadd_phred>20'), ['7-140453136-A-T'])
+        self.assertEqual(listed('sift_score<0.5,sift_pred=T'), ['12-25398284-C-T'])
+        self.assertEqual(listed('sift_score<1'), ['12-25398284-C-T', '7-140453136-A-T'])
+        response = self.client.get('/variants/', {'score': 'cadd_phred>high'}, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ImportDiffTests(ApiTestCase):
+
+    def rows(self, *priorities):
+        return pd.DataFrame({
+            'Gene.refGene': ['BRAF'] * len(priorities),
+            'AA_change': ['V600E'] * len(priorities),
+            'annotation': [f'Annotation {number}' for number in range(len(priorities))],
+            'priority': priorities,
+            'diagnosis': [float('nan')] * len(priorities),
+        })
+
+    def test_diff(self):
+        rows = {'a': {'value': 1}, 'b': {'value': float('nan')}}
+        import_diff = imports.diff('test', rows, models.Genes)
+        self.assertEqual((import_diff.new, import_diff.changed), (['a', 'b'], {}))
+        imports.record(import_diff, {'a': self.braf.pk, 'b': self.kras.pk})
+
+        import_diff = imports.diff('test', {'a': {'value': 1}, 'b': {'value': None}}, models.Genes)
+        self.assertEqual(import_diff.summary(), {'new': 0, 'changed': 0, 'unchanged': 2, 'removed': 0})
+        import_diff = imports.diff('test', {'a': {'value': 2}, 'c': {'value': 3}}, models.Genes)
+        self.assertEqual((import_diff.new, import_diff.changed, import_diff.removed),
+                         (['c'], {'a': self.braf.pk}, {'b': self.kras.pk}))
+
+        # An unchanged row whose object was deleted is imported again.
+        kras_id = self.kras.pk
+        self.kras.delete()
+        import_diff = imports.diff('test', {'b': {'value': None}}, models.Genes)
+        self.assertEqual(import_diff.changed, {'b': kras_id})
+
+    def test_reimport(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            feedback, summary = views.process_variant_annotation_data(self.rows(1.0, 2.0, float('nan')))
+        self.assertEqual(feedback, [])
+        self.assertEqual(summary, {'new': 3, 'changed': 0, 'unchanged': 0, 'removed': 0, 'invalid': 0})
+        self.assertEqual(sorted(models.AminoAcidAnnotations.objects.values_list('priority', flat=True)), [1, 1, 2])
+
+        version = response_cache.data_version()
+        with CaptureQueriesContext(connection) as queries:
+            feedback, summary = views.process_variant_annotation_data(self.rows(1.0, 2.0, float('nan')))
+        writes = [query['sql'] for query in queries if query['sql'].split()[0] in ('INSERT', 'UPDATE', 'DELETE')]
+        self.assertEqual(writes, [])
+        self.assertEqual(summary, {'new': 0, 'changed': 0, 'unchanged': 3, 'removed': 0, 'invalid': 0})
+        self.assertEqual(response_cache.data_version(), version)
+
+        feedback, summary = views.process_variant_annotation_data(self.rows(1.0, 3.0))
+        self.assertEqual(summary, {'new': 0, 'changed': 1, 'unchanged': 1, 'removed': 1, 'invalid': 0})
+        self.assertEqual(models.AminoAcidAnnotations.objects.get(annotation='Annotation 1').priority, 3)
+        self.assertEqual(models.AminoAcidAnnotations.objects.count(), 3)
+
+        feedback, summary = views.process_variant_annotation_data(self.rows(1.0, 3.0), prune=True)
+        self.assertEqual((summary['removed'], summary['deleted']), (1, 1))
+        self.assertFalse(models.AminoAcidAnnotations.objects.filter(annotation='Annotation 2').exists())
+        self.assertFalse(models.ImportedRecord.objects.filter(key__endswith='Annotation 2').exists())
+
+    def test_existing_annotations(self):
+        annotation = models.AminoAcidAnnotations.objects.create(gene=self.braf, amino_acid=self.v600e,
+                                                                annotation='Annotation 0', priority=5)
+        feedback, summary = views.process_variant_annotation_data(self.rows(1.0, 2.0))
+        self.assertEqual(summary, {'new': 2, 'changed': 0, 'unchanged': 0, 'removed': 0, 'invalid': 0})
+        self.assertEqual(models.AminoAcidAnnotations.objects.count(), 2)
+        annotation.refresh_from_db()
+        self.assertEqual(annotation.priority, 1)
+        self.assertEqual(models.ImportedRecord.objects.get(key__endswith='Annotation 0').object_id, annotation.pk)
+
+    def test_annovar_rows(self):
+        annovar = create_annovar(self.braf_variant, cadd_phred='10')
+        columns = {column: ['.', '.'] for column in views.ANNOVAR_COLUMNS.values()}
+        columns.update({'chrom_pos_ref_alt': ['7-140453136-A-T', '12-25398284-C-T'], 'CADD_phred': ['32', '25']})
+        with CaptureQueriesContext(connection) as queries:
+            feedback, summary = views.process_annovar_data(pd.DataFrame(columns))
+        self.assertEqual((feedback, summary['new']), ([], 2))
+        annovar_reads = [query for query in queries
+                         if query['sql'].startswith('SELECT') and 'FROM "api_annovardata"' in query['sql']]
+        self.assertEqual(len(annovar_reads), 1)
+        # The row of the variant is updated rather than duplicated.
+        self.assertEqual(list(self.braf_variant.annovar.values_list('id', 'cadd_phred')), [(annovar.pk, '32')])
+        self.assertEqual(self.kras_variant.annovar.get().cadd_phred, '25')
+
+    def test_invalid_rows(self):
+        rows = self.rows(1.0)
+        rows['AA_change'] = ['G12D']
+        feedback, summary = views.process_variant_annotation_data(rows)
+        self.assertEqual((summary['new'], summary['invalid']), (1, 1))
+        self.assertEqual(feedback[0]['sheet'], 'variant_annotations')
+        self.assertFalse(models.ImportedRecord.objects.exists())
+
+
+class UploadTests(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_user('curator'))
+
+    def workbook(self, name='annotations.xlsx'):
+        rows = pd.DataFrame({'Gene.refGene': ['BRAF'], 'AA_change': ['V600E'], 'annotation': ['Hotspot'],
+                             'priority': [1], 'diagnosis': [None]})
+        content = io.BytesIO()
+        rows.to_excel(content, sheet_name='variant_annotations', index=False, engine='openpyxl')
+        return SimpleUploadedFile(name, content.getvalue())
+
+    def upload(self, file):
+        return self.client.post('/annotation-data-upload/', {'file': file}, HTTP_ACCEPT='application/json')
+
+    def test_import(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.upload(self.workbook())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['changes']['variant_annotations']['new'], 1)
+        annotation = models.AminoAcidAnnotations.objects.get(amino_acid=self.v600e)
+        self.assertEqual((annotation.annotation, annotation.priority), ('Hotspot', 1))
+
+    def test_invalid_files(self):
+        response = self.upload(SimpleUploadedFile('annotations.csv', b'gene,annotation\nBRAF,Hotspot\n'))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('file', response.json())
+
+        response = self.upload(SimpleUploadedFile('annotations.xlsx', b'not a workbook'))
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.json()['detail'].startswith("Invalid workbook"))
+
+        with override_settings(ANNOTATION_UPLOAD_MAX_BYTES=10):
+            self.assertEqual(self.upload(self.workbook()).status_code, 400)
+        self.assertFalse(models.AminoAcidAnnotations.objects.exists())
+
+    def test_uncompressed_limit(self):
+        with override_settings(ANNOTATION_UPLOAD_MAX_UNCOMPRESSED_BYTES=100):
+            response = self.upload(self.workbook())
+        self.assertEqual(response.status_code, 413)
+        self.assertIn('memory', response.json())
+        self.assertFalse(models.AminoAcidAnnotations.objects.exists())
+
+    def test_anonymous(self):
+        self.client.logout()
+        self.assertIn(self.upload(self.workbook()).status_code, (401, 403))
+
+
+class StatsTests(ApiTestCase):
+    """The stats maintained by api.signals, checked against a full recomputation (reconcile_stats)."""
+
+    def setUp(self):
+        super().setUp()
+        stats.reconcile_genes()
+        stats.reconcile_aa_changes()
+
+    def assertReconciled(self):
+        self.assertEqual(stats.reconcile_genes()[1], 0)
+        self.assertEqual(stats.reconcile_aa_changes()[1], 0)
+
+    def gene_stats(self, gene, *fields):
+        return tuple(models.GeneStats.objects.filter(gene=gene).values_list(*fields).get())
+
+    def aa_change_stats(self, aa_change, *fields):
+        return tuple(models.AAChangeStats.objects.filter(aa_change=aa_change).values_list(*fields).get())
+
+    def test_annotations(self):
+        diagnosis = models.DiagnosisCategory.objects.create(name='Lymphoma')
+        with self.captureOnCommitCallbacks(execute=True):
+            gene_annotation = models.GeneAnnotation.objects.create(gene=self.braf, annotation='Oncogene', priority=1)
+            aa_annotation = models.AminoAcidAnnotations.objects.create(gene=self.braf, amino_acid=self.v600e,
+                                                                       annotation='Hotspot', priority=1,
+                                                                       diagnosis=diagnosis)
+        self.assertEqual(self.gene_stats(self.braf, 'annotation_count', 'aa_annotation_count', 'diagnosis_counts'),
+                         (1, 1, [{'diagnosis': None, 'count': 1}, {'diagnosis': 'Lymphoma', 'count': 1}]))
+        self.assertEqual(self.aa_change_stats(self.v600e, 'annotation_count', 'diagnosis_counts'),
+                         (1, [{'diagnosis': 'Lymphoma', 'count': 1}]))
+        self.assertReconciled()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            gene_annotation.delete()
+            aa_annotation.delete()
+        self.assertEqual(self.gene_stats(self.braf, 'annotation_count', 'aa_annotation_count'), (0, 0))
+        self.assertEqual(self.aa_change_stats(self.v600e, 'annotation_count'), (0,))
+        self.assertReconciled()
+
+    def test_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            create_annovar(self.braf_variant)
+        self.assertEqual(self.gene_stats(self.braf, 'variant_count', 'exonic_func_counts'),
+                         (1, [{'exonic_func': 'nonsynonymous SNV', 'count': 1}]))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.braf_variant.gene = self.kras
+            self.braf_variant.save()
+        self.assertEqual(self.gene_stats(self.braf, 'variant_count', 'exonic_func_counts'), (0, []))
+        self.assertEqual(self.gene_stats(self.kras, 'variant_count'), (2,))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.kras_variant.delete()
+        self.assertEqual(self.gene_stats(self.kras, 'variant_count'), (1,))
+        self.assertReconciled()
+
+    def test_many_to_many(self):
+        other = models.Transcript.objects.create(ensembl_transcript_id='ENST00000496384')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.v600e.genes.add(self.kras)
+            other.aa_changes.add(self.v600e)
+        self.assertEqual(self.aa_change_stats(self.v600e, 'gene_count', 'transcript_count'), (2, 2))
+        self.assertEqual(self.gene_stats(self.kras, 'aa_change_count'), (1,))
+        self.assertReconciled()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.kras.aa_changes.clear()
+            self.v600e.transcripts.remove(other)
+        self.assertEqual(self.aa_change_stats(self.v600e, 'gene_count', 'transcript_count'), (1, 1))
+        self.assertEqual(self.gene_stats(self.kras, 'aa_change_count'), (0,))
+        self.assertReconciled()
+
+    def test_deferred(self):
+        with mock.patch.object(stats, 'refresh_genes', wraps=stats.refresh_genes) as refresh_genes, \
+                mock.patch.dict(stats.REFRESH, genes=refresh_genes):
+            with self.captureOnCommitCallbacks(execute=True), stats.deferred():
+                for number in range(3):
+                    models.GeneAnnotation.objects.create(gene=self.braf, annotation=f'Annotation {number}', priority=1)
+                models.GeneAnnotation.objects.create(gene=self.kras, annotation='Annotation', priority=1)
+        # Each gene is refreshed once.
+        self.assertEqual([call.args for call in refresh_genes.call_args_list], [({self.braf.pk, self.kras.pk},)])
+        self.assertEqual(self.gene_stats(self.braf, 'annotation_count'), (3,))
+        self.assertReconciled()
+
+    def test_bulk_writes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            annotations.create_annotations([
+                {'gene': 'BRAF', 'annotation': 'Oncogene'},
+                {'type': 'aa_change', 'gene': 'BRAF', 'aa_change': 'V600E', 'annotation': 'Hotspot'},
+            ])
+            views.process_variant_annotation_data(pd.DataFrame({
+                'Gene.refGene': ['BRAF'], 'AA_change': ['V600E'], 'annotation': ['Imported'], 'priority': [1],
+                'diagnosis': [None],
+            }))
+        self.assertEqual(self.gene_stats(self.braf, 'annotation_count', 'aa_annotation_count'), (1, 2))
+        self.assertEqual(self.aa_change_stats(self.v600e, 'annotation_count'), (2,))
+        self.assertReconciled()
+
+
+class ConsequenceParserTests(SimpleTestCase):
+
+    def test_protein_changes(self):
+        self.assertEqual(consequences.short_name('ENSP00000288602.6:p.Val600Glu'), 'V600E')
+        self.assertEqual(consequences.short_name('p.(Arg213Ter)'), 'R213*')
+        self.assertEqual(consequences.three_letter_change('G12D'), 'Gly12Asp')
+        self.assertEqual(consequences.three_letter_change('R213X'), 'Arg213Ter')
+        self.assertEqual(consequences.three_letter_change('E746_A750del'), 'Glu746_Ala750del')
+
+    def test_parse_vep(self):
+        lines = [
+            '## ENSEMBL VARIANT EFFECT PREDICTOR\n',
+            '#Uploaded_variation\tLocation\tAllele\tGene\tFeature\tFeature_type\tConsequence\tExtra\n',
+            '7-140453136-A-T\t7:140453136\tT\tENSG00000157764\tENST00000288602\tTranscript\tmissense_variant\t'
+            'SYMBOL=BRAF;HGNC_ID=HGNC:1097;HGVSp=ENSP00000288602.6:p.Val600Glu\n',
+            '7-140453137-C-T\t7:140453137\tT\tENSG00000157764\tENST00000288602\tTranscript\tsynonymous_variant\t'
+            'SYMBOL=BRAF;HGVSp=ENSP00000288602.6:p.Val600%3D\n',
+            '7-140453138-G-A\t7:140453138\tA\t-\t-\t-\tintergenic_variant\t-\n',
+        ]
+        records = list(consequences.parse_vep(lines))
+        self.assertEqual(records[0], consequences.Consequence(
+            cpra='7-140453136-A-T', transcript='ENST00000288602', refseq_transcript=None, gene='BRAF',
+            hgnc_id='HGNC:1097', hgvsp='ENSP00000288602.6:p.Val600Glu',
+        ))
+        # Unquoted, and the rows without HGVSp are skipped.
+        self.assertEqual([record.hgvsp for record in records[1:]], ['ENSP00000288602.6:p.Val600='])
+        with self.assertRaises(ValueError):
+            list(consequences.parse_vep(lines[2:]))
+
+    def test_parse_annovar(self):
+        lines = [
+            'Chr,Start,End,Ref,Alt,Func.refGene,AAChange.refGene\n',
+            '12,25398284,25398284,C,T,exonic,"KRAS:NM_004985:exon2:c.G35A:p.G12D,KRAS:NM_033360:exon2:c.G35A:p.G12D"\n',
+            '17,7577120,7577120,G,A,exonic,TP53:NM_000546:exon7:c.C637T:p.R213X\n',
+            '7,140453138,140453138,G,A,intergenic,.\n',
+        ]
+        records = list(consequences.parse_annovar(lines, delimiter=','))
+        self.assertEqual([(record.cpra, record.refseq_transcript, record.gene, record.hgvsp) for record in records], [
+            ('12-25398284-C-T', 'NM_004985', 'KRAS', 'p.Gly12Asp'),
+            ('12-25398284-C-T', 'NM_033360', 'KRAS', 'p.Gly12Asp'),
+            ('17-7577120-G-A', 'NM_000546', 'TP53', 'p.Arg213Ter'),
+        ])
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    SINGLEFLIGHT_LOCK_DIR=os.path.join(TEST_DIR, 'locks'),
+)
+class SingleFlightTests(SimpleTestCase):
+    callers = 8
+
+    def setUp(self):
+        cache.clear()
+
+    def run_concurrently(self, call):
+        """Results (or exceptions) of call() run by concurrent threads, started together."""
+        barrier = threading.Barrier(self.callers)
+        results = [None] * self.callers
+
+        def run(index):
+            barrier.wait()
+            try:
+                results[index] = call()
+            except Exception as exc:
+                results[index] = exc
+
+        threads = [threading.Thread(target=run, args=(index,)) for index in range(self.callers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def slow_build(self, builds, result=None, error=None):
+        """build() of the key 'test', slow enough for the other callers to arrive while it runs."""
+        def build():
+            builds.append(threading.get_ident())
+            time.sleep(0.2)
+            if error is not None:
+                raise error
+            cache.set('test', result)
+            return result
+        return build
+
+    def test_share(self):
+        builds = []
+        results = self.run_concurrently(lambda: singleflight.share('test', self.slow_build(builds, 'result')))
+        self.assertEqual(results, ['result'] * self.callers)
+        self.assertEqual(len(builds), 1)
+
+    def test_coalesce(self):
+        builds = []
+        results = self.run_concurrently(lambda: singleflight.coalesce('test', self.slow_build(builds, 'result')))
+        self.assertEqual(results, ['result'] * self.callers)
+        self.assertEqual(len(builds), 1)
+        self.assertEqual(os.listdir(settings.SINGLEFLIGHT_LOCK_DIR), [])
+
+    def test_coalesce_across_workers(self):
+        # Without share(), as in separate workers: the callers wait on the lock file and read the cached result.
+        builds = []
+        build = self.slow_build(builds, 'result')
+        results = self.run_concurrently(lambda: singleflight._build_across_workers('test', build))
+        self.assertEqual(results, ['result'] * self.callers)
+        self.assertEqual(len(builds), 1)
+
+    def test_errors_reach_the_waiters(self):
+        builds = []
+        error = ValueError("build failed")
+        results = self.run_concurrently(lambda: singleflight.share('test', self.slow_build(builds, error=error)))
+        self.assertEqual(results, [error] * self.callers)
+        self.assertEqual(len(builds), 1)
+        self.assertEqual(singleflight._flights, {})
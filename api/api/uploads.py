@@ -0,0 +1,100 @@
+"""
+Disk spooling and memory limits of the annotation workbook uploads (see api.views.annotation_data_upload).
+
+Django keeps uploads smaller than FILE_UPLOAD_MAX_MEMORY_SIZE in memory and streams the larger ones to a
+temporary file in FILE_UPLOAD_TEMP_DIR. The workbook is always parsed from a file on disk: openpyxl (read only
+mode, through pandas) then reads the zip members lazily instead of holding the whole upload in the worker.
+
+Workbooks are rejected before parsing when their worksheets would expand beyond
+ANNOTATION_UPLOAD_MAX_UNCOMPRESSED_BYTES, and imports stop before writing anything when the resident memory of
+the worker exceeds ANNOTATION_IMPORT_MAX_RSS_MB. The peak RSS is reported with the import results.
+"""
+import logging
+import os
+import resource
+import shutil
+import tempfile
+import zipfile
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class InvalidWorkbook(Exception):
+    pass
+
+
+def _rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        # Not Linux, the peak is the best estimate.
+        return _peak_rss_bytes()
+
+
+def _peak_rss_bytes():
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+@contextmanager
+def spooled_path(uploaded_file):
+    """Path of an uploaded file on disk, copying it to a temporary file when Django kept it in memory."""
+    if hasattr(uploaded_file, 'temporary_file_path'):
+        yield uploaded_file.temporary_file_path()
+        return
+    with tempfile.NamedTemporaryFile(suffix='.xlsx', dir=settings.FILE_UPLOAD_TEMP_DIR) as f:
+        uploaded_file.seek(0)
+        shutil.copyfileobj(uploaded_file, f, length=1024 * 1024)
+        f.flush()
+        yield f.name
+
+
+def check_workbook(path, max_uncompressed_bytes=None):
+    """Rejects workbooks whose sheets and shared strings expand beyond the limit, e.g. zip bombs, with
+    UploadTooLarge, and files which are not a workbook with InvalidWorkbook. Only reads the zip directory."""
+    if max_uncompressed_bytes is None:
+        max_uncompressed_bytes = settings.ANNOTATION_UPLOAD_MAX_UNCOMPRESSED_BYTES
+    try:
+        with zipfile.ZipFile(path) as workbook:
+            size = sum(info.file_size for info in workbook.infolist()
+                       if info.filename.startswith('xl/worksheets/') or info.filename == 'xl/sharedStrings.xml')
+    except zipfile.BadZipFile:
+        raise InvalidWorkbook("Invalid workbook: the file is not an Excel workbook (.xlsx).")
+    if size > max_uncompressed_bytes:
+        raise UploadTooLarge(f"The workbook expands to {size / 2 ** 20:.1f} MB, "
+                             f"at most {max_uncompressed_bytes / 2 ** 20:.1f} MB can be imported.")
+    return size
+
+
+class MemoryMonitor:
+    """Tracks the resident memory of the worker during an import. check() raises UploadTooLarge beyond the limit."""
+
+    def __init__(self, max_rss_mb=None):
+        self.max_rss = (settings.ANNOTATION_IMPORT_MAX_RSS_MB if max_rss_mb is None else max_rss_mb) * 2 ** 20
+        self.start_rss = _rss_bytes()
+        # Sampled at each check()
+        self.peak_rss = self.start_rss
+
+    def check(self, stage=''):
+        rss = _rss_bytes()
+        self.peak_rss = max(self.peak_rss, rss)
+        if self.max_rss and rss > self.max_rss:
+            raise UploadTooLarge(f"The import used {rss // 2 ** 20} MB {stage}, above the limit of "
+                                 f"{self.max_rss // 2 ** 20} MB. Split the workbook.")
+
+    def report(self):
+        self.peak_rss = max(self.peak_rss, _rss_bytes())
+        return {
+            'start_rss_mb': round(self.start_rss / 2 ** 20, 1),
+            'peak_rss_mb': round(self.peak_rss / 2 ** 20, 1),
+            # Peak of the process lifetime, which can predate the import.
+            'process_peak_rss_mb': round(_peak_rss_bytes() / 2 ** 20, 1),
+        }
@@ -8,6 +8,7 @@ router = routers.DefaultRouter()
 router.register(r'variants', views.VariantViewSet)
 router.register(r'genes', views.GeneViewSet)
 router.register(r'aa-changes', views.AminoAcidChangeViewSet)
+router.register(r'transcripts', views.TranscriptViewSet)
 
 urlpatterns = [
     url(r'^', include(router.urls)),
@@ -0,0 +1,144 @@
+"""
+Compact index mapping variant keys (md5sum and chrom-pos-ref-alt, on both assemblies) to variant and gene ids.
+
+The index is a single .npy file holding a (3, N) uint64 array: the sorted 64 bit hashes of the keys,
+and the matching variant ids and gene ids (0 when the variant has no gene).
+It is built by the build_variant_index management command and memory-mapped read-only by every worker,
+so that all uWSGI workers share the same pages. Lookups are vectorized binary searches.
+"""
+import hashlib
+import logging
+import os
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from api import models, variant_keys
+from api.variant_keys import try_normalize_cpra
+
+logger = logging.getLogger(__name__)
+
+KEY_TYPES = ('cpra', 'md5sum')
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def normalize_key(key_type, key):
+    key = str(key).strip()
+    if key_type == 'md5sum':
+        return key.lower()
+    # Strings which are not a CPRA cannot match a normalized one.
+    return try_normalize_cpra(key) or key
+
+
+def hash_key(key_type, key):
+    """64 bit hash of a normalized key. The key type is part of the hash, so that all keys share one array."""
+    digest = hashlib.blake2b((key_type + ':' + normalize_key(key_type, key)).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+def hash_keys(key_type, keys):
+    return np.fromiter((hash_key(key_type, key) for key in keys), dtype=np.uint64, count=len(keys))
+
+
+def build_index_array(rows):
+    """Builds the index array from (variant_id, gene_id, md5sum, chrom_pos_ref_alt, alt_chrom_pos_ref_alt) rows."""
+    hashes = []
+    variant_ids = []
+    gene_ids = []
+    for variant_id, gene_id, md5sum, cpra, alt_cpra in rows:
+        for key_type, key in (('md5sum', md5sum), ('cpra', cpra), ('cpra', alt_cpra)):
+            if not key:
+                continue
+            hashes.append(hash_key(key_type, key))
+            variant_ids.append(variant_id)
+            gene_ids.append(gene_id or 0)
+    table = np.array([hashes, variant_ids, gene_ids], dtype=np.uint64).reshape(3, -1)
+    table = table[:, np.argsort(table[0], kind='stable')]
+    # Keep the first variant for duplicated keys, e.g. a CPRA identical on both assemblies.
+    keep = np.ones(table.shape[1], dtype=bool)
+    keep[1:] = table[0, 1:] != table[0, :-1]
+    return np.ascontiguousarray(table[:, keep])
+
+
+def build_index_file(path, chunk_size=10000):
+    """Builds the index from the database and atomically replaces the index file. Returns the number of keys."""
+    rows = models.Variants.objects.values_list(
+        'id', 'gene_id', 'md5sum', 'chrom_pos_ref_alt', 'alt_chrom_pos_ref_alt'
+    ).iterator(chunk_size=chunk_size)
+    table = build_index_array(rows)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, table)
+    os.replace(tmp_path, path)
+    return table.shape[1]
+
+
+class VariantIndex:
+    def __init__(self, path):
+        self.path = path
+        self.mtime = os.stat(path).st_mtime
+        self.table = np.load(path, mmap_mode='r')
+        self.hashes = self.table[0]
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def lookup_hashes(self, hashes):
+        """Returns the found mask, variant ids and gene ids of an array of hashes."""
+        positions = np.searchsorted(self.hashes, hashes)
+        positions = np.minimum(positions, len(self.hashes) - 1)
+        found = self.hashes[positions] == hashes
+        variant_ids = np.where(found, self.table[1][positions], 0)
+        gene_ids = np.where(found, self.table[2][positions], 0)
+        return found, variant_ids, gene_ids
+
+    def lookup(self, key_type, keys):
+        if len(keys) == 0 or len(self.hashes) == 0:
+            return [(key, None, None) for key in keys]
+        found, variant_ids, gene_ids = self.lookup_hashes(hash_keys(key_type, keys))
+        return [
+            (key, int(variant_id), int(gene_id) or None) if is_found else (key, None, None)
+            for key, is_found, variant_id, gene_id in zip(keys, found.tolist(), variant_ids.tolist(), gene_ids.tolist())
+        ]
+
+
+def get_index():
+    """Gets the index of this process, (re)loading it when the index file was rebuilt.
+    Returns None if the index file does not exist.
+    """
+    global _index
+    path = settings.VARIANT_INDEX_PATH
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        return None
+    if _index is None or _index.path != path or _index.mtime != mtime:
+        with _index_lock:
+            if _index is None or _index.path != path or _index.mtime != mtime:
+                _index = VariantIndex(path)
+                logger.info("Loaded variant index %s with %s keys" % (path, len(_index)))
+    return _index
+
+
+def lookup_in_database(key_type, keys):
+    """Fallback used when no index file was built."""
+    if key_type == 'md5sum':
+        normalized = [normalize_key(key_type, key) for key in keys]
+        rows = models.Variants.objects.filter(md5sum__in=normalized).values_list('md5sum', 'id', 'gene_id')
+        matches = {value: (variant_id, gene_id) for value, variant_id, gene_id in rows}
+        return [(key, *matches.get(value, (None, None))) for key, value in zip(keys, normalized)]
+    matches = variant_keys.resolve(keys)
+    return [(key, *matches.get(key, (None, None))) for key in keys]
+
+
+def lookup(key_type, keys):
+    """Looks up keys of a key type, returns a list of (key, variant_id, gene_id) tuples.
+    variant_id and gene_id are None when the key is unknown.
+    """
+    index = get_index()
+    if index is None:
+        return lookup_in_database(key_type, keys)
+    return index.lookup(key_type, keys)
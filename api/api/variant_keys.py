@@ -0,0 +1,111 @@
+"""
+Resolution of chrom-pos-ref-alt strings to variants through the VariantKey table.
+
+Both Variants.chrom_pos_ref_alt (settings.VARIANT_ASSEMBLY) and Variants.alt_chrom_pos_ref_alt
+(settings.VARIANT_ALT_ASSEMBLY) are stored in normalized form (api.normalize.normalize_cpra) in a single
+indexed column, so that any spelling of a CPRA on either assembly resolves with one query.
+"""
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+
+from api import models, partitioning, response_cache
+from api.normalize import normalize_cpra
+
+DEFAULT_BATCH_SIZE = 5000
+
+
+def try_normalize_cpra(cpra):
+    """Normalized CPRA, or None if the string is not a CPRA."""
+    try:
+        return normalize_cpra(cpra)
+    except ValueError:
+        return None
+
+
+def variant_keys(variant_id, cpra, alt_cpra):
+    """VariantKey rows of a variant."""
+    keys = []
+    for assembly, value in ((settings.VARIANT_ASSEMBLY, cpra), (settings.VARIANT_ALT_ASSEMBLY, alt_cpra)):
+        key = try_normalize_cpra(value) if value else None
+        if key:
+            keys.append(models.VariantKey(key=key, assembly=assembly, variant_id=variant_id))
+    return keys
+
+
+def _iter_keys(queryset, chunk_size):
+    rows = queryset.values_list('id', 'chrom_pos_ref_alt', 'alt_chrom_pos_ref_alt').iterator(chunk_size=chunk_size)
+    for variant_id, cpra, alt_cpra in rows:
+        yield from variant_keys(variant_id, cpra, alt_cpra)
+
+
+def _bulk_insert(keys, batch_size):
+    count = 0
+    while True:
+        batch = list(islice(keys, batch_size))
+        if not batch:
+            return count
+        models.VariantKey.objects.bulk_create(batch)
+        count += len(batch)
+
+
+def rebuild(batch_size=DEFAULT_BATCH_SIZE):
+    """Rebuilds the keys of all variants in one transaction. Returns the number of keys."""
+    with transaction.atomic():
+        models.VariantKey.objects.all().delete()
+        response_cache.bump_data_version()
+        return _bulk_insert(_iter_keys(models.Variants.objects.all(), batch_size), batch_size)
+
+
+def reindex_variants(variant_ids, batch_size=DEFAULT_BATCH_SIZE):
+    """Replaces the keys of some variants, e.g. after importing them. The callers invalidate the cached payloads,
+    the saves of the variants do (api.signals)."""
+    with transaction.atomic():
+        models.VariantKey.objects.filter(variant_id__in=variant_ids).delete()
+        return _bulk_insert(_iter_keys(models.Variants.objects.filter(id__in=variant_ids), batch_size), batch_size)
+
+
+def variants_by_cpra(cpra, assembly=None):
+    """Queryset of the variants with a CPRA, on a given assembly or any of them."""
+    key = try_normalize_cpra(cpra)
+    if key is None:
+        return models.Variants.objects.none()
+    if partitioning.partitioning_enabled():
+        return _partitioned_variants_by_key(key, assembly)
+    if assembly:
+        return models.Variants.objects.filter(keys__key=key, keys__assembly=assembly)
+    return models.Variants.objects.filter(keys__key=key)
+
+
+def _partitioned_variants_by_key(key, assembly):
+    """variants_by_cpra() reading only the partition of the chromosome of the key: the variants are selected
+    by id and chr, which the key gives for the keys on VARIANT_ASSEMBLY."""
+    keys = models.VariantKey.objects.filter(key=key)
+    if assembly:
+        keys = keys.filter(assembly=assembly)
+    matches = list(keys.values_list('variant_id', 'assembly'))
+    queryset = models.Variants.objects.filter(id__in=[variant_id for variant_id, key_assembly in matches])
+    if matches and all(key_assembly == settings.VARIANT_ASSEMBLY for variant_id, key_assembly in matches):
+        queryset = queryset.filter(chr__in=partitioning.chromosome_values(key.split('-')[0]))
+    return queryset
+
+
+def resolve(cpras, assembly=None):
+    """Resolves CPRAs with one query, returns a dict of CPRA -> (variant_id, gene_id) for the ones found.
+
+    When a CPRA matches different variants on the two assemblies, the variant on settings.VARIANT_ASSEMBLY wins.
+    """
+    normalized = {}
+    for cpra in cpras:
+        key = try_normalize_cpra(cpra)
+        if key:
+            normalized.setdefault(key, []).append(cpra)
+    queryset = models.VariantKey.objects.filter(key__in=list(normalized))
+    if assembly:
+        queryset = queryset.filter(assembly=assembly)
+    matches = {}
+    for key, key_assembly, variant_id, gene_id in queryset.values_list('key', 'assembly', 'variant_id', 'variant__gene_id'):
+        if key not in matches or key_assembly == settings.VARIANT_ASSEMBLY:
+            matches[key] = (variant_id, gene_id)
+    return {cpra: matches[key] for key, inputs in normalized.items() if key in matches for cpra in inputs}
@@ -1,3 +1,4 @@
+import json
 import logging
 import re
 import time
@@ -5,31 +6,238 @@ import time
 import pandas as pd
 import math
 
+from asgiref.sync import sync_to_async
 from django.db.models import Q
-from django.db import connection
+from django.db import connection, transaction
 from django.db.models.query import Prefetch
 from django.http.response import HttpResponse, HttpResponseForbidden, HttpResponseNotAllowed
-from django.http import JsonResponse, HttpResponseNotFound
+from django.http import JsonResponse, HttpResponseNotFound, HttpResponseBadRequest, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.dateparse import parse_datetime
 from rest_framework import viewsets, filters, permissions
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
 from rest_framework.permissions import IsAuthenticated, DjangoModelPermissions
-from rest_framework.decorators import action, api_view, authentication_classes, permission_classes
+from rest_framework.decorators import action, api_view, authentication_classes, parser_classes, permission_classes
 from rest_framework.response import Response
 
 
-from api import models, serializers
+from api import annotations, annovar_scores, export, identifiers, imports, models, partitioning, response_cache, serializers, singleflight, stats, uploads, variant_index, variant_keys
+from api import search as search_backend
+from api.normalize import normalize_identifier
+from api.parsers import NDJSONParser
 
 # Get an instance of a logger
 logger = logging.getLogger(__name__)
 
 
+MAX_EXISTS_KEYS = 100000
+
+
 class StandardResultsSetPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = 'page_size'
     max_page_size = 1000
 
 
-class GeneViewSet(viewsets.ModelViewSet):
+def gene_payload(symbol, annotation_filters=None):
+    instance = models.Genes.objects.filter(approved_symbol=symbol).select_related('stats').prefetch_related(
+                                                                    Prefetch('annotations', queryset=annotations.annotation_queryset(models.GeneAnnotation, annotation_filters)),
+                                                                    ).first()
+    if instance:
+        return serializers.GeneDetailSerializer(instance, many=False).data
+    return None
+
+
+def aa_change_payload(short_name, annotation_filters=None):
+    instance = models.AminoAcidChange.objects.filter(short_name=short_name).select_related('stats').prefetch_related(
+                                                                    Prefetch('annotations', queryset=annotations.annotation_queryset(models.AminoAcidAnnotations, annotation_filters)),
+                                                                    Prefetch('genes', queryset=models.Genes.objects.all()),
+                                                                    Prefetch('genes__annotations', queryset=annotations.annotation_queryset(models.GeneAnnotation, annotation_filters)),
+                                                                    Prefetch('transcripts', queryset=models.Transcript.objects.all()),
+                                                                    ).first()
+    if instance:
+        return serializers.AminoAcidWithAnnotationsSerializer(instance, many=False).data
+    return None
+
+
+def variant_payload(cpra, assembly=None, annotation_filters=None):
+    instance = variant_keys.variants_by_cpra(cpra, assembly).prefetch_related(
+                                                                    'transcripts',
+                                                                    'gene',
+                                                                    'transcripts__aa_changes',
+                                                                    Prefetch('transcripts__aa_changes__annotations', queryset=annotations.annotation_queryset(models.AminoAcidAnnotations, annotation_filters)),
+                                                                    Prefetch('gene__annotations', queryset=annotations.annotation_queryset(models.GeneAnnotation, annotation_filters)),
+                                                                    ).first()
+    if instance:
+        return serializers.VariantSerializer(instance, many=False).data
+    return None
+
+
+# Detail payloads cached by api.response_cache and precomputed by the warm_cache command.
+PAYLOAD_BUILDERS = {
+    'gene': gene_payload,
+    'aa_change': aa_change_payload,
+    'variant': variant_payload,
+}
+
+
+def cached_payload_response(request, kind, key, build, not_found):
+    """Response of a cached detail payload (see api.response_cache) with its ETag, 304 when the client holds it.
+
+    JSON responses are sent as stored, compressed in the encoding negotiated with Accept-Encoding.
+    The browsable API renders the payload.
+    """
+    json_response = request.accepted_renderer.format == 'json'
+    encoding = response_cache.negotiate_encoding(request.headers.get('Accept-Encoding', '')) if json_response else None
+    etag = response_cache.payload_etag(kind, key, encoding)
+    if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+        response_cache.record_access(kind, key)
+        return Response(status=304, headers={'ETag': etag, 'Vary': 'Accept, Accept-Encoding'})
+    document = response_cache.get_payload(kind, key, build)
+    if document is None:
+        return HttpResponseNotFound(not_found)
+    if not json_response:
+        return Response(json.loads(response_cache.payload_json(document)), headers={'ETag': etag})
+    response = HttpResponse(document[encoding] if encoding else response_cache.payload_json(document),
+                            content_type='application/json')
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+    return response
+
+
+def cached_payload(kind, key, build):
+    """Cached detail payload of a key, decoded (see api.response_cache.get_payload)."""
+    document = response_cache.get_payload(kind, key, build)
+    return None if document is None else json.loads(response_cache.payload_json(document))
+
+
+def shared_payload(kind, build, *args):
+    """Payload of filtered requests, which is not cached: the concurrent identical requests of the worker share it
+    (see api.singleflight)."""
+    return singleflight.share((kind,) + tuple(repr(arg) for arg in args), lambda: build(*args))
+
+
+def request_annotation_filters(request):
+    try:
+        return annotations.annotation_filters(request.query_params)
+    except ValueError as exc:
+        raise ParseError(str(exc))
+
+
+def request_score_filters(request):
+    """Lookups on Variants of the ?score=cadd_phred>20,sift_pred=D parameters (see api.annovar_scores.score_filters)."""
+    conditions = [value for param in request.query_params.getlist('score') for value in param.split(',') if value.strip()]
+    try:
+        filters = annovar_scores.score_filters(conditions)
+    except ValueError as exc:
+        raise ParseError(str(exc))
+    return {'annovar__scores__' + lookup: value for lookup, value in filters.items()}
+
+
+def request_region_filters(request):
+    """Lookups on Variants of ?region=7:140453000-140454000, the variants starting in the region. The chr
+    condition also selects the partition of the chromosome (see api.partitioning)."""
+    region = request.query_params.get('region')
+    if not region:
+        return {}
+    try:
+        chrom, start, end = partitioning.parse_region(region)
+    except ValueError as exc:
+        raise ParseError(str(exc))
+    return {'chr__in': partitioning.chromosome_values(chrom), 'start_pos__gte': start, 'start_pos__lte': end}
+
+
+class SparseFieldsViewSetMixin:
+    """
+    ?fields=a,b restricts the list and retrieve responses to some fields and ?expand=c,d adds the nested
+    relations listed in the expandable_fields of the serializer (see serializers.SparseFieldsMixin).
+    The queryset only loads the selected columns and the relations of the selected fields.
+
+    The detail payloads of the payload_actions (see detail_payload_response) include their relations:
+    ?fields= picks their top level fields. Unknown names are refused (400).
+    """
+    sparse_actions = ('list', 'retrieve')
+    payload_actions = ()
+    # Serializer of the detail payloads
+    payload_serializer_class = None
+
+    def _query_param_list(self, name):
+        value = self.request.query_params.get(name)
+        if value is None:
+            return None
+        return [item.strip() for item in value.split(',') if item.strip()]
+
+    def sparse_fields(self):
+        """(fields, expand) of the request. fields is None when all the default fields are requested."""
+        if self.action in self.payload_actions:
+            known = set(self.payload_serializer_class().fields)
+        elif self.action in self.sparse_actions:
+            serializer_class = self.get_serializer_class()
+            known = set(serializer_class().fields) | set(serializer_class.expandable_fields)
+        else:
+            return None, []
+        fields = self._query_param_list('fields')
+        expand = self._query_param_list('expand') or []
+        unknown = [name for name in (fields or []) + expand if name not in known]
+        if unknown:
+            raise ParseError("Unknown fields: %s." % ", ".join(unknown))
+        return fields, expand
+
+    def detail_payload_response(self, kind, key, build, args, not_found):
+        """Response of a detail payload, cached under key (see cached_payload_response), or when key is None
+        built with build(*args) and shared with the concurrent identical requests. Narrowed down to ?fields=."""
+        fields, expand = self.sparse_fields()
+        if key is not None and fields is None:
+            return cached_payload_response(self.request, kind, key, build, not_found)
+        data = cached_payload(kind, key, build) if key is not None else shared_payload(kind, build, *args)
+        if data is None:
+            return HttpResponseNotFound(not_found)
+        if fields is not None:
+            data = {name: value for name, value in data.items() if name in fields or name in expand}
+        return Response(data)
+
+    def get_serializer(self, *args, **kwargs):
+        fields, expand = self.sparse_fields()
+        kwargs.setdefault('fields', fields)
+        kwargs.setdefault('expand', expand)
+        return super().get_serializer(*args, **kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in self.sparse_actions:
+            return queryset
+        fields, expand = self.sparse_fields()
+        serializer_class = self.get_serializer_class()
+        selected = set(serializer_class().fields if fields is None else fields) | set(expand)
+        select_related = [lookup for name in selected for lookup in serializer_class.select_related_fields.get(name, ())]
+        prefetch_related = [lookup for name in selected for lookup in serializer_class.prefetch_related_fields.get(name, ())]
+        if fields is not None:
+            meta = queryset.model._meta
+            columns = {field.name for field in meta.concrete_fields} & selected
+            # Relations loaded with select_related can't be deferred.
+            queryset = queryset.only(meta.pk.name, *columns, *(lookup.split('__')[0] for lookup in select_related))
+        return queryset.select_related(*select_related).prefetch_related(*self.annotation_prefetches(queryset.model, prefetch_related))
+
+    def annotation_prefetches(self, model, lookups):
+        """Applies the diagnosis and priority filters (see api.annotations.annotation_filters) to the prefetched annotations."""
+        filters = request_annotation_filters(self.request)
+        prefetches = []
+        for lookup in lookups:
+            related_model = model
+            for part in lookup.split('__'):
+                related_model = related_model._meta.get_field(part).related_model
+            if related_model in (models.GeneAnnotation, models.AminoAcidAnnotations):
+                lookup = Prefetch(lookup, queryset=annotations.annotation_queryset(related_model, filters))
+            prefetches.append(lookup)
+        return prefetches
+
+
+class GeneViewSet(SparseFieldsViewSetMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows viewing/editing Genes.
     """
@@ -38,31 +246,65 @@ class GeneViewSet(viewsets.ModelViewSet):
     serializer_class = serializers.GeneSerializer
     filter_backends = (filters.SearchFilter, )
     search_fields = ('approved_symbol', 'approved_name', 'alias_symbols')
+    payload_actions = ('get_by_symbol',)
+    payload_serializer_class = serializers.GeneDetailSerializer
 
     @action(detail=False, permission_classes=[permissions.AllowAny], url_path='symbol/(?P<symbol>[^/]+)', url_name='symbol')
     def get_by_symbol(self, request, *args, **kwargs):
         start = time.time()
         symbol = kwargs['symbol']
-        instance = models.Genes.objects.filter(approved_symbol=symbol).prefetch_related(
-                                                                        Prefetch('variants', queryset=models.Variants.objects.filter(gene__approved_symbol=symbol)),
-                                                                        Prefetch('annotations', queryset=models.GeneAnnotation.objects.filter(gene__approved_symbol=symbol)),
-                                                                        ).first()
-        if instance:
-            print(f"Number of queries pre-serialization: {len(connection.queries)}")
-            serializer_start = time.time()
-            serializer = serializers.FullGeneSerializer(instance, context={'request': request}, many=False)
-            data = serializer.data
-            serializer_time = time.time() - serializer_start
-            print(f"Serializer time: {serializer_time}")
-            print(f"Number of queries post-serialization: {len(connection.queries)}")
-            time_diff = time.time() - start
-            print(f"Full queryset time: {time_diff}")
-            return Response(data)
-        else:
+        annotation_filters = request_annotation_filters(request)
+        response = self.detail_payload_response('gene', None if annotation_filters else symbol, gene_payload,
+                                                (symbol, annotation_filters), 'No gene associated with that symbol.')
+        logger.debug("Gene %s served in %.3fs" % (kwargs['symbol'], time.time() - start))
+        return response
+
+    @action(detail=False, permission_classes=[permissions.AllowAny], url_path='symbol/(?P<symbol>[^/]+)/annotations', url_name='symbol-annotations')
+    def get_annotations_by_symbol(self, request, *args, **kwargs):
+        """Gene and amino acid change annotations of a gene by priority, filtered with ?diagnosis=,
+        ?min_priority= and ?max_priority= (see api.annotations.annotation_filters)."""
+        annotation_filters = request_annotation_filters(request)
+        gene = models.Genes.objects.filter(approved_symbol=kwargs['symbol']).only('id').first()
+        if not gene:
             return HttpResponseNotFound('No gene associated with that symbol.')
-
-
-class VariantViewSet(viewsets.ModelViewSet):
+        gene_annotations = annotations.annotation_queryset(models.GeneAnnotation, annotation_filters).filter(gene=gene)
+        aa_annotations = annotations.annotation_queryset(models.AminoAcidAnnotations, annotation_filters).filter(gene=gene)
+        return Response({
+            'annotations': serializers.GeneAnnotationSerializer(gene_annotations, many=True).data,
+            'aa_annotations': serializers.AminoAcidAnnotationSerializer(aa_annotations, many=True).data,
+        })
+
+    @action(detail=False, permission_classes=[permissions.AllowAny], url_path='symbol/(?P<symbol>[^/]+)/variants', url_name='symbol-variants')
+    def get_variants_by_symbol(self, request, *args, **kwargs):
+        """Page of the variants of a gene, filtered with ?search=<cpra or hgvsg prefix>, ?chr=, ?func=, ?exonic_func=
+        and ?score=<score><op><number> (e.g. cadd_phred>20)."""
+        gene = models.Genes.objects.filter(approved_symbol=kwargs['symbol']).only('id').first()
+        if not gene:
+            return HttpResponseNotFound('No gene associated with that symbol.')
+        queryset = models.Variants.objects.filter(gene=gene).order_by('chrom_pos_ref_alt')
+        params = request.query_params
+        search = params.get('search', '').strip()
+        if search:
+            queryset = queryset.filter(
+                Q(chrom_pos_ref_alt__startswith=search) | Q(alt_chrom_pos_ref_alt__startswith=search) |
+                Q(hgvsg_id__istartswith=search) | Q(alt_hgvsg_id__istartswith=search)
+            )
+        if params.get('chr'):
+            queryset = queryset.filter(chr=params['chr'])
+        # One filter call so that all conditions apply to the same Annovar row. Variants can have several rows.
+        annovar_filters = request_score_filters(request)
+        if params.get('func'):
+            annovar_filters['annovar__func_ref_gene'] = params['func']
+        if params.get('exonic_func'):
+            annovar_filters['annovar__exonic_func_ref_gene'] = params['exonic_func']
+        if annovar_filters:
+            queryset = queryset.filter(**annovar_filters).distinct()
+        page = self.paginate_queryset(queryset)
+        serializer = serializers.VariantSearchSerializer(page, context={'request': request}, many=True)
+        return self.get_paginated_response(serializer.data)
+
+
+class VariantViewSet(SparseFieldsViewSetMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows viewing/editing Variants.
     """
@@ -71,77 +313,91 @@ class VariantViewSet(viewsets.ModelViewSet):
     serializer_class = serializers.VariantSerializer
     filter_backends = (filters.SearchFilter, )
     search_fields = ('chrom_pos_ref_alt', 'refseq_hgvsg_id', 'alt_hgvsg_id', 'hgvsg_id', 'lrg_hgvsg_id', 'transcripts__ensembl_transcript_id')
+    payload_actions = ('get_by_chrom_pos_ref_alt',)
+    payload_serializer_class = serializers.VariantSerializer
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            queryset = queryset.filter(**request_region_filters(self.request))
+            # ?score=cadd_phred>20, served from the indexes of the AnnovarScores table.
+            score_filters = request_score_filters(self.request)
+            if score_filters:
+                queryset = queryset.filter(**score_filters).distinct()
+        return queryset
 
     @action(detail=False, permission_classes=[permissions.AllowAny], url_path='cpra/(?P<cpra>[^/]+)', url_name='cpra')
     def get_by_chrom_pos_ref_alt(self, request, *args, **kwargs):
         start = time.time()
         cpra = kwargs['cpra']
-        instance = models.Variants.objects.filter(chrom_pos_ref_alt=cpra).prefetch_related(
-                                                                        'transcripts',
-                                                                        'gene',
-                                                                        'transcripts__aa_changes',
-                                                                        'transcripts__aa_changes__annotations',
-                                                                        'gene__annotations'
-                                                                        ).first()
-        if instance:
-            print(f"Number of queries pre-serialization: {len(connection.queries)}")
-            serializer_start = time.time()
-            serializer = serializers.VariantSerializer(instance, context={'request': request}, many=False)
-            data = serializer.data
-            serializer_time = time.time() - serializer_start
-            print(f"Serializer time: {serializer_time}")
-            print(f"Number of queries post-serialization: {len(connection.queries)}")
-            time_diff = time.time() - start
-            print(f"Full queryset time: {time_diff}")
-            return Response(data)
-        else:
-            return HttpResponseNotFound('No variant associated with that Chrom-Pos-Ref-Alt.')
-
-
-class TranscriptViewSet(viewsets.ModelViewSet):
+        assembly = request.query_params.get('assembly')
+        annotation_filters = request_annotation_filters(request)
+        # Cached under the normalized CPRA, so that all spellings share the payload.
+        key = None if assembly or annotation_filters else variant_keys.try_normalize_cpra(cpra) or cpra
+        response = self.detail_payload_response('variant', key, variant_payload, (cpra, assembly, annotation_filters),
+                                                'No variant associated with that Chrom-Pos-Ref-Alt.')
+        logger.debug("Variant %s served in %.3fs" % (cpra, time.time() - start))
+        return response
+
+
+    @action(detail=False, methods=['get', 'post'], permission_classes=[permissions.AllowAny], url_path='exists', url_name='exists')
+    def exists(self, request, *args, **kwargs):
+        """
+        Bulk existence check resolving CPRAs (on either assembly) and md5sums to variant and gene ids.
+        Keys are passed as comma separated "cpra" and "md5sum" query parameters, or as lists in a POST body.
+        """
+        if request.method == 'POST' and not isinstance(request.data, dict):
+            return Response({'detail': "The body must be an object of key lists, e.g. {\"cpra\": [...]}."}, status=400)
+        results = []
+        for key_type in variant_index.KEY_TYPES:
+            if request.method == 'POST':
+                keys = request.data.get(key_type, [])
+                if isinstance(keys, str):
+                    keys = [keys]
+                if not isinstance(keys, list) or not all(isinstance(key, str) for key in keys):
+                    return Response({'detail': f"{key_type} must be a list of strings."}, status=400)
+            else:
+                keys = [x for x in request.query_params.get(key_type, '').split(',') if x]
+            if len(keys) > MAX_EXISTS_KEYS:
+                return Response({'detail': f"At most {MAX_EXISTS_KEYS} {key_type} keys can be checked per request."}, status=400)
+            for key, variant_id, gene_id in variant_index.lookup(key_type, keys):
+                results.append({'key': key, 'key_type': key_type, 'exists': variant_id is not None, 'variant': variant_id, 'gene': gene_id})
+        return Response({'results': results})
+
+
+class TranscriptViewSet(SparseFieldsViewSetMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows viewing/editing Transcripts.
     """
     pagination_class = StandardResultsSetPagination
-    queryset = models.Transcript.objects.all()
+    queryset = models.Transcript.objects.all().order_by('ensembl_transcript_id')
     serializer_class = serializers.TranscriptSerializer
     filter_backends = (filters.SearchFilter, )
     search_fields = ('ensembl_transcript_id',)
 
 
-class AminoAcidChangeViewSet(viewsets.ModelViewSet):
+class AminoAcidChangeViewSet(SparseFieldsViewSetMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows viewing/editing Amino Acid Changes.
     """
     pagination_class = StandardResultsSetPagination
-    queryset = models.AminoAcidChange.objects.all()
+    queryset = models.AminoAcidChange.objects.all().order_by('id')
     serializer_class = serializers.AminoAcidChangeSerializer
     filter_backends = (filters.SearchFilter, )
     search_fields = ('long_name','short_name',)
+    payload_actions = ('get_by_name',)
+    payload_serializer_class = serializers.AminoAcidWithAnnotationsSerializer
 
     @action(detail=False, permission_classes=[permissions.AllowAny], url_path='short_name/(?P<short_name>[^/]+)', url_name='short_name')
     def get_by_name(self, request, *args, **kwargs):
         start = time.time()
         short_name = kwargs['short_name']
-        instance = models.AminoAcidChange.objects.filter(short_name=short_name).prefetch_related(
-                                                                        Prefetch('annotations', queryset=models.AminoAcidAnnotations.objects.all()),
-                                                                        Prefetch('genes', queryset=models.Genes.objects.all()),
-                                                                        Prefetch('genes__annotations', queryset=models.GeneAnnotation.objects.all()),
-                                                                        Prefetch('transcripts', queryset=models.Transcript.objects.all()),
-                                                                        ).first()
-        if instance:
-            print(f"Number of queries pre-serialization: {len(connection.queries)}")
-            serializer_start = time.time()
-            serializer = serializers.AminoAcidWithAnnotationsSerializer(instance, context={'request': request}, many=False)
-            data = serializer.data
-            serializer_time = time.time() - serializer_start
-            print(f"Serializer time: {serializer_time}")
-            print(f"Number of queries post-serialization: {len(connection.queries)}")
-            time_diff = time.time() - start
-            print(f"Full queryset time: {time_diff}")
-            return Response(data)
-        else:
-            return HttpResponseNotFound('No amino acid change associated with that name.')
+        annotation_filters = request_annotation_filters(request)
+        response = self.detail_payload_response('aa_change', None if annotation_filters else short_name,
+                                                aa_change_payload, (short_name, annotation_filters),
+                                                'No amino acid change associated with that name.')
+        logger.debug("Amino acid change %s served in %.3fs" % (kwargs['short_name'], time.time() - start))
+        return response
 
 
 @api_view(['GET'])
@@ -154,54 +410,12 @@ def search(request):
     """
 
     start = time.time()
-    search_term = request.query_params.get('query', '')
-    if search_term:
-        search_terms = search_term.split(' ')
-        search_terms = [x for x in search_terms if x] # filter out blank strings
-        gene_fields = ['alias_symbols__icontains', 'approved_name__icontains', 'approved_symbol__icontains']
-        or_condition = Q()
-        for search_term in search_terms:
-            for key in gene_fields:
-                or_condition.add(Q(**{key: search_term}), Q.OR)
-        gene_queryset = models.Genes.objects.filter(or_condition).order_by('approved_symbol')
-        aa_fields = ['long_name__icontains', 'short_name__icontains']
-        or_condition = Q()
-        for search_term in search_terms:
-            for key in aa_fields:
-                or_condition.add(Q(**{key: search_term}), Q.OR)
-        aa_queryset = models.AminoAcidChange.objects.filter(or_condition)
-        transcript_fields = ['ensembl_transcript_id__icontains']
-        or_condition = Q()
-        for search_term in search_terms:
-            for key in transcript_fields:
-                or_condition.add(Q(**{key: search_term}), Q.OR)
-        trans_matches = models.Transcript.objects.filter(or_condition)
-        trans_var_matches = []
-        for transcript in trans_matches:
-            for v in transcript.variants.all():
-                trans_var_matches.append(v.id)
-        trans_var_matches = list(set(trans_var_matches))
-        variant_fields = ['chrom_pos_ref_alt__icontains', 'alt_chrom_pos_ref_alt__icontains', 'refseq_hgvsg_id__icontains', 'alt_hgvsg_id__icontains', 'hgvsg_id__icontains', 'lrg_hgvsg_id__icontains']
-        or_condition = Q()
-        if len(trans_var_matches) > 0:
-            or_condition.add(Q(id__in=trans_var_matches), Q.OR)
-        for search_term in search_terms:
-            for key in variant_fields:
-                or_condition.add(Q(**{key: search_term}), Q.OR)
-        variant_queryset = models.Variants.objects.filter(or_condition).order_by('chrom_pos_ref_alt')
-    else:
-        variant_queryset = models.Variants.objects.order_by('chrom_pos_ref_alt')
+    search_terms = search_backend.split_search_terms(request.query_params.get('query', ''))
+    results = search_backend.run_search(search_terms)
 
     time_diff = time.time() - start
     print(f"Full queryset time: {time_diff}")
     print(f"Number of queries pre-serialization: {len(connection.queries)}")
-    if not gene_queryset:
-        gene_queryset = {}
-    if not variant_queryset:
-        variant_queryset = {}
-    if not aa_queryset:
-        aa_queryset = {}
-    results = {'search_genes': gene_queryset, 'search_aa_changes': aa_queryset, 'search_variants': variant_queryset}
 
     serializer = serializers.SearchSerializer(results, context={'request': request})
 
@@ -212,38 +426,177 @@ def search(request):
     return Response(serializer.data)
 
 
+async def async_search(request):
+    """
+    API endpoint that allows user to search for Genes and Variants.
+    Same results as search(), with the per-table queries running concurrently when served under ASGI.
+    """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+
+    start = time.time()
+    search_terms = search_backend.split_search_terms(request.GET.get('query', ''))
+    results = await search_backend.run_search_async(search_terms)
+    logger.debug("Search %r queried in %.3fs" % (search_terms, time.time() - start))
+
+    data = await sync_to_async(lambda: serializers.SearchSerializer(results, context={'request': request}).data)()
+    logger.debug("Search %r served in %.3fs" % (search_terms, time.time() - start))
+
+    return JsonResponse(data)
+
+
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([])
+def resolve_identifier(request, identifier):
+    """
+    API endpoint resolving an HGVS notation or accession (Ensembl, RefSeq or LRG, with or without version)
+    to the variants, transcripts and amino acid changes it identifies.
+    """
+    matches = [
+        {'source': x['source'], 'variant': x['variant_id'], 'transcript': x['transcript_id'], 'aa_change': x['aa_change_id']}
+        for x in identifiers.resolve(identifier)
+    ]
+    if not matches:
+        return HttpResponseNotFound('No variant, transcript or amino acid change associated with that identifier.')
+    return Response({'identifier': identifier, 'normalized': normalize_identifier(identifier), 'matches': matches})
+
+
 @api_view(['POST'])
-@permission_classes((IsAuthenticated))
-def annotation_data_upload(request):
-    try:
-        file_serializer = serializers.AnnotationDataFileSerializer(data=request.data)
+@permission_classes((IsAuthenticated, ))
+@parser_classes((JSONParser, NDJSONParser))
+def bulk_annotations(request):
+    """
+    API endpoint creating up to MAX_BULK_ANNOTATIONS gene and amino acid change annotations in one transaction
+    (see api.annotations for the item format). The body is a JSON list, an {"annotations": [...]} object,
+    or NDJSON (Content-Type: application/x-ndjson).
 
-        if file_serializer.is_valid():
-            # valid file upload
-            xls = pd.ExcelFile(request.FILES['file'], engine='openpyxl')
-            feedback_items = process_annotation_file(xls)
-            return Response({"message": "Successful import!", "feedback": feedback_items})
-        else:
-            return Response(file_serializer.errors)
-    except:
-        import traceback
-        tb_string = traceback.format_exc()
-        print(f"Annotation data upload error!\n {tb_string}")
+    With ?atomic=true nothing is created when an item is invalid. The response holds one result per item.
+    """
+    start = time.time()
+    items = request.data
+    if isinstance(items, dict):
+        items = items.get('annotations')
+    if not isinstance(items, list):
+        return Response({'detail': "Expected a list of annotations."}, status=400)
+    if len(items) > annotations.MAX_BULK_ANNOTATIONS:
+        return Response({'detail': f"At most {annotations.MAX_BULK_ANNOTATIONS} annotations can be created per request."}, status=400)
+    atomic = request.query_params.get('atomic', '').lower() in ('1', 'true', 'yes')
+    results = annotations.create_annotations(items, user=request.user, atomic=atomic)
+    counts = {}
+    for result in results:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    logger.info("Bulk annotations: %s in %.2fs" % (counts, time.time() - start))
+    status = 400 if atomic and counts.get('invalid') else 200
+    return Response({'counts': counts, 'results': results}, status=status)
+
+
+def variant_export(request):
+    """
+    API endpoint streaming every variant with its transcripts, amino acid changes and annotations.
+
+    Query parameters:
+        file_format: "ndjson" (gzip compressed, default) or "parquet".
+        since: ISO 8601 timestamp, only exports what was created or annotated after it.
+            The X-Export-Snapshot response header holds the value to pass as since for the next incremental export.
+        chunk_size: number of variants loaded at a time.
+    """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    export_format = request.GET.get('file_format', 'ndjson')
+    if export_format not in export.EXPORT_FORMATS:
+        return HttpResponseBadRequest("file_format must be one of %s." % ", ".join(export.EXPORT_FORMATS))
+    if export_format == 'parquet' and not export.parquet_available():
+        return HttpResponseBadRequest("Parquet export is not available on this server.")
+    since = None
+    if request.GET.get('since'):
+        since = parse_datetime(request.GET['since'])
+        if since is None:
+            return HttpResponseBadRequest("since must be an ISO 8601 timestamp.")
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+    try:
+        chunk_size = int(request.GET.get('chunk_size', export.DEFAULT_CHUNK_SIZE))
+    except ValueError:
+        return HttpResponseBadRequest("chunk_size must be an integer.")
+    chunk_size = max(1, min(chunk_size, 10000))
+
+    snapshot = timezone.now()
+    stream = export.export_stream(export_format, export.export_queryset(since), chunk_size)
+    if export_format == 'ndjson':
+        # A gzip file rather than a gzip Content-Encoding, which clients would decode into a plain NDJSON file
+        # saved under the .gz name.
+        response = StreamingHttpResponse(stream, content_type='application/gzip')
+        filename = 'variants.ndjson.gz'
+    else:
+        response = StreamingHttpResponse(stream, content_type='application/vnd.apache.parquet')
+        filename = 'variants.parquet'
+    response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+    response['X-Export-Snapshot'] = snapshot.isoformat()
+    return response
 
 
-def process_annotation_file(xls):
+@api_view(['POST'])
+@permission_classes((IsAuthenticated, ))
+def annotation_data_upload(request):
+    """Imports an annotation workbook. The upload is parsed from disk and the import is refused when the file is
+    not a workbook (400), or when the workbook or the memory used by the import exceed the limits of api.uploads (413)."""
+    file_serializer = serializers.AnnotationDataFileSerializer(data=request.data)
+    if not file_serializer.is_valid():
+        return Response(file_serializer.errors, status=400)
+    # ?prune=true deletes the rows of previous imports which are missing from this file.
+    prune = request.query_params.get('prune', '').lower() in ('1', 'true', 'yes')
+    memory = uploads.MemoryMonitor()
+    try:
+        with uploads.spooled_path(file_serializer.validated_data['file']) as path:
+            uploads.check_workbook(path)
+            xls = pd.ExcelFile(path, engine='openpyxl')
+            feedback_items, changes = process_annotation_file(xls, prune=prune, memory=memory)
+    except uploads.InvalidWorkbook as exc:
+        return Response({'detail': str(exc)}, status=400)
+    except uploads.UploadTooLarge as exc:
+        logger.warning("Annotation data upload refused: %s (%s)" % (exc, memory.report()))
+        return Response({'detail': str(exc), 'memory': memory.report()}, status=413)
+    except Exception:
+        logger.exception("Annotation data upload error")
+        return Response({'detail': "Annotation data upload error."}, status=500)
+    logger.info("Annotation data imported: %s (%s)" % (changes, memory.report()))
+    return Response({"message": "Successful import!", "feedback": feedback_items, "changes": changes,
+                     "memory": memory.report()})
+
+
+def process_annotation_file(xls, prune=False, memory=None):
+    """Imports the sheets of an annotation workbook. Returns the feedback items and {sheet: summary of the changes}.
+    memory is an api.uploads.MemoryMonitor checked once each sheet is parsed, before it is written."""
+    with stats.deferred():
+        return _process_annotation_sheets(xls, prune, memory)
+
+
+def _read_sheet(xls, sheet_name, memory):
+    df = pd.read_excel(xls, sheet_name=sheet_name)
+    if memory:
+        memory.check(f"reading the {sheet_name} sheet")
+    return df
+
+
+def _process_annotation_sheets(xls, prune=False, memory=None):
     feedback_items = []
+    changes = {}
     sheet_names = {s.lower(): s for s in xls.sheet_names}
     # if "annovar" in sheet_names:
     #     print("Processing Annovar Data")
-    #     feedback_items.extend(process_annovar_data(pd.read_excel(xls, sheet_name=sheet_names["annovar"])))
+    #     items, changes["annovar"] = process_annovar_data(_read_sheet(xls, sheet_names["annovar"], memory), prune)
+    #     feedback_items.extend(items)
     # if "gene_annotations" in sheet_names:
     #     print("Processing Gene Annotation Data")
     #     feedback_items.extend(process_gene_annotation_data(pd.read_excel(xls, sheet_name=sheet_names["gene_annotations"])))
     if "variant_annotations" in sheet_names:
-        print("Processing Variant Annotation Data")
-        feedback_items.extend(process_variant_annotation_data(pd.read_excel(xls, sheet_name=sheet_names["variant_annotations"])))
-    return feedback_items
+        logger.info("Processing Variant Annotation Data")
+        items, changes["variant_annotations"] = process_variant_annotation_data(
+            _read_sheet(xls, sheet_names["variant_annotations"], memory), prune
+        )
+        feedback_items.extend(items)
+    return feedback_items, changes
 
 
 def process_gene_annotation_data(df):
@@ -277,147 +630,214 @@ def process_gene_annotation_data(df):
     return feedback_items
 
 
-def process_variant_annotation_data(df):
+def _sheet_priority(value, default):
+    # Integer priorities are floats in pandas, because of the empty cells of the column.
+    if value is None:
+        return default
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def process_variant_annotation_data(df, prune=False):
+    """Imports the amino acid change annotations of the variant_annotations sheet (Gene.refGene, AA_change,
+    annotation, priority and diagnosis columns). Only the rows which are new or changed since the previous
+    import are written (see api.imports). Returns the feedback items and the summary of the changes."""
     feedback_items = []
-    # iterate over records in upload and build json data
-    data = df.to_dict('records')
-    annotation_list = models.AAAnnotation.objects.all()
-    annotation_dict = {x.annotation: x for x in annotation_list}
-    aa_list = models.AminoAcidChange.objects.all()
-    aa_dict = {str(x.gene+"_"+x.aa_change): x for x in aa_list}
-    for row in data:
-        annotation = None
-        if row['annotation'] and isinstance(row['annotation'], str):
-            annotation = annotation_dict[row['annotation']] if row['annotation'] in annotation_dict else None
+    rows = {}
+    for row in df.to_dict('records'):
+        row = imports.clean_values(row)
+        if not row.get('annotation') or not isinstance(row['annotation'], str):
+            continue
+        item = {
+            'type': 'aa_change',
+            'gene': row.get('Gene.refGene'),
+            'aa_change': row.get('AA_change'),
+            'annotation': row['annotation'],
+            'priority': _sheet_priority(row.get('priority'), 1),
+            'diagnosis': row.get('diagnosis'),
+        }
+        # A new priority or diagnosis changes the annotation, a new text is another annotation.
+        rows[f"{item['gene']} : {item['aa_change']} : {item['annotation']}"] = item
+
+    import_diff = imports.diff('variant_annotations', rows, models.AminoAcidAnnotations)
+    keys = import_diff.new + list(import_diff.changed)
+    checked, item_errors = annotations.check_items([rows[key] for key in keys])
+    built = dict(annotations.build_annotations(checked, item_errors))
+    current = models.AminoAcidAnnotations.objects.in_bulk(list(import_diff.changed.values()))
+    # Annotations created through /api/annotations/bulk/ or the admin are taken over by their first import.
+    existing = annotations._existing_keys(
+        models.AminoAcidAnnotations,
+        [annotation for index, annotation in built.items() if keys[index] not in import_diff.changed],
+        annotations.AA_ANNOTATION_KEY,
+    )
+    current.update(models.AminoAcidAnnotations.objects.in_bulk(list(existing.values())))
+    written = {}
+    new = {}
+    with transaction.atomic():
+        for index, key in enumerate(keys):
+            if item_errors[index]:
+                feedback_items.append({'sheet': 'variant_annotations', 'row_value': key, 'issue': " ".join(item_errors[index])})
+                continue
+            annotation_key = tuple(getattr(built[index], field) for field in annotations.AA_ANNOTATION_KEY)
+            annotation = current.get(import_diff.changed.get(key, existing.get(annotation_key)))
             if not annotation:
-                annotation = models.AAAnnotation()
-                annotation.annotation = row['annotation']
-                annotation.priority = 0
+                new[key] = built[index]
+                continue
+            if (annotation.priority, annotation.diagnosis_id) != (built[index].priority, built[index].diagnosis_id):
+                annotation.priority = built[index].priority
+                annotation.diagnosis_id = built[index].diagnosis_id
                 annotation.save()
-                annotation_dict[row['annotation']] = annotation
-        gene = row["Gene.refGene"]
-        change = row["AA_change"]
-        priority = row["priority"] if 'priority' in row and not math.isnan(row['priority']) else 1
-        aa_change = aa_dict[str(gene+"_"+change)] if str(gene+"_"+change) in aa_dict else None
-        if not aa_change:
-            aa_change = models.AminoAcidChange()
-            aa_change.gene = gene
-            aa_change.aa_change = change
-            aa_change.priority = priority
-            aa_change.save()
-            aa_dict[str(gene+"_"+change)] = aa_change
-        if annotation:
-            annotation.aa_change.add(aa_change)
-
-
-def process_annovar_data(df):
+            written[key] = annotation.pk
+        if new:
+            models.AminoAcidAnnotations.objects.bulk_create(new.values(), batch_size=imports.DEFAULT_BATCH_SIZE)
+            # bulk_create does not send the signals updating the stats and cached payloads.
+            response_cache.bump_data_version()
+            stats.mark_genes({annotation.gene_id for annotation in new.values()})
+            stats.mark_aa_changes({annotation.amino_acid_id for annotation in new.values()})
+            written.update({key: annotation.pk for key, annotation in new.items()})
+        imports.record(import_diff, written)
+        summary = import_diff.summary()
+        summary['invalid'] = len(keys) - len(written)
+        if prune:
+            summary['deleted'] = imports.prune(import_diff, models.AminoAcidAnnotations)
+    return feedback_items, summary
+
+
+# AnnovarData fields and their column in the Annovar sheets, which can also use the field names as columns.
+ANNOVAR_COLUMNS = {
+    'func_ref_gene': 'Func.refGene',
+    'gene_ref_gene': 'Gene.refGene',
+    'gene_detail_ref_gene': 'GeneDetail.refGene',
+    'exonic_func_ref_gene': 'ExonicFunc.refGene',
+    'aa_change_ref_gene': 'AAChange.refGene',
+    'genomic_super_dups': 'genomicSuperDups',
+    'ex_ac_all': 'ExAC_ALL',
+    'gnomad_exome_af_popmax': 'gnomad_exome_AF_popmax',
+    'gnomad_genome_af': 'gnomad_genome_AF',
+    'avsnp_150': 'avsnp150',
+    'cosmic_91_coding': 'cosmic91_coding',
+    'cosmic_91_noncoding': 'cosmic91_noncoding',
+    'sift_score': 'SIFT_score',
+    'sift_converted_rankscore': 'SIFT_converted_rankscore',
+    'sift_pred': 'SIFT_pred',
+    'polyphen_2_hdiv_score': 'Polyphen2_HDIV_score',
+    'polyphen_2_hdiv_rankscore': 'Polyphen2_HDIV_rankscore',
+    'polyphen_2_hdiv_pred': 'Polyphen2_HDIV_pred',
+    'polyphen_2_hvar_score': 'Polyphen2_HVAR_score',
+    'polyphen_2_hvar_rankscore': 'Polyphen2_HVAR_rankscore',
+    'polyphen_2_hvar_pred': 'Polyphen2_HVAR_pred',
+    'lrt_score': 'LRT_score',
+    'lrt_converted_rankscore': 'LRT_converted_rankscore',
+    'lrt_pred': 'LRT_pred',
+    'mutation_taster_score': 'MutationTaster_score',
+    'mutation_taster_converted_rankscore': 'MutationTaster_converted_rankscore',
+    'mutation_taster_pred': 'MutationTaster_pred',
+    'mutation_assessor_score': 'MutationAssessor_score',
+    'mutation_assessor_score_rankscore': 'MutationAssessor_score_rankscore',
+    'mutation_assessor_pred': 'MutationAssessor_pred',
+    'fathmm_score': 'FATHMM_score',
+    'fathmm_converted_rankscore': 'FATHMM_converted_rankscore',
+    'fathmm_pred': 'FATHMM_pred',
+    'provean_score': 'PROVEAN_score',
+    'provean_converted_rankscore': 'PROVEAN_converted_rankscore',
+    'provean_pred': 'PROVEAN_pred',
+    'vest_3_score': 'VEST3_score',
+    'vest_3_rankscore': 'VEST3_rankscore',
+    'meta_svm_score': 'MetaSVM_score',
+    'meta_svm_rankscore': 'MetaSVM_rankscore',
+    'meta_svm_pred': 'MetaSVM_pred',
+    'meta_lr_score': 'MetaLR_score',
+    'meta_lr_rankscore': 'MetaLR_rankscore',
+    'meta_lr_pred': 'MetaLR_pred',
+    'm_cap_score': 'M.CAP_score',
+    'm_cap_rankscore': 'M.CAP_rankscore',
+    'm_cap_pred': 'M.CAP_pred',
+    'revel_score': 'REVEL_score',
+    'revel_rankscore': 'REVEL_rankscore',
+    'mut_pred_score': 'MutPred_score',
+    'mut_pred_rankscore': 'MutPred_rankscore',
+    'cadd_raw': 'CADD_raw',
+    'cadd_raw_rankscore': 'CADD_raw_rankscore',
+    'cadd_phred': 'CADD_phred',
+    'dann_score': 'DANN_score',
+    'dann_rankscore': 'DANN_rankscore',
+    'fathmm_mkl_coding_score': 'fathmm.MKL_coding_score',
+    'fathmm_mkl_coding_rankscore': 'fathmm.MKL_coding_rankscore',
+    'fathmm_mkl_coding_pred': 'fathmm.MKL_coding_pred',
+    'eigen_coding_or_noncoding': 'Eigen_coding_or_noncoding',
+    'eigen_raw': 'Eigen.raw',
+    'eigen_pc_raw': 'Eigen.PC.raw',
+    'geno_canyon_score': 'GenoCanyon_score',
+    'geno_canyon_score_rankscore': 'GenoCanyon_score_rankscore',
+    'integrated_fit_cons_score': 'integrated_fitCons_score',
+    'integrated_fit_cons_score_rankscore': 'integrated_fitCons_score_rankscore',
+    'integrated_confidence_value': 'integrated_confidence_value',
+    'gerp_rs': 'GERP.._RS',
+    'gerp_rs_rankscore': 'GERP.._RS_rankscore',
+    'phylo_p_100_way_vertebrate': 'phyloP100way_vertebrate',
+    'phylo_p_100_way_vertebrate_rankscore': 'phyloP100way_vertebrate_rankscore',
+    'phylo_p_20_way_mammalian': 'phyloP20way_mammalian',
+    'phylo_p_20_way_mammalian_rankscore': 'phyloP20way_mammalian_rankscore',
+    'phast_cons_100_way_vertebrate': 'phastCons100way_vertebrate',
+    'phast_cons_100_way_vertebrate_rankscore': 'phastCons100way_vertebrate_rankscore',
+    'phast_cons_20_way_mammalian': 'phastCons20way_mammalian',
+    'phast_cons_20_way_mammalian_rankscore': 'phastCons20way_mammalian_rankscore',
+    'si_phy_29_way_log_odds': 'SiPhy_29way_logOdds',
+    'si_phy_29_way_log_odds_rankscore': 'SiPhy_29way_logOdds_rankscore',
+    'interpro_domain': 'Interpro_domain',
+    'gt_ex_v_6_p_gene': 'GTEx_V6p_gene',
+    'gt_ex_v_6_p_tissue': 'GTEx_V6p_tissue',
+    'cadd_16_gt_10': 'cadd16gt10',
+    'nci_60': 'nci60',
+    'clnalleleid': 'CLNALLELEID',
+    'clndn': 'CLNDN',
+    'clndisdb': 'CLNDISDB',
+    'clnrevstat': 'CLNREVSTAT',
+    'clnsig': 'CLNSIG',
+}
+
+
+def process_annovar_data(df, prune=False):
+    """Imports the Annovar sheet, one AnnovarData row per variant. Only the rows which are new or changed since
+    the previous import are written (see api.imports). Returns the feedback items and the summary of the changes."""
     feedback_items = []
-    # iterate over records in upload and build json data
-    data = df.to_dict('records')
-    # all_chrom_pos = [x['CHROM_POS_REF_ALT'].replace("chr", "").replace("CHR", "") if 'CHROM_POS_REF_ALT' in x else x['chrom_pos_ref_alt'].replace("chr", "").replace("CHR", "") for x in data]
-    # variants = models.Variants.objects.filter(chrom_pos_ref_alt__in=all_chrom_pos)
-    # print(models.Variants.objects.filter(chrom_pos_ref_alt__in=all_chrom_pos).count())
-    # variant_dict = {x.chrom_pos_ref_alt: x for x in variants}
-    for row in data:
+    rows = {}
+    for row in df.to_dict('records'):
         chrom_pos = row['CHROM_POS_REF_ALT'] if 'CHROM_POS_REF_ALT' in row else row['chrom_pos_ref_alt']
-        chrom_pos = chrom_pos.replace("chr", "").replace("CHR", "")
-        variant = models.Variants.objects.filter(chrom_pos_ref_alt=chrom_pos).first() # variant_dict[chrom_pos]
-        if variant:
-            # add annovar data
-            annovar_record = variant.annovar.first()
+        rows[chrom_pos] = {field: row[column] if column in row else row[field] for field, column in ANNOVAR_COLUMNS.items()}
+
+    import_diff = imports.diff('annovar', rows, models.AnnovarData)
+    keys = import_diff.new + list(import_diff.changed)
+    variant_ids = {cpra: variant_id for cpra, (variant_id, gene_id) in variant_keys.resolve(keys).items()}
+    variant_dict = models.Variants.objects.in_bulk(set(variant_ids.values()))
+    current = models.AnnovarData.objects.in_bulk(list(import_diff.changed.values()))
+    # Rows of the new variants imported before the change detection, or created otherwise, are updated.
+    new_variant_ids = [variant_ids[chrom_pos] for chrom_pos in import_diff.new if chrom_pos in variant_ids]
+    variant_annovar = {}
+    for start in range(0, len(new_variant_ids), imports.DEFAULT_BATCH_SIZE):
+        batch = models.AnnovarData.objects.filter(variant_id__in=new_variant_ids[start:start + imports.DEFAULT_BATCH_SIZE])
+        for annovar_record in batch.order_by('-pk'):
+            variant_annovar[annovar_record.variant_id] = annovar_record
+    written = {}
+    with transaction.atomic():
+        for chrom_pos in keys:
+            variant = variant_dict.get(variant_ids.get(chrom_pos))
+            if not variant:
+                feedback_items.append({'sheet': 'Annovar', 'row_value': chrom_pos, 'issue': "Specified variant does not exist in the system."})
+                continue
+            annovar_record = current.get(import_diff.changed.get(chrom_pos)) or variant_annovar.get(variant.pk)
             if not annovar_record:
                 annovar_record = models.AnnovarData()
-                annovar_record.variant = variant
-            annovar_record.func_ref_gene = row['Func.refGene'] if 'Func.refGene' in row else row['func_ref_gene']
-            annovar_record.gene_ref_gene = row['Gene.refGene'] if 'Gene.refGene' in row else row['gene_ref_gene']
-            annovar_record.gene_detail_ref_gene = row['GeneDetail.refGene'] if 'GeneDetail.refGene' in row else row['gene_detail_ref_gene']
-            annovar_record.exonic_func_ref_gene = row['ExonicFunc.refGene'] if 'ExonicFunc.refGene' in row else row['exonic_func_ref_gene']
-            annovar_record.aa_change_ref_gene = row['AAChange.refGene'] if 'AAChange.refGene' in row else row['aa_change_ref_gene']
-            annovar_record.genomic_super_dups = row['genomicSuperDups'] if 'genomicSuperDups' in row else row['genomic_super_dups']
-            annovar_record.ex_ac_all = row['ExAC_ALL'] if 'ExAC_ALL' in row else row['ex_ac_all']
-            annovar_record.gnomad_exome_af_popmax = row['gnomad_exome_AF_popmax'] if 'gnomad_exome_AF_popmax' in row else row['gnomad_exome_af_popmax']
-            annovar_record.gnomad_genome_af = row['gnomad_genome_AF'] if 'gnomad_genome_AF' in row else row['gnomad_genome_af']
-            annovar_record.avsnp_150 = row['avsnp150'] if 'avsnp150' in row else row['avsnp_150']
-            annovar_record.cosmic_91_coding = row['cosmic91_coding'] if 'cosmic91_coding' in row else row['cosmic_91_coding']
-            annovar_record.cosmic_91_noncoding = row['cosmic91_noncoding'] if 'cosmic91_noncoding' in row else row['cosmic_91_noncoding']
-            annovar_record.sift_score = row['SIFT_score'] if 'SIFT_score' in row else row['sift_score']
-            annovar_record.sift_converted_rankscore = row['SIFT_converted_rankscore'] if 'SIFT_converted_rankscore' in row else row['sift_converted_rankscore']
-            annovar_record.sift_pred = row['SIFT_pred'] if 'SIFT_pred' in row else row['sift_pred']
-            annovar_record.polyphen_2_hdiv_score = row['Polyphen2_HDIV_score'] if 'Polyphen2_HDIV_score' in row else row['polyphen_2_hdiv_score']
-            annovar_record.polyphen_2_hdiv_rankscore = row['Polyphen2_HDIV_rankscore'] if 'Polyphen2_HDIV_rankscore' in row else row['polyphen_2_hdiv_rankscore']
-            annovar_record.polyphen_2_hdiv_pred = row['Polyphen2_HDIV_pred'] if 'Polyphen2_HDIV_pred' in row else row['polyphen_2_hdiv_pred']
-            annovar_record.polyphen_2_hvar_score = row['Polyphen2_HVAR_score'] if 'Polyphen2_HVAR_score' in row else row['polyphen_2_hvar_score']
-            annovar_record.polyphen_2_hvar_rankscore = row['Polyphen2_HVAR_rankscore'] if 'Polyphen2_HVAR_rankscore' in row else row['polyphen_2_hvar_rankscore']
-            annovar_record.polyphen_2_hvar_pred = row['Polyphen2_HVAR_pred'] if 'Polyphen2_HVAR_pred' in row else row['polyphen_2_hvar_pred']
-            annovar_record.lrt_score = row['LRT_score'] if 'LRT_score' in row else row['lrt_score']
-            annovar_record.lrt_converted_rankscore = row['LRT_converted_rankscore'] if 'LRT_converted_rankscore' in row else row['lrt_converted_rankscore']
-            annovar_record.lrt_pred = row['LRT_pred'] if 'LRT_pred' in row else row['lrt_pred']
-            annovar_record.mutation_taster_score = row['MutationTaster_score'] if 'MutationTaster_score' in row else row['mutation_taster_score']
-            annovar_record.mutation_taster_converted_rankscore = row['MutationTaster_converted_rankscore'] if 'MutationTaster_converted_rankscore' in row else row['mutation_taster_converted_rankscore']
-            annovar_record.mutation_taster_pred = row['MutationTaster_pred'] if 'MutationTaster_pred' in row else row['mutation_taster_pred']
-            annovar_record.mutation_assessor_score = row['MutationAssessor_score'] if 'MutationAssessor_score' in row else row['mutation_assessor_score']
-            annovar_record.mutation_assessor_score_rankscore = row['MutationAssessor_score_rankscore'] if 'MutationAssessor_score_rankscore' in row else row['mutation_assessor_score_rankscore']
-            annovar_record.mutation_assessor_pred = row['MutationAssessor_pred'] if 'MutationAssessor_pred' in row else row['mutation_assessor_pred']
-            annovar_record.fathmm_score = row['FATHMM_score'] if 'FATHMM_score' in row else row['fathmm_score']
-            annovar_record.fathmm_converted_rankscore = row['FATHMM_converted_rankscore'] if 'FATHMM_converted_rankscore' in row else row['fathmm_converted_rankscore']
-            annovar_record.fathmm_pred = row['FATHMM_pred'] if 'FATHMM_pred' in row else row['fathmm_pred']
-            annovar_record.provean_score = row['PROVEAN_score'] if 'PROVEAN_score' in row else row['provean_score']
-            annovar_record.provean_converted_rankscore = row['PROVEAN_converted_rankscore'] if 'PROVEAN_converted_rankscore' in row else row['provean_converted_rankscore']
-            annovar_record.provean_pred = row['PROVEAN_pred'] if 'PROVEAN_pred' in row else row['provean_pred']
-            annovar_record.vest_3_score = row['VEST3_score'] if 'VEST3_score' in row else row['vest_3_score']
-            annovar_record.vest_3_rankscore = row['VEST3_rankscore'] if 'VEST3_rankscore' in row else row['vest_3_rankscore']
-            annovar_record.meta_svm_score = row['MetaSVM_score'] if 'MetaSVM_score' in row else row['meta_svm_score']
-            annovar_record.meta_svm_rankscore = row['MetaSVM_rankscore'] if 'MetaSVM_rankscore' in row else row['meta_svm_rankscore']
-            annovar_record.meta_svm_pred = row['MetaSVM_pred'] if 'MetaSVM_pred' in row else row['meta_svm_pred']
-            annovar_record.meta_lr_score = row['MetaLR_score'] if 'MetaLR_score' in row else row['meta_lr_score']
-            annovar_record.meta_lr_rankscore = row['MetaLR_rankscore'] if 'MetaLR_rankscore' in row else row['meta_lr_rankscore']
-            annovar_record.meta_lr_pred = row['MetaLR_pred'] if 'MetaLR_pred' in row else row['meta_lr_pred']
-            annovar_record.m_cap_score = row['M.CAP_score'] if 'M.CAP_score' in row else row['m_cap_score']
-            annovar_record.m_cap_rankscore = row['M.CAP_rankscore'] if 'M.CAP_rankscore' in row else row['m_cap_rankscore']
-            annovar_record.m_cap_pred = row['M.CAP_pred'] if 'M.CAP_pred' in row else row['m_cap_pred']
-            annovar_record.revel_score = row['REVEL_score'] if 'REVEL_score' in row else row['revel_score']
-            annovar_record.revel_rankscore = row['REVEL_rankscore'] if 'REVEL_rankscore' in row else row['revel_rankscore']
-            annovar_record.mut_pred_score = row['MutPred_score'] if 'MutPred_score' in row else row['mut_pred_score']
-            annovar_record.mut_pred_rankscore = row['MutPred_rankscore'] if 'MutPred_rankscore' in row else row['mut_pred_rankscore']
-            annovar_record.cadd_raw = row['CADD_raw'] if 'CADD_raw' in row else row['cadd_raw']
-            annovar_record.cadd_raw_rankscore = row['CADD_raw_rankscore'] if 'CADD_raw_rankscore' in row else row['cadd_raw_rankscore']
-            annovar_record.cadd_phred = row['CADD_phred'] if 'CADD_phred' in row else row['cadd_phred']
-            annovar_record.dann_score = row['DANN_score'] if 'DANN_score' in row else row['dann_score']
-            annovar_record.dann_rankscore = row['DANN_rankscore'] if 'DANN_rankscore' in row else row['dann_rankscore']
-            annovar_record.fathmm_mkl_coding_score = row['fathmm.MKL_coding_score'] if 'fathmm.MKL_coding_score' in row else row['fathmm_mkl_coding_score']
-            annovar_record.fathmm_mkl_coding_rankscore = row['fathmm.MKL_coding_rankscore'] if 'fathmm.MKL_coding_rankscore' in row else row['fathmm_mkl_coding_rankscore']
-            annovar_record.fathmm_mkl_coding_pred = row['fathmm.MKL_coding_pred'] if 'fathmm.MKL_coding_pred' in row else row['fathmm_mkl_coding_pred']
-            annovar_record.eigen_coding_or_noncoding = row['Eigen_coding_or_noncoding'] if 'Eigen_coding_or_noncoding' in row else row['eigen_coding_or_noncoding']
-            annovar_record.eigen_raw = row['Eigen.raw'] if 'Eigen.raw' in row else row['eigen_raw']
-            annovar_record.eigen_pc_raw = row['Eigen.PC.raw'] if 'Eigen.PC.raw' in row else row['eigen_pc_raw']
-            annovar_record.geno_canyon_score = row['GenoCanyon_score'] if 'GenoCanyon_score' in row else row['geno_canyon_score']
-            annovar_record.geno_canyon_score_rankscore = row['GenoCanyon_score_rankscore'] if 'GenoCanyon_score_rankscore' in row else row['geno_canyon_score_rankscore']
-            annovar_record.integrated_fit_cons_score = row['integrated_fitCons_score'] if 'integrated_fitCons_score' in row else row['integrated_fit_cons_score']
-            annovar_record.integrated_fit_cons_score_rankscore = row['integrated_fitCons_score_rankscore'] if 'integrated_fitCons_score_rankscore' in row else row['integrated_fit_cons_score_rankscore']
-            annovar_record.integrated_confidence_value = row['integrated_confidence_value'] if 'integrated_confidence_value' in row else row['integrated_confidence_value']
-            annovar_record.gerp_rs = row['GERP.._RS'] if 'GERP.._RS' in row else row['gerp_rs']
-            annovar_record.gerp_rs_rankscore = row['GERP.._RS_rankscore'] if 'GERP.._RS_rankscore' in row else row['gerp_rs_rankscore']
-            annovar_record.phylo_p_100_way_vertebrate = row['phyloP100way_vertebrate'] if 'phyloP100way_vertebrate' in row else row['phylo_p_100_way_vertebrate']
-            annovar_record.phylo_p_100_way_vertebrate_rankscore = row['phyloP100way_vertebrate_rankscore'] if 'phyloP100way_vertebrate_rankscore' in row else row['phylo_p_100_way_vertebrate_rankscore']
-            annovar_record.phylo_p_20_way_mammalian = row['phyloP20way_mammalian'] if 'phyloP20way_mammalian' in row else row['phylo_p_20_way_mammalian']
-            annovar_record.phylo_p_20_way_mammalian_rankscore = row['phyloP20way_mammalian_rankscore'] if 'phyloP20way_mammalian_rankscore' in row else row['phylo_p_20_way_mammalian_rankscore']
-            annovar_record.phast_cons_100_way_vertebrate = row['phastCons100way_vertebrate'] if 'phastCons100way_vertebrate' in row else row['phast_cons_100_way_vertebrate']
-            annovar_record.phast_cons_100_way_vertebrate_rankscore = row['phastCons100way_vertebrate_rankscore'] if 'phastCons100way_vertebrate_rankscore' in row else row['phast_cons_100_way_vertebrate_rankscore']
-            annovar_record.phast_cons_20_way_mammalian = row['phastCons20way_mammalian'] if 'phastCons20way_mammalian' in row else row['phast_cons_20_way_mammalian']
-            annovar_record.phast_cons_20_way_mammalian_rankscore = row['phastCons20way_mammalian_rankscore'] if 'phastCons20way_mammalian_rankscore' in row else row['phast_cons_20_way_mammalian_rankscore']
-            annovar_record.si_phy_29_way_log_odds = row['SiPhy_29way_logOdds'] if 'SiPhy_29way_logOdds' in row else row['si_phy_29_way_log_odds']
-            annovar_record.si_phy_29_way_log_odds_rankscore = row['SiPhy_29way_logOdds_rankscore'] if 'SiPhy_29way_logOdds_rankscore' in row else row['si_phy_29_way_log_odds_rankscore']
-            annovar_record.interpro_domain = row['Interpro_domain'] if 'Interpro_domain' in row else row['interpro_domain']
-            annovar_record.gt_ex_v_6_p_gene = row['GTEx_V6p_gene'] if 'GTEx_V6p_gene' in row else row['gt_ex_v_6_p_gene']
-            annovar_record.gt_ex_v_6_p_tissue = row['GTEx_V6p_tissue'] if 'GTEx_V6p_tissue' in row else row['gt_ex_v_6_p_tissue']
-            annovar_record.cadd_16_gt_10 = row['cadd16gt10'] if 'cadd16gt10' in row else row['cadd_16_gt_10']
-            annovar_record.nci_60 = row['nci60'] if 'nci60' in row else row['nci_60']
-            annovar_record.clnalleleid = row['CLNALLELEID'] if 'CLNALLELEID' in row else row['clnalleleid']
-            annovar_record.clndn = row['CLNDN'] if 'CLNDN' in row else row['clndn']
-            annovar_record.clndisdb = row['CLNDISDB'] if 'CLNDISDB' in row else row['clndisdb']
-            annovar_record.clnrevstat = row['CLNREVSTAT'] if 'CLNREVSTAT' in row else row['clnrevstat']
-            annovar_record.clnsig = row['CLNSIG'] if 'CLNSIG' in row else row['clnsig']
+            annovar_record.variant = variant
+            annovar_record.chr = variant.chr
+            for field, value in rows[chrom_pos].items():
+                setattr(annovar_record, field, value)
             annovar_record.save()
-        else:
-            feedback_items.append({'sheet': 'Annovar', 'row_value': chrom_pos, 'issue': "Specified variant does not exist in the system."})
-    return feedback_items
+            written[chrom_pos] = annovar_record.pk
+        imports.record(import_diff, written)
+        summary = import_diff.summary()
+        summary['invalid'] = len(keys) - len(written)
+        if prune:
+            summary['deleted'] = imports.prune(import_diff, models.AnnovarData)
+    return feedback_items, summary
@@ -0,0 +1,112 @@
+"""
+Measures the lookup throughput of the Python client (python-client/crowdseq_client) against ad-hoc requests
+loops, on a local test server started with runserver (or on --url).
+
+Modes:
+    naive       requests.get() per lookup, one connection per call
+    pooled      one client, keep-alive connections and concurrent lookups, no cache
+    cold-cache  client with an empty on-disk cache
+    revalidate  client with a stale cache, lookups answered 304 Not Modified
+    warm-cache  client with a fresh cache, no requests
+
+Usage (from the api directory):
+    python benchmarks/client_throughput.py --genes 200 --workers 8
+    python benchmarks/client_throughput.py --url http://localhost:8000 --genes 500 KRAS BRAF
+"""
+import argparse
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(API_DIR), 'python-client'))
+
+from crowdseq_client import CrowdseqClient  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server():
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, 'manage.py', 'runserver', '--noreload', f'127.0.0.1:{port}'],
+        cwd=API_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f'http://localhost:{port}'
+    for attempt in range(100):
+        try:
+            requests.get(f'{url}/liveliness', timeout=1)
+            return server, url
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("The test server did not start")
+
+
+def gene_symbols(url, count):
+    response = requests.get(f'{url}/genes/', params={'page_size': min(count, 1000), 'fields': 'approved_symbol'})
+    response.raise_for_status()
+    return [gene['approved_symbol'] for gene in response.json()['results']]
+
+
+def measure(name, lookup, symbols):
+    start = time.perf_counter()
+    found = lookup(symbols)
+    duration = time.perf_counter() - start
+    print(f"{name:>11}: {len(symbols)} lookups in {duration:.2f}s ({len(symbols) / duration:,.0f}/s), {found} found")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help="API server, a local runserver is started without it")
+    parser.add_argument('--genes', type=int, default=100, help="number of genes looked up, taken from /genes/")
+    parser.add_argument('--workers', type=int, default=8, help="client worker threads")
+    parser.add_argument('symbols', nargs='*', help="gene symbols looked up instead of the listed genes")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if not url:
+        server, url = start_server()
+    cache_dir = tempfile.mkdtemp(prefix='crowdseq-client-')
+    try:
+        symbols = args.symbols or gene_symbols(url, args.genes)
+
+        def naive(symbols):
+            found = 0
+            for symbol in symbols:
+                response = requests.get(f'{url}/genes/symbol/{symbol}/')
+                found += response.status_code == 200
+            return found
+
+        def client_lookup(client):
+            return lambda symbols: sum(gene is not None for gene in client.genes(symbols).values())
+
+        measure('naive', naive, symbols)
+        with CrowdseqClient(url, max_workers=args.workers) as client:
+            measure('pooled', client_lookup(client), symbols)
+        with CrowdseqClient(url, max_workers=args.workers, cache_dir=cache_dir) as client:
+            measure('cold-cache', client_lookup(client), symbols)
+        with CrowdseqClient(url, max_workers=args.workers, cache_dir=cache_dir, cache_ttl=0) as client:
+            measure('revalidate', client_lookup(client), symbols)
+        with CrowdseqClient(url, max_workers=args.workers, cache_dir=cache_dir) as client:
+            measure('warm-cache', client_lookup(client), symbols)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+Measures the cold start time of the Django application, i.e. what a uWSGI worker spawn,
+a py-autoreload restart or a manage.py invocation pays before serving anything.
+
+Each run starts a fresh interpreter, so nothing is shared between runs.
+
+Usage (from the api directory, with the usual DJANGO_APP_* environment variables or .env file):
+    python benchmarks/cold_start.py --runs 10
+    python benchmarks/cold_start.py --runs 10 --backends local stackdriver
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STARTUP_SNIPPET = """
+import time
+start = time.perf_counter()
+from crowdseq.wsgi import application
+import logging
+logging.getLogger('django').info('cold start benchmark')
+print(time.perf_counter() - start)
+"""
+
+
+def run_once(backend):
+    env = dict(os.environ)
+    env['DJANGO_SETTINGS_MODULE'] = 'crowdseq.settings'
+    env['DJANGO_APP_LOG_BACKEND'] = backend
+    output = subprocess.run(
+        [sys.executable, '-c', STARTUP_SNIPPET],
+        cwd=API_DIR, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    # The last line is the timing, anything before it is log output.
+    return float(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help="number of interpreter starts per backend")
+    parser.add_argument('--backends', nargs='+', default=['local', 'stackdriver'], help="values of DJANGO_APP_LOG_BACKEND to compare")
+    args = parser.parse_args()
+
+    print(f"{'backend':<12} {'min (s)':>10} {'median (s)':>12} {'max (s)':>10}")
+    for backend in args.backends:
+        timings = [run_once(backend) for _ in range(args.runs)]
+        print(f"{backend:<12} {min(timings):>10.3f} {statistics.median(timings):>12.3f} {max(timings):>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Measures the bandwidth and CPU savings of the precompressed payloads of api.response_cache on a corpus of gene,
+amino acid change and variant detail payloads: the compressed sizes and the one-off compression time of each
+gzip level and brotli quality, then the CPU time per request of compressing each response (as a gzip middleware
+or proxy would) against sending the stored document.
+
+The corpus is made of the most requested keys (AccessCount), completed with the first rows of each table.
+
+Usage (from the api directory):
+    python benchmarks/compression.py --count 200
+    python benchmarks/compression.py --count 500 --gzip-levels 1,6,9 --brotli-qualities 4,9,11 --requests 2000
+"""
+import argparse
+import gzip
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'crowdseq.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from api import models, response_cache  # noqa: E402
+from api.views import PAYLOAD_BUILDERS  # noqa: E402
+
+KEY_FIELDS = {
+    'gene': (models.Genes, 'approved_symbol'),
+    'aa_change': (models.AminoAcidChange, 'short_name'),
+    'variant': (models.Variants, 'chrom_pos_ref_alt'),
+}
+
+
+def corpus_keys(kind, count):
+    keys = [key for key, _ in response_cache.top_keys(kind, count)]
+    model, field = KEY_FIELDS[kind]
+    for key in model.objects.order_by('id').values_list(field, flat=True)[:count * 2]:
+        if len(keys) >= count:
+            break
+        if key and key not in keys:
+            keys.append(key)
+    return keys
+
+
+def corpus(kind, count):
+    """JSON bodies of the payloads of the corpus, as the API renders them."""
+    bodies = []
+    for key in corpus_keys(kind, count):
+        payload = PAYLOAD_BUILDERS[kind](key)
+        if payload is not None:
+            bodies.append(JSONRenderer().render(payload))
+    return bodies
+
+
+def compressors(gzip_levels, brotli_qualities):
+    found = [(f'gzip-{level}', lambda body, level=level: gzip.compress(body, compresslevel=level, mtime=0))
+             for level in gzip_levels]
+    if response_cache.brotli is not None:
+        brotli = response_cache.brotli
+        found += [(f'br-{quality}', lambda body, quality=quality: brotli.compress(body, mode=brotli.MODE_TEXT, quality=quality))
+                  for quality in brotli_qualities]
+    return found
+
+
+def report_sizes(bodies, gzip_levels, brotli_qualities):
+    total = sum(len(body) for body in bodies)
+    print(f"  {'identity':>9}: {total / 1024:,.0f} KiB")
+    for name, compress in compressors(gzip_levels, brotli_qualities):
+        start = time.process_time()
+        size = sum(len(compress(body)) for body in bodies)
+        duration = time.process_time() - start
+        print(f"  {name:>9}: {size / 1024:,.0f} KiB ({size / total:.1%}), "
+              f"compressed once in {duration * 1000 / len(bodies):.2f}ms CPU per payload")
+
+
+def report_requests(bodies, requests):
+    """CPU per request of compressing each response against sending a stored document."""
+    documents = [response_cache.compress_json(body) for body in bodies]
+    start = time.process_time()
+    for number in range(requests):
+        gzip.compress(bodies[number % len(bodies)], compresslevel=6)
+    per_request = (time.process_time() - start) / requests
+    start = time.process_time()
+    for number in range(requests):
+        document = documents[number % len(documents)]
+        document[response_cache.negotiate_encoding('gzip, deflate, br')]
+    stored = (time.process_time() - start) / requests
+    print(f"  per request: gzip-6 on the fly {per_request * 1e6:,.0f}us CPU, stored document {stored * 1e6:,.1f}us CPU")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=200, help="payloads of each kind in the corpus")
+    parser.add_argument('--gzip-levels', default='6,9', help="comma separated gzip levels")
+    parser.add_argument('--brotli-qualities', default='5,9,11', help="comma separated brotli qualities")
+    parser.add_argument('--requests', type=int, default=1000, help="simulated requests of each kind")
+    args = parser.parse_args()
+    gzip_levels = [int(level) for level in args.gzip_levels.split(',')]
+    brotli_qualities = [int(quality) for quality in args.brotli_qualities.split(',')]
+
+    if response_cache.brotli is None:
+        print("Warning: the brotli package is not installed, only gzip is measured.")
+    for kind in PAYLOAD_BUILDERS:
+        start = time.perf_counter()
+        bodies = corpus(kind, args.count)
+        if not bodies:
+            print(f"{kind}: no payloads")
+            continue
+        print(f"{kind}: {len(bodies)} payloads built in {time.perf_counter() - start:.1f}s, "
+              f"{sum(len(body) for body in bodies) / len(bodies) / 1024:.1f} KiB on average")
+        report_sizes(bodies, gzip_levels, brotli_qualities)
+        report_requests(bodies, args.requests)
+
+
+if __name__ == '__main__':
+    main()
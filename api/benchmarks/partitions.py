@@ -0,0 +1,82 @@
+"""
+Shows the partition pruning of the CPRA and region lookups on the partitioned Variants table
+(see api.partitioning): for each lookup, the partitions read by the plan (EXPLAIN ANALYZE) and the median
+latency, with the chromosome condition added by the routing and without it.
+
+Usage (from the api directory, with the settings of a PostgreSQL database partitioned by partition_tables):
+    python benchmarks/partitions.py --runs 50 --cpra 7-140453136-A-T --region 7:140400000-140500000
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'crowdseq.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+
+from api import models, partitioning  # noqa: E402
+from api.normalize import normalize_cpra  # noqa: E402
+
+
+def relations(plan):
+    """Tables and partitions read by a JSON plan."""
+    found = set()
+    if 'Relation Name' in plan:
+        found.add(plan['Relation Name'])
+    for child in plan.get('Plans', []):
+        found |= relations(child)
+    return found
+
+
+def measure(name, queryset, runs):
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (ANALYZE, FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        read = relations(plan[0]['Plan'])
+        timings = []
+        for run in range(runs):
+            start = time.perf_counter()
+            cursor.execute(sql, params)
+            rows = len(cursor.fetchall())
+            timings.append(time.perf_counter() - start)
+    partitions = sorted(relation for relation in read if relation.startswith(models.Variants._meta.db_table))
+    print(f"{name}: {rows} rows, median {statistics.median(timings) * 1000:.2f}ms, "
+          f"{len(partitions)} variant partitions read ({', '.join(partitions[:5])}{', ...' if len(partitions) > 5 else ''})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=20, help="executions per query")
+    parser.add_argument('--cpra', action='append', default=[], help="CPRA looked up, on VARIANT_ASSEMBLY")
+    parser.add_argument('--region', action='append', default=[], help="region looked up, e.g. 7:140400000-140500000")
+    args = parser.parse_args()
+
+    if not partitioning.is_partitioned(models.Variants):
+        print("Warning: the variants table is not partitioned, see the partition_tables command.")
+    for cpra in args.cpra:
+        key = normalize_cpra(cpra)
+        variant_ids = list(models.VariantKey.objects.filter(key=key).values_list('variant_id', flat=True))
+        routed = models.Variants.objects.filter(id__in=variant_ids, chr__in=partitioning.chromosome_values(key.split('-')[0]))
+        measure(f"cpra {cpra} by id and chr", routed, args.runs)
+        measure(f"cpra {cpra} by id", models.Variants.objects.filter(id__in=variant_ids), args.runs)
+        measure(f"cpra {cpra} by chrom_pos_ref_alt", models.Variants.objects.filter(chrom_pos_ref_alt=key), args.runs)
+    for region in args.region:
+        chrom, start, end = partitioning.parse_region(region)
+        positions = models.Variants.objects.filter(start_pos__gte=start, start_pos__lte=end)
+        measure(f"region {region} by chr and position", positions.filter(chr__in=partitioning.chromosome_values(chrom)), args.runs)
+        measure(f"positions of {region} on every chromosome", positions, args.runs)
+
+
+if __name__ == '__main__':
+    main()
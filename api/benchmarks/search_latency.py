@@ -0,0 +1,48 @@
+"""
+Compares the latency of the synchronous search endpoint (served by uWSGI) with the
+asynchronous one (served by gunicorn/uvicorn, see gunicorn-asgi.conf.py).
+
+Usage:
+    python benchmarks/search_latency.py \\
+        --sync-url http://localhost:8000/api/search/ \\
+        --async-url http://localhost:8001/api/search/async/ \\
+        --runs 20 BRAF "KRAS G12D" TP53 ENST00000288602
+"""
+import argparse
+import statistics
+import time
+
+import requests
+
+
+def measure(session, url, query, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        response = session.get(url, params={'query': query})
+        response.raise_for_status()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sync-url', required=True, help="URL of the synchronous search endpoint")
+    parser.add_argument('--async-url', required=True, help="URL of the asynchronous search endpoint")
+    parser.add_argument('--runs', type=int, default=10, help="requests per query and endpoint")
+    parser.add_argument('queries', nargs='+', help="search queries")
+    args = parser.parse_args()
+
+    session = requests.Session()
+    print(f"{'query':<30} {'sync median (ms)':>18} {'async median (ms)':>18} {'speedup':>8}")
+    for query in args.queries:
+        # Warm up connections and database caches for both endpoints before measuring.
+        measure(session, args.sync_url, query, 1)
+        measure(session, args.async_url, query, 1)
+        sync_median = statistics.median(measure(session, args.sync_url, query, args.runs)) * 1000
+        async_median = statistics.median(measure(session, args.async_url, query, args.runs)) * 1000
+        print(f"{query:<30} {sync_median:>18.1f} {async_median:>18.1f} {sync_median / async_median:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
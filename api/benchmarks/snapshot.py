@@ -0,0 +1,80 @@
+"""
+Measures the startup time and the read endpoint latencies of the API served from a snapshot built by the
+export_snapshot management command (crowdseq.settings_snapshot), optionally against the regular settings.
+
+Each settings module runs in a fresh interpreter: the startup time covers the application import, the first
+connection and the first query. Endpoints are requested in process with the Django test client.
+
+Usage (from the api directory):
+    python manage.py export_snapshot /data/crowdseq.sqlite3
+    python benchmarks/snapshot.py --snapshot /data/crowdseq.sqlite3 --runs 50 --compare \\
+        /genes/symbol/KRAS/ /variants/cpra/7-140453136-A-T/ "/api/search/?query=BRAF V600E"
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SNIPPET = """
+import json, statistics, sys, time
+start = time.perf_counter()
+from crowdseq.wsgi import application
+from django.db import connection
+from api import models
+models.Genes.objects.first()
+startup = time.perf_counter() - start
+from django.core.cache import cache
+from django.test import Client
+client = Client()
+urls, runs = json.loads(sys.argv[1]), int(sys.argv[2])
+latencies = {}
+for url in urls:
+    timings = []
+    for run in range(runs):
+        # Measures the database, not the payload cache.
+        cache.clear()
+        start = time.perf_counter()
+        response = client.get(url)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    latencies[url] = {'status': response.status_code, 'median_ms': statistics.median(timings) * 1000,
+                      'p95_ms': timings[int(len(timings) * 0.95) - 1] * 1000}
+print(json.dumps({'startup_s': startup, 'latencies': latencies}))
+"""
+
+
+def run(settings_module, snapshot, urls, runs):
+    env = dict(os.environ)
+    env['DJANGO_SETTINGS_MODULE'] = settings_module
+    env['DJANGO_APP_SNAPSHOT_PATH'] = snapshot
+    # A private cache, cleared before each request without touching the cache shared by the workers.
+    env['DJANGO_APP_CACHE_BACKEND'] = 'django.core.cache.backends.locmem.LocMemCache'
+    output = subprocess.run(
+        [sys.executable, '-c', SNIPPET, json.dumps(urls), str(runs)],
+        cwd=API_DIR, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    # The last line is the result, anything before it is the output of the views.
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--snapshot', required=True, help="snapshot file")
+    parser.add_argument('--runs', type=int, default=20, help="requests per endpoint")
+    parser.add_argument('--compare', action='store_true', help="also measure the regular settings")
+    parser.add_argument('urls', nargs='+', help="endpoints to request")
+    args = parser.parse_args()
+
+    settings_modules = ['crowdseq.settings_snapshot'] + (['crowdseq.settings'] if args.compare else [])
+    for settings_module in settings_modules:
+        result = run(settings_module, args.snapshot, args.urls, args.runs)
+        print(f"{settings_module}: startup {result['startup_s'] * 1000:.0f}ms")
+        for url, latency in result['latencies'].items():
+            print(f"  {url} [{latency['status']}]: median {latency['median_ms']:.2f}ms, p95 {latency['p95_ms']:.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Measures lookups per second of the memory-mapped variant key index (api.variant_index)
+on a synthetic index, without touching the database.
+
+Usage (from the api directory, with the usual DJANGO_APP_* environment variables or .env file):
+    python benchmarks/variant_index.py --variants 5000000 --batch-sizes 1 100 10000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import django
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'crowdseq.settings')
+django.setup()
+
+from api import variant_index  # noqa: E402
+
+
+def synthetic_rows(count):
+    for variant_id in range(1, count + 1):
+        pos = 1000000 + variant_id
+        yield variant_id, variant_id % 20000 + 1, '%032x' % variant_id, f'7-{pos}-A-T', f'7-{pos + 300000}-A-T'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--variants', type=int, default=1000000, help="number of synthetic variants in the index")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 100, 10000], help="keys per lookup call")
+    parser.add_argument('--lookups', type=int, default=200000, help="keys looked up per batch size")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    table = variant_index.build_index_array(synthetic_rows(args.variants))
+    print(f"Built {table.shape[1]} keys in {time.perf_counter() - start:.1f}s ({table.nbytes / 1e6:.0f} MB)")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'variant_index.npy')
+        np.save(path, table)
+        del table
+        index = variant_index.VariantIndex(path)
+
+        # Half known keys, half unknown ones.
+        keys = [f'chr7-{1000000 + random.randint(1, args.variants * 2)}-A-T' for _ in range(args.lookups)]
+        print(f"{'batch size':>10} {'lookups/s':>12}")
+        for batch_size in args.batch_sizes:
+            start = time.perf_counter()
+            for i in range(0, len(keys), batch_size):
+                index.lookup('cpra', keys[i:i + batch_size])
+            elapsed = time.perf_counter() - start
+            print(f"{batch_size:>10} {len(keys) / elapsed:>12,.0f}")
+
+
+if __name__ == '__main__':
+    main()
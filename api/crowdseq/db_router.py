@@ -0,0 +1,98 @@
+"""
+Read replica routing.
+
+ReplicaRoutingMiddleware picks one healthy replica for each read-only request (GET, HEAD, OPTIONS outside
+of the admin) and the router sends the reads of that request to it. Everything else, i.e. writes, admin
+pages, imports and other management commands, stays on the primary ("default") database, which is also the
+only one migrated.
+"""
+import contextvars
+import logging
+import random
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections, DatabaseError
+
+logger = logging.getLogger(__name__)
+
+READ_ONLY_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Database alias used for reads in the current request, None reads from the primary.
+_read_alias = contextvars.ContextVar('read_alias', default=None)
+
+# Replica alias -> time until which the replica is considered down.
+_down_until = {}
+
+
+def healthy_replicas():
+    now = time.monotonic()
+    return [alias for alias in settings.DATABASE_REPLICAS if _down_until.get(alias, 0) <= now]
+
+
+def mark_replica_down(alias):
+    logger.warning("Database replica %s is unavailable, reading from the other databases for %ss"
+                   % (alias, settings.DATABASE_REPLICA_RETRY_SECONDS))
+    _down_until[alias] = time.monotonic() + settings.DATABASE_REPLICA_RETRY_SECONDS
+
+
+def choose_replica():
+    """Picks a healthy replica, checking that it accepts connections. Returns None if there is none."""
+    replicas = healthy_replicas()
+    random.shuffle(replicas)
+    for alias in replicas:
+        try:
+            connections[alias].ensure_connection()
+            return alias
+        except DatabaseError:
+            mark_replica_down(alias)
+    return None
+
+
+@contextmanager
+def read_from(alias):
+    """Sends the reads in the block to the alias database, None reads from the primary."""
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def _stream_reading_from(alias, streaming_content):
+    # Streaming responses are consumed after the middleware returned.
+    with read_from(alias):
+        yield from streaming_content
+
+
+class ReplicaRoutingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        alias = None
+        read_only = request.method in READ_ONLY_METHODS and not request.path.startswith('/admin/')
+        if settings.DATABASE_REPLICAS and read_only:
+            alias = choose_replica()
+        with read_from(alias):
+            response = self.get_response(request)
+        if alias and response.streaming:
+            response.streaming_content = _stream_reading_from(alias, response.streaming_content)
+        return response
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_alias.get() or 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema changes through replication from the primary.
+        return db == 'default'
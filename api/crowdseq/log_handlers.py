@@ -0,0 +1,78 @@
+import logging
+import sys
+import threading
+
+# Loggers used by the Cloud Logging client itself. Their records must not be shipped back through
+# the handler, otherwise sending a record would produce more records to send.
+EXCLUDED_LOGGERS = ("google.cloud", "google.auth", "google_auth_httplib2", "google.api_core.bidi", "werkzeug")
+
+
+class LazyCloudLoggingHandler(logging.Handler):
+    """Logging handler forwarding records to Google Cloud Logging.
+
+    Importing google.cloud.logging and creating the client (which resolves credentials and may hit
+    the metadata server) is deferred until the first record is emitted. When the client cannot be
+    created, e.g. when running offline, records fall back to stdout.
+    """
+
+    def __init__(self, level=logging.NOTSET, name=None):
+        super(LazyCloudLoggingHandler, self).__init__(level)
+        self.log_name = name
+        self._handler = None
+        self._init_lock = threading.RLock()
+        self._initializing = False
+
+    def _build_handler(self):
+        for logger_name in EXCLUDED_LOGGERS:
+            logging.getLogger(logger_name).propagate = False
+        try:
+            import google.cloud.logging
+            from google.cloud.logging.handlers import CloudLoggingHandler
+            client = google.cloud.logging.Client()
+            if self.log_name:
+                handler = CloudLoggingHandler(client, name=self.log_name)
+            else:
+                handler = CloudLoggingHandler(client)
+        except Exception as ex:
+            sys.stderr.write("Cloud Logging is unavailable, logging to stdout instead: %s\n" % ex)
+            handler = logging.StreamHandler(sys.stdout)
+        handler.setLevel(self.level)
+        if self.formatter:
+            handler.setFormatter(self.formatter)
+        return handler
+
+    def get_handler(self):
+        """Returns the underlying handler, creating it on first use.
+
+        Returns None while the handler is being created, so that records logged by the client
+        libraries during initialization are dropped instead of recursing.
+        """
+        if self._handler is None:
+            with self._init_lock:
+                if self._initializing:
+                    return None
+                if self._handler is None:
+                    self._initializing = True
+                    try:
+                        self._handler = self._build_handler()
+                    finally:
+                        self._initializing = False
+        return self._handler
+
+    def emit(self, record):
+        try:
+            handler = self.get_handler()
+        except Exception:
+            self.handleError(record)
+            return
+        if handler is not None:
+            handler.handle(record)
+
+    def flush(self):
+        if self._handler is not None:
+            self._handler.flush()
+
+    def close(self):
+        if self._handler is not None:
+            self._handler.close()
+        super(LazyCloudLoggingHandler, self).close()
@@ -12,7 +12,7 @@ https://docs.djangoproject.com/en/4.0/ref/settings/
 
 import os
 import sys
-import google.cloud.logging
+import tempfile
 from pathlib import Path
 
 from corsheaders.defaults import default_methods, default_headers
@@ -31,14 +31,18 @@ if "SECRET_KEY" not in os.environ:
     load_dotenv()
 SECRET_KEY = os.environ.get('SECRET_KEY')
 
-log_client = google.cloud.logging.Client()
-log_client.setup_logging()
-
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = os.getenv('DJANGO_APP_DEBUG', False)
 
 ALLOWED_HOSTS = os.getenv('HOSTS').split(',')
 
+# Logging backend: "stackdriver" ships records to Google Cloud Logging, "local" only writes to stdout.
+# The Cloud Logging client is created on the first emitted record (see crowdseq.log_handlers), so
+# importing settings stays fast and works offline.
+LOG_BACKEND = os.getenv('DJANGO_APP_LOG_BACKEND', 'stackdriver')
+if LOG_BACKEND not in ('stackdriver', 'local'):
+    raise ValueError("DJANGO_APP_LOG_BACKEND must be one of 'stackdriver' or 'local', not '%s'" % LOG_BACKEND)
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -52,20 +56,15 @@ LOGGING = {
             'level': 'ERROR',
             'class': 'django.utils.log.AdminEmailHandler'
         },
-        'stackdriver_logging': {
-            'class': 'google.cloud.logging.handlers.CloudLoggingHandler',
-            'client': log_client
-        }
     },
     'loggers': {
         'django': {
-            'handlers': ['console', 'stackdriver_logging'],
+            'handlers': ['console'],
             'level': 'DEBUG',
             'propagate': True,
         },
         'django.request': {
             'handlers': [
-                'stackdriver_logging',
                 'mail_admins'
             ],
             'level': 'ERROR',
@@ -73,6 +72,19 @@ LOGGING = {
     },
 }
 
+if LOG_BACKEND == 'stackdriver':
+    LOGGING['handlers']['stackdriver_logging'] = {
+        'class': 'crowdseq.log_handlers.LazyCloudLoggingHandler',
+    }
+    LOGGING['loggers']['django']['handlers'].append('stackdriver_logging')
+    LOGGING['loggers']['django.request']['handlers'].insert(0, 'stackdriver_logging')
+    # Equivalent of google.cloud.logging.Client().setup_logging(): everything propagating to the root
+    # logger is shipped to Cloud Logging.
+    LOGGING['root'] = {
+        'handlers': ['stackdriver_logging'],
+        'level': 'INFO',
+    }
+
 
 # Application definition
 
@@ -98,6 +110,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'crowdseq.db_router.ReplicaRoutingMiddleware',
 ]
 
 CORS_ORIGIN_WHITELIST = os.getenv('CORS_HOSTS').split(',')
@@ -150,9 +163,63 @@ DATABASES = {
         'HOST': os.environ.get('DJANGO_APP_DB_HOST'),
         'PORT': os.environ.get('DJANGO_APP_DB_PORT'),
         'PASSWORD': os.environ.get('DJANGO_APP_DB_PASSWORD'),
-        'CONN_MAX_AGE': 600,
+        # Persistent connections are kept by each worker thread and checked before being reused by a request.
+        'CONN_MAX_AGE': int(os.environ.get('DJANGO_APP_DB_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        # Server-side cursors do not work through a transaction pooler such as PgBouncer in transaction mode.
+        'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('DJANGO_APP_DB_DISABLE_SERVER_SIDE_CURSORS', '') == 'True',
+    }
+}
+
+# Read replicas, as a comma separated list of host[:port] (or of database files for SQLite).
+# Reads of GET requests are sent to a healthy replica, see crowdseq.db_router.
+DATABASE_REPLICAS = []
+for replica_index, replica_spec in enumerate(x for x in os.environ.get('DJANGO_APP_DB_REPLICAS', '').split(',') if x):
+    replica = dict(DATABASES['default'])
+    if replica['ENGINE'].endswith('sqlite3'):
+        replica['NAME'] = replica_spec
+    else:
+        replica['HOST'], _, replica_port = replica_spec.partition(':')
+        replica['PORT'] = replica_port or replica['PORT']
+    replica['TEST'] = {'MIRROR': 'default'}
+    DATABASES['replica_%s' % replica_index] = replica
+    DATABASE_REPLICAS.append('replica_%s' % replica_index)
+
+DATABASE_ROUTERS = ['crowdseq.db_router.ReadReplicaRouter']
+# Seconds during which a replica that refused a connection is not used.
+DATABASE_REPLICA_RETRY_SECONDS = int(os.environ.get('DJANGO_APP_DB_REPLICA_RETRY_SECONDS', 30))
+
+
+# Cache of the detail payloads (see api.response_cache). The default file based cache is shared by the workers
+# of a host and survives worker recycles, DJANGO_APP_CACHE_BACKEND/LOCATION can point to Redis or Memcached.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('DJANGO_APP_CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.environ.get('DJANGO_APP_CACHE_LOCATION', os.path.join(BASE_DIR, 'cache')),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('DJANGO_APP_CACHE_MAX_ENTRIES', 10000)),
+        },
     }
 }
+RESPONSE_CACHE_TIMEOUT = int(os.environ.get('DJANGO_APP_RESPONSE_CACHE_TIMEOUT', 24 * 3600))
+# Compression levels of the cached payloads, compressed once when cached (see api.response_cache). The first
+# request of a payload after each data change compresses it: brotli qualities above 6 are offline settings,
+# 10 to 50 times slower.
+PAYLOAD_GZIP_LEVEL = int(os.environ.get('DJANGO_APP_PAYLOAD_GZIP_LEVEL', 6))
+PAYLOAD_BROTLI_QUALITY = int(os.environ.get('DJANGO_APP_PAYLOAD_BROTLI_QUALITY', 5))
+# Search result ids are cached per normalized token set (see api.search), searches without results for a shorter time
+SEARCH_CACHE_TIMEOUT = int(os.environ.get('DJANGO_APP_SEARCH_CACHE_TIMEOUT', 3600))
+SEARCH_CACHE_EMPTY_TIMEOUT = int(os.environ.get('DJANGO_APP_SEARCH_CACHE_EMPTY_TIMEOUT', 60))
+# Concurrent requests of the same missing payload or search wait for the one computing it (see api.singleflight),
+# the workers for at most this many seconds. 0 only coalesces the requests within each worker.
+SINGLEFLIGHT_WAIT_SECONDS = int(os.environ.get('DJANGO_APP_SINGLEFLIGHT_WAIT_SECONDS', 10))
+# Directory of the lock files of the computations in flight, local to the host
+SINGLEFLIGHT_LOCK_DIR = os.environ.get('DJANGO_APP_SINGLEFLIGHT_LOCK_DIR',
+                                       os.path.join(tempfile.gettempdir(), 'crowdseq-singleflight'))
+# Number of most requested genes, amino acid changes and variants precomputed by the warm_cache command,
+# and genes always warmed.
+CACHE_WARM_TOP_N = int(os.environ.get('DJANGO_APP_CACHE_WARM_TOP_N', 200))
+CACHE_WARM_GENES = [x for x in os.environ.get('DJANGO_APP_CACHE_WARM_GENES', 'KRAS,EGFR,BRAF').split(',') if x]
 
 
 # Password validation
@@ -202,3 +269,30 @@ STATIC_URL = os.getenv('DJANGO_APP_STATIC_URL', '/static/')
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 WEBSITE_NAME = "Crowdseq"
+
+# Assemblies of Variants.chrom_pos_ref_alt and Variants.alt_chrom_pos_ref_alt (see api.variant_keys)
+VARIANT_ASSEMBLY = os.environ.get('DJANGO_APP_VARIANT_ASSEMBLY', 'hg19')
+VARIANT_ALT_ASSEMBLY = os.environ.get('DJANGO_APP_VARIANT_ALT_ASSEMBLY', 'hg38')
+
+# Memory-mapped variant key index built by the build_variant_index management command (see api.variant_index)
+VARIANT_INDEX_PATH = os.environ.get('DJANGO_APP_VARIANT_INDEX_PATH', os.path.join(BASE_DIR, 'variant_index.npy'))
+
+# Also store the typed Annovar scores as one packed float32 array per row (see api.annovar_scores)
+ANNOVAR_PACKED_SCORES = os.environ.get('DJANGO_APP_ANNOVAR_PACKED_SCORES', 'false').lower() in ('1', 'true', 'yes')
+
+# Annotation workbook uploads (see api.uploads). Uploads above FILE_UPLOAD_MAX_MEMORY_SIZE are spooled to
+# FILE_UPLOAD_TEMP_DIR. The RSS limit stays below the uWSGI limit-as, so that imports fail cleanly.
+FILE_UPLOAD_MAX_MEMORY_SIZE = int(os.environ.get('DJANGO_APP_UPLOAD_SPOOL_BYTES', 2621440))
+FILE_UPLOAD_TEMP_DIR = os.environ.get('DJANGO_APP_UPLOAD_TEMP_DIR') or None
+ANNOTATION_UPLOAD_MAX_BYTES = int(os.environ.get('DJANGO_APP_ANNOTATION_UPLOAD_MAX_BYTES', 100 * 2 ** 20))
+ANNOTATION_UPLOAD_MAX_UNCOMPRESSED_BYTES = int(os.environ.get('DJANGO_APP_ANNOTATION_UPLOAD_MAX_UNCOMPRESSED_BYTES', 256 * 2 ** 20))
+ANNOTATION_IMPORT_MAX_RSS_MB = int(os.environ.get('DJANGO_APP_ANNOTATION_IMPORT_MAX_RSS_MB', 768))
+
+# Admin changelists of unfiltered tables above this many rows show the Postgres row estimate instead of
+# counting, filtered ones give up counting after the timeout (see api.admin.EstimatedCountPaginator)
+ADMIN_ESTIMATED_COUNT_MIN_ROWS = int(os.environ.get('DJANGO_APP_ADMIN_ESTIMATED_COUNT_MIN_ROWS', 100000))
+ADMIN_COUNT_TIMEOUT_MS = int(os.environ.get('DJANGO_APP_ADMIN_COUNT_TIMEOUT_MS', 200))
+
+# Partition the Variants and AnnovarData tables by chromosome on PostgreSQL (see api.partitioning). Applied by
+# the 0030 migration or the partition_tables management command, and routes the CPRA and region lookups.
+VARIANT_PARTITIONING = os.environ.get('DJANGO_APP_VARIANT_PARTITIONING', 'false').lower() in ('1', 'true', 'yes')
@@ -0,0 +1,39 @@
+"""
+Read-only settings serving the API from a SQLite snapshot built by the export_snapshot management command
+(see api.snapshot), without a database server:
+
+    DJANGO_SETTINGS_MODULE=crowdseq.settings_snapshot DJANGO_APP_SNAPSHOT_PATH=/data/crowdseq.sqlite3 \
+        uwsgi --ini uwsgi-prod.ini
+
+Only the read endpoints work, writes fail with "attempt to write a readonly database".
+"""
+from crowdseq.settings import *  # noqa: F401,F403
+from crowdseq.settings import BASE_DIR, os
+
+SNAPSHOT_MODE = True
+SNAPSHOT_PATH = os.environ.get('DJANGO_APP_SNAPSHOT_PATH', os.path.join(BASE_DIR, 'crowdseq-snapshot.sqlite3'))
+# Bytes of the snapshot read through mmap rather than read() calls.
+SNAPSHOT_MMAP_BYTES = int(os.environ.get('DJANGO_APP_SNAPSHOT_MMAP_BYTES', 2 ** 30))
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        # immutable: the file never changes while it is served, SQLite takes no locks and skips change detection.
+        'NAME': f'file:{SNAPSHOT_PATH}?mode=ro&immutable=1',
+        'OPTIONS': {'uri': True},
+        'CONN_MAX_AGE': None,
+    }
+}
+DATABASE_REPLICAS = []
+
+# The data never changes, each worker keeps its payloads in memory.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('DJANGO_APP_CACHE_MAX_ENTRIES', 10000)),
+        },
+    }
+}
+# No session table writes.
+SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
@@ -32,6 +32,11 @@ urlpatterns = [
     url(r'^', include(router.urls)),
     # url('', include('django_prometheus.urls')),
     url(r'^api/search/$', api_views.search, name='api_search'),
+    url(r'^api/search/async/$', api_views.async_search, name='api_search_async'),
+    url(r'^api/annotations/bulk/$', api_views.bulk_annotations, name='api_bulk_annotations'),
+    url(r'^annotation-data-upload/$', api_views.annotation_data_upload, name='annotation_data_upload'),
+    url(r'^api/export/variants/$', api_views.variant_export, name='api_variant_export'),
+    url(r'^api/resolve/(?P<identifier>.+)/$', api_views.resolve_identifier, name='api_resolve_identifier'),
     url(r'^readiness', views.readiness, name='readiness'),
     url(r'^liveliness', views.liveliness, name='liveliness'),
     url(r'^admin/', admin.site.urls),
@@ -0,0 +1,22 @@
+# Gunicorn configuration serving the ASGI application (crowdseq.asgi) with uvicorn workers.
+# Async views, such as the concurrent search, only run concurrently under this server;
+# uWSGI (uwsgi-prod.ini) runs them synchronously.
+#
+# Usage, from the api directory:
+#     gunicorn -c gunicorn-asgi.conf.py crowdseq.asgi:application
+
+import os
+
+bind = os.getenv('ASGI_BIND', 'unix:/opt/crowdseq/asgi.sock')
+worker_class = 'uvicorn.workers.UvicornWorker'
+workers = int(os.getenv('ASGI_WORKERS', '5'))
+
+# Same limits as uwsgi-prod.ini
+timeout = 120
+max_requests = 5000
+max_requests_jitter = 250
+keepalive = 5
+
+raw_env = ['DJANGO_SETTINGS_MODULE=crowdseq.settings']
+accesslog = os.getenv('ASGI_ACCESS_LOG', '/opt/crowdseq/logs/gunicorn/crowdseq_asgi_access.log')
+errorlog = os.getenv('ASGI_ERROR_LOG', '/opt/crowdseq/logs/gunicorn/crowdseq_asgi.log')
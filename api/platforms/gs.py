@@ -1,28 +1,51 @@
 import os
 import base64
 import logging
+import threading
 from urllib.parse import quote_plus
-from oauth2client.service_account import ServiceAccountCredentials
 from django.conf import settings
 from django.utils import timezone
 from Aries.storage import StorageObject, StorageFolder
 
 
 logger = logging.getLogger(__name__)
-key_file = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS")
-if not key_file and hasattr(settings, "GOOGLE_APPLICATION_CREDENTIALS"):
-    key_file = getattr(settings, "GOOGLE_APPLICATION_CREDENTIALS")
 
-if key_file:
-    GOOGLE_APPLICATION_CREDENTIALS = ServiceAccountCredentials.from_json_keyfile_name(
-        key_file
-    )
-else:
-    GOOGLE_APPLICATION_CREDENTIALS = None
+_credentials = None
+_credentials_loaded = False
+_credentials_lock = threading.Lock()
+
+
+def load_credentials():
+    """Loads the service account credentials from the key file configured by the
+    GOOGLE_APPLICATION_CREDENTIALS environment variable or Django setting.
+    Returns None if no key file is configured.
+    """
+    key_file = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS")
+    if not key_file and hasattr(settings, "GOOGLE_APPLICATION_CREDENTIALS"):
+        key_file = getattr(settings, "GOOGLE_APPLICATION_CREDENTIALS")
+    if not key_file:
+        return None
+    from oauth2client.service_account import ServiceAccountCredentials
+    return ServiceAccountCredentials.from_json_keyfile_name(key_file)
+
+
+def get_credentials():
+    """Gets the service account credentials, loading them on first use.
+    """
+    global _credentials, _credentials_loaded
+    if not _credentials_loaded:
+        with _credentials_lock:
+            if not _credentials_loaded:
+                _credentials = load_credentials()
+                _credentials_loaded = True
+    return _credentials
 
 
 def sign_url(uri, seconds=3600):
-    credentials = GOOGLE_APPLICATION_CREDENTIALS
+    credentials = get_credentials()
+    if credentials is None:
+        logger.error("Cannot sign %s: GOOGLE_APPLICATION_CREDENTIALS is not configured." % uri)
+        return None
     client_id = credentials.service_account_email
     epoch = "%d" % timezone.make_naive(timezone.now() + timezone.timedelta(seconds=seconds)).timestamp()
     uri = uri.replace("gs://", "/", 1)
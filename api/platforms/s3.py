@@ -1,10 +1,10 @@
 import logging
-import boto3
 from Aries.storage import StorageObject, StorageFolder
 logger = logging.getLogger(__name__)
 
 
 def sign_url(uri, seconds=3600):
+    import boto3
     client = boto3.client("s3")
     file_obj = StorageObject(uri)
     # The AWS object key does not include the beginning slash of the object path.
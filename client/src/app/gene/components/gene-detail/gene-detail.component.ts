@@ -17,6 +17,8 @@ export class GeneDetailComponent implements OnInit {
   
   geneData: any;
   variantData: Variant[];
+  variantCount: number;
+  variantPageSize = 100;
 
 
   constructor(private activatedRoute: ActivatedRoute,
@@ -38,12 +40,7 @@ export class GeneDetailComponent implements OnInit {
       data => {
         this.isLoading = false;
         this.geneData = data;
-        if ( data && data.variants ) {
-          this.variantData = data.variants;
-        } else {
-          this.variantData = [];
-        }
-        
+        this.loadVariants(1, this.variantPageSize);
       }, error => {
         this.isLoading = false;
         this.dialogService.alert('Error', 'There was an issue with retrieving the gene.', null, DialogService.error);
@@ -51,4 +48,16 @@ export class GeneDetailComponent implements OnInit {
     );
   }
 
+  loadVariants(page: number, pageSize: number, search?: string) {
+    this.variantPageSize = pageSize;
+    this.service.getGeneVariants(this.geneSymbol, page, pageSize, search).subscribe(
+      data => {
+        this.variantCount = data.count;
+        this.variantData = data.results;
+      }, error => {
+        this.dialogService.alert('Error', 'There was an issue with retrieving the variants of the gene.', null, DialogService.error);
+      }
+    );
+  }
+
 }
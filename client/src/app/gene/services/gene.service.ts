@@ -1,4 +1,4 @@
-import { HttpClient } from '@angular/common/http';
+import { HttpClient, HttpParams } from '@angular/common/http';
 import { Injectable } from '@angular/core';
 import { DialogService } from 'src/app/shared/components/dialog/dialog.service';
 import { environment } from 'src/environments/environment';
@@ -11,4 +11,12 @@ export class GeneService {
   public getGeneBySymbol(symbol: string) {
     return this._http.get<any>(environment.apiBase + '/genes/symbol/' + symbol + '/');
   }
+
+  public getGeneVariants(symbol: string, page: number, pageSize: number, search?: string) {
+    let params = new HttpParams().set('page', String(page)).set('page_size', String(pageSize));
+    if ( search ) {
+      params = params.set('search', search);
+    }
+    return this._http.get<any>(environment.apiBase + '/genes/symbol/' + symbol + '/variants/', { params: params });
+  }
 }
@@ -1,4 +1,4 @@
-import { AfterViewInit, Component, EventEmitter, Input, OnInit, ViewChild } from '@angular/core';
+import { AfterViewInit, Component, EventEmitter, Input, OnChanges, OnInit, Output, SimpleChanges, ViewChild } from '@angular/core';
 import { FormGroup } from '@angular/forms';
 import { MatPaginator } from '@angular/material/paginator';
 import { MatSort } from '@angular/material/sort';
@@ -9,33 +9,66 @@ import { MatTableDataSource } from '@angular/material/table';
   templateUrl: './variant-list.component.html',
   styleUrls: ['./variant-list.component.scss']
 })
-export class VariantListComponent implements AfterViewInit {
+export class VariantListComponent implements AfterViewInit, OnChanges {
   @ViewChild(MatSort) sort: MatSort;
   @ViewChild(MatPaginator) paginator: MatPaginator;
   @Input() data: any;
   @Input() showTitle: boolean;
+  // Set when the data is one page of the variants, the pages and the filter are then requested from the API.
+  @Input() totalCount: number;
+  @Output() pageRequest = new EventEmitter<{page: number, pageSize: number, search: string}>();
 
   resultsLength = 0;
+  pageSize = 100;
+  search = '';
 
   displayedColumns: string[] = ['chrom_pos_ref_alt', 'link'];
   dataSource: MatTableDataSource<any>;
 
   constructor() { }
 
+  get serverSide(): boolean {
+    return this.totalCount !== undefined && this.totalCount !== null;
+  }
+
   ngAfterViewInit(): void {
     if ( this.data ) {
         this.dataSource = new MatTableDataSource(this.data);
-        this.resultsLength = this.data.length;
+        this.resultsLength = this.serverSide ? this.totalCount : this.data.length;
         this.dataSource.sort = this.sort;
-        this.dataSource.paginator = this.paginator;
+        if ( this.serverSide ) {
+          this.paginator.page.subscribe(page => this.requestPage(page.pageIndex, page.pageSize));
+        } else {
+          this.dataSource.paginator = this.paginator;
+        }
     } else {
       this.resultsLength = 0;
       this.dataSource = new MatTableDataSource();
     }
   }
 
+  ngOnChanges(changes: SimpleChanges): void {
+    if ( this.dataSource && changes.data ) {
+      this.dataSource.data = this.data || [];
+    }
+    if ( this.serverSide ) {
+      this.resultsLength = this.totalCount;
+    }
+  }
+
+  requestPage(pageIndex: number, pageSize: number) {
+    this.pageSize = pageSize;
+    this.pageRequest.emit({page: pageIndex + 1, pageSize: pageSize, search: this.search});
+  }
+
   applyFilter(event: Event) {
     const filterValue = (event.target as HTMLInputElement).value;
+    if ( this.serverSide ) {
+      this.search = filterValue.trim();
+      this.paginator.pageIndex = 0;
+      this.requestPage(0, this.paginator.pageSize);
+      return;
+    }
     this.dataSource.filter = filterValue.trim().toLowerCase();
 
     if (this.dataSource.paginator) {
@@ -0,0 +1,4 @@
+from crowdseq_client.cache import DiskCache
+from crowdseq_client.client import CrowdseqClient, CrowdseqError
+
+__all__ = ['CrowdseqClient', 'CrowdseqError', 'DiskCache']
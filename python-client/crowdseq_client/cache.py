@@ -0,0 +1,66 @@
+"""
+On-disk cache of the API responses, one JSON file per resource.
+
+Entries hold the payload, its ETag and the time it was fetched. Fresh entries (younger than the TTL) are served
+without a request. Stale entries are revalidated with If-None-Match: the API answers 304 without a body while
+its data has not changed, and the entry is fresh again.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+
+class DiskCache:
+
+    def __init__(self, directory, ttl=3600):
+        self.directory = directory
+        # seconds
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest + '.json')
+
+    def get(self, key):
+        """The entry of a key, {'etag', 'fetched', 'data'}, or None."""
+        try:
+            with open(self._path(key)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Guards against sha256 collisions and files of other versions.
+        if entry.get('key') != key:
+            return None
+        return entry
+
+    def is_fresh(self, entry):
+        return time.time() - entry['fetched'] < self.ttl
+
+    def set(self, key, data, etag):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {'key': key, 'etag': etag, 'fetched': time.time(), 'data': data}
+        # Written to a temporary file and renamed, so that concurrent readers never see a partial entry.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entry, f, separators=(',', ':'))
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return entry
+
+    def touch(self, key, entry):
+        """Marks a revalidated entry as fresh."""
+        return self.set(key, entry['data'], entry['etag'])
+
+    def clear(self):
+        for root, dirs, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.json'):
+                    os.remove(os.path.join(root, name))
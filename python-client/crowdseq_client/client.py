@@ -0,0 +1,164 @@
+"""
+Client of the Crowdseq read API.
+
+A client keeps one requests session whose connection pool is sized for its worker threads, so that lookups
+reuse keep-alive connections instead of opening one connection per call. Bulk lookups (genes, variants,
+aa_changes) run concurrently on a thread pool sharing the pool, and existence checks are batched into POST
+requests to /variants/exists/.
+
+With a cache directory, detail payloads are kept on disk (see crowdseq_client.cache) and revalidated with their
+ETag once older than the TTL.
+
+Usage:
+    from crowdseq_client import CrowdseqClient
+
+    with CrowdseqClient('https://crowdseq.example.org', cache_dir='~/.cache/crowdseq') as client:
+        kras = client.gene('KRAS')
+        variants = client.variants(['7-140453136-A-T', '12-25398284-C-T'])
+        exists = client.variants_exist(cpras=['7-140453136-A-T'])
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from crowdseq_client.cache import DiskCache
+
+DEFAULT_WORKERS = 8
+
+DEFAULT_TIMEOUT = 30
+
+# Keys per /variants/exists/ request, the API accepts up to 100000.
+DEFAULT_EXISTS_BATCH_SIZE = 10000
+
+
+class CrowdseqError(Exception):
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class CrowdseqClient:
+
+    def __init__(self, base_url, auth=None, cache_dir=None, cache_ttl=3600, max_workers=DEFAULT_WORKERS,
+                 timeout=DEFAULT_TIMEOUT, retries=3):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.cache = DiskCache(os.path.expanduser(cache_dir), ttl=cache_ttl) if cache_dir else None
+        self.session = requests.Session()
+        self.session.auth = auth
+        self.session.headers['Accept'] = 'application/json'
+        retry = Retry(total=retries, backoff_factor=0.2, status_forcelist=(502, 503, 504),
+                      allowed_methods=('GET', 'HEAD', 'POST'))
+        # One connection per worker thread, kept alive between requests.
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self.session.close()
+
+    def _url(self, path):
+        return f'{self.base_url}/{path.lstrip("/")}'
+
+    def _raise_for_status(self, response):
+        if response.status_code >= 400:
+            raise CrowdseqError(f'{response.request.method} {response.url}: {response.status_code} {response.text[:200]}',
+                                status_code=response.status_code)
+
+    def get(self, path, params=None):
+        """JSON of a GET request, None when the resource does not exist (404). Cached when the client has a
+        cache directory and the response has an ETag."""
+        url = self._url(path)
+        if params:
+            url = requests.Request('GET', url, params=params).prepare().url
+        entry = self.cache.get(url) if self.cache else None
+        if entry is not None and self.cache.is_fresh(entry):
+            return entry['data']
+        headers = {'If-None-Match': entry['etag']} if entry is not None else {}
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and entry is not None:
+            self.cache.touch(url, entry)
+            return entry['data']
+        if response.status_code == 404:
+            return None
+        self._raise_for_status(response)
+        data = response.json()
+        etag = response.headers.get('ETag')
+        if self.cache and etag:
+            self.cache.set(url, data, etag)
+        return data
+
+    def post(self, path, data):
+        response = self.session.post(self._url(path), json=data, timeout=self.timeout)
+        self._raise_for_status(response)
+        return response.json()
+
+    def gene(self, symbol):
+        return self.get(f'/genes/symbol/{quote(symbol, safe="")}/')
+
+    def variant(self, cpra):
+        """Variant by Chrom-Pos-Ref-Alt, e.g. 7-140453136-A-T."""
+        return self.get(f'/variants/cpra/{quote(cpra, safe="")}/')
+
+    def aa_change(self, short_name):
+        return self.get(f'/aa-changes/short_name/{quote(short_name, safe="")}/')
+
+    def search(self, query):
+        return self.get('/api/search/', params={'query': query})
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='crowdseq')
+        return self._executor
+
+    def _map(self, lookup, keys):
+        keys = list(dict.fromkeys(keys))
+        return dict(zip(keys, self._get_executor().map(lookup, keys)))
+
+    def genes(self, symbols):
+        """{symbol: gene payload or None}, fetched concurrently."""
+        return self._map(self.gene, symbols)
+
+    def variants(self, cpras):
+        """{cpra: variant payload or None}, fetched concurrently."""
+        return self._map(self.variant, cpras)
+
+    def aa_changes(self, short_names):
+        """{short name: amino acid change payload or None}, fetched concurrently."""
+        return self._map(self.aa_change, short_names)
+
+    def variants_exist(self, cpras=(), md5sums=(), batch_size=DEFAULT_EXISTS_BATCH_SIZE):
+        """Results of /variants/exists/ for any number of keys, {'key', 'key_type', 'exists', 'variant', 'gene'}
+        in the order of the API, batched into POST requests."""
+        batches = []
+        for key_type, keys in (('cpra', list(cpras)), ('md5sum', list(md5sums))):
+            for start in range(0, len(keys), batch_size):
+                batches.append({key_type: keys[start:start + batch_size]})
+        results = []
+        for response in self._map_batches(batches):
+            results.extend(response['results'])
+        return results
+
+    def _map_batches(self, batches):
+        if len(batches) <= 1:
+            return [self.post('/variants/exists/', batch) for batch in batches]
+        return list(self._get_executor().map(lambda batch: self.post('/variants/exists/', batch), batches))
@@ -0,0 +1,10 @@
+from setuptools import setup
+
+setup(
+    name='crowdseq-client',
+    version='0.1.0',
+    description='Python client of the Crowdseq API',
+    packages=['crowdseq_client'],
+    python_requires='>=3.7',
+    install_requires=['requests>=2.25'],
+)